@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query
 from app.services import DrugDbEngine, DiseaseDbEngine
 from app.models import DrugConfirmRequest, DiseaseConfirmRequest
+from app.service.scrape_cache_service import ScrapeCacheService, SearchUrlCacheService
 
 router = APIRouter()
 drug_db = DrugDbEngine()
@@ -65,6 +66,33 @@ def delete_link(sdk: str, icd_code: str):
         return {"status": "success"}
     raise HTTPException(status_code=404, detail="Delete failed or Link not found")
 
+# --- WEB SCRAPE CACHE ---
+@router.get("/scrape-cache")
+def get_scrape_cache_stats():
+    """Thống kê cache kết quả web scrape (found / not_found / expired) + cache URL search engine."""
+    try:
+        stats = ScrapeCacheService(drug_db.db_core).stats()
+        search_urls = SearchUrlCacheService(drug_db.db_core).stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", **stats, "search_urls": search_urls}
+
+@router.delete("/scrape-cache")
+def invalidate_scrape_cache(keyword: str = None, expired_only: bool = False):
+    """
+    Invalidate cache web scrape:
+    - ?keyword=...: chỉ entry của keyword đó (so khớp sau khi normalize)
+    - ?expired_only=true: chỉ các entry đã hết hạn
+    - không tham số: xoá toàn bộ
+    Cache keyword -> URL (search engine) được xoá cùng điều kiện.
+    """
+    try:
+        deleted = ScrapeCacheService(drug_db.db_core).invalidate(keyword, expired_only=expired_only)
+        deleted_urls = SearchUrlCacheService(drug_db.db_core).invalidate(keyword, expired_only=expired_only)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "deleted": deleted, "deleted_search_urls": deleted_urls}
+
 # --- MONITORING ---
 @router.get("/monitor/stats")
 def get_monitor_stats(days: int = 1):
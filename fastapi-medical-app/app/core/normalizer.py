@@ -0,0 +1,111 @@
+"""
+Text Normalizer - Chuẩn hóa tên thuốc cho matching (một nguồn duy nhất)
+=======================================================================
+`normalize_for_matching` dùng chung cho app/core/utils.py (search, KB, ETL)
+và app/mapping_drugs (DrugMatcher, ClaimsMedicineMatchingService).
+
+Quy tắc (knowledge for agent/db_match_normalizer_rules.py):
+- Lowercase
+- Bỏ dấu tiếng Việt (NFKD, bỏ dấu kết hợp, đ -> d)
+- "/", ngoặc và mọi ký tự ngoài a-z, 0-9, khoảng trắng, -, +, %, . -> khoảng trắng
+- Gộp khoảng trắng, bỏ leading zeros (05ml -> 5ml, 03 -> 3)
+
+Hot path: bỏ dấu + lọc ký tự làm trong một lần `str.translate` với bảng
+tính sẵn theo từng ký tự (NFKD chỉ chạy một lần cho mỗi ký tự mới gặp),
+regex compile sẵn, kết quả cache LRU. `normalize_many` chuẩn hóa cả list
+bằng một lần translate/regex trên chuỗi ghép (benchmark:
+scripts/benchmark_normalizer.py).
+"""
+
+import os
+import re
+import string
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+NORMALIZER_CACHE_SIZE = int(os.getenv("NORMALIZER_CACHE_SIZE", "65536"))
+
+_ALLOWED = frozenset(string.ascii_lowercase + string.digits + "-+%.")
+_LEADING_ZEROS = re.compile(r'\b0+(\d+)(ml|mg|mcg|g|iu|ui|l|%)?\b', re.IGNORECASE)
+_SEP = "\x00"  # ranh giới giữa các text trong normalize_many (non-word: \b giữ nguyên)
+
+
+class _FoldTable(dict):
+    """str.translate table: codepoint (đã lowercase) -> chuỗi ASCII đã lọc, tính khi gặp lần đầu."""
+
+    def __missing__(self, codepoint: int) -> str:
+        out = []
+        for c in unicodedata.normalize('NFKD', chr(codepoint)):
+            if unicodedata.combining(c):
+                continue
+            if c == 'đ':
+                c = 'd'
+            out.append(c if c in _ALLOWED or c.isspace() else ' ')
+        value = self[codepoint] = "".join(out)
+        return value
+
+
+_FOLD = _FoldTable()
+_FOLD_BATCH = _FoldTable({ord(_SEP): _SEP})  # như _FOLD nhưng giữ ranh giới _SEP
+
+
+def _strip_leading_zeros(match: re.Match) -> str:
+    return (match.group(1).lstrip('0') or '0') + (match.group(2) or '')
+
+
+def _normalize(text: str, table: _FoldTable = _FOLD) -> str:
+    text = " ".join(text.lower().translate(table).split())
+    if '0' in text:
+        text = _LEADING_ZEROS.sub(_strip_leading_zeros, text)
+    return text
+
+
+@lru_cache(maxsize=NORMALIZER_CACHE_SIZE)
+def _normalize_cached(text: str) -> str:
+    return _normalize(text)
+
+
+def normalize_for_matching(text: Optional[str]) -> str:
+    """
+    Chuẩn hóa tên thuốc để fuzzy match trong DB.
+
+    Args:
+        text: Tên thuốc thô (raw drug name)
+
+    Returns:
+        Tên thuốc đã chuẩn hóa ("" nếu rỗng)
+    """
+    if not text:
+        return ""
+    return _normalize_cached(text)
+
+
+def normalize_many(texts: Iterable[Optional[str]]) -> List[str]:
+    """
+    `normalize_for_matching` cho cả list (cùng kết quả, cùng thứ tự).
+
+    Text trùng chỉ xử lý một lần; các text chưa gặp được ghép lại để
+    lower/translate/regex chạy một lần cho cả batch thay vì mỗi text.
+    """
+    texts = list(texts)
+    unique = {t: None for t in texts if t and _SEP not in t}
+    # Ghép riêng text ASCII: str.translate có fast path cho chuỗi thuần ASCII
+    ascii_keys = [t for t in unique if t.isascii()]
+    other_keys = [t for t in unique if not t.isascii()]
+    for keys in (ascii_keys, other_keys):
+        if not keys:
+            continue
+        folded = _normalize(_SEP.join(keys), _FOLD_BATCH).split(_SEP)
+        # split() đã gộp khoảng trắng quanh _SEP thành " " - strip lại từng phần
+        for key, value in zip(keys, folded):
+            unique[key] = value.strip(" ")
+    return [
+        unique[t] if t in unique else normalize_for_matching(t)
+        for t in texts
+    ]
+
+
+def cache_info():
+    """Thống kê LRU cache (hits, misses, maxsize, currsize)."""
+    return _normalize_cached.cache_info()
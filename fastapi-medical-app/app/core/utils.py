@@ -1,8 +1,9 @@
 import re
-import unicodedata
 import os
 import openpyxl
 
+from app.core.normalizer import normalize_for_matching, normalize_many  # noqa: F401 (re-export)
+
 UNIT = r'(mg|g|mcg|iu|ml|l)' # Expanded slightly for safety
 DOSE = rf'\d+(?:\.\d+)?\s*{UNIT}'
 SEP = r'\+|/|,|\band\b|\bva\b'
@@ -111,48 +112,7 @@ def load_allowed_chars():
 # Pre-load if possible (or lazy load)
 # load_allowed_chars()
 
-def normalize_for_matching(text: str) -> str:
-    """
-    [STEP 1] Chuẩn hóa tên thuốc cho bài toán fuzzy map (DB).
-    Follows: knowledge for agent/db_match_normalizer_rules.py
-    - Lowercase
-    - Remove Vietnamese accents (to clean ASCII)
-    - Keep: a-z, 0-9, space, -, +, %, .
-    - Remove others
-    - [NEW] Remove leading zeros from numbers (05ml -> 5ml)
-    """
-    if not text:
-        return ""
-
-    # 1. Lowercase
-    text = text.lower()
-
-    # 2. Handle Vietnamese accents
-    text = unicodedata.normalize('NFKD', text)
-    text = "".join([c for c in text if not unicodedata.combining(c)])
-    text = text.replace('đ', 'd')
-
-    # 3. Replace common separators
-    text = text.replace("/", " ")
-    text = re.sub(r'[\(\)\[\]]', ' ', text)
-
-    # 4. Filter allowed chars
-    # Allow: a-z, 0-9, space, -, +, %, .
-    text = re.sub(r'[^a-z0-9\s\-\+\%\.]', ' ', text)
-
-    # 5. Trim spaces
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # 6. [NEW] Remove leading zeros from numeric parts (05ml -> 5ml, 03 -> 3)
-    # Pattern: match standalone numbers or numbers with units
-    def strip_leading_zeros(match):
-        num = match.group(1).lstrip('0') or '0'  # Keep at least one '0' for just '0'
-        suffix = match.group(2) or ''
-        return num + suffix
-    
-    text = re.sub(r'\b0+(\d+)(ml|mg|mcg|g|iu|ui|l|%)?\b', strip_leading_zeros, text, flags=re.IGNORECASE)
-    
-    return text
+# [STEP 1] normalize_for_matching (fuzzy map DB): xem app/core/normalizer.py
 
 def normalize_for_search(text: str) -> str:
     """
@@ -180,3 +140,31 @@ def normalize_for_search(text: str) -> str:
             break
             
     return "".join(result).strip()
+
+# --- SỐ ĐĂNG KÝ (SDK) ---
+# VD-12345-12, VN-1234-56, VNB-1234-12, QLĐB-123-12, V1033-H12-10, VN1-123-12, 10066/QLD-KD...
+SDK_PATTERN = re.compile(
+    r'(?<![\w\-–/])([A-ZĐ]{1,4}\d{0,4}\s?[-–]\s?[A-Z]?\d{2,10}[-–]\d{1,2}|\d{3,6}/QLD-KD)(?![\w\-–])',
+    re.IGNORECASE
+)
+SDK_LABEL_PATTERN = re.compile(r'(?:SĐK|Số đăng ký|SDK|Reg\.No)[:\.]?\s*([A-Z0-9Đ\-–/]{5,20})', re.IGNORECASE)
+
+def normalize_sdk(sdk: str) -> str:
+    """Key so sánh SDK: bỏ khoảng trắng, upper-case, gạch ngang thống nhất ("vd – 123-12" -> "VD-123-12")."""
+    if not sdk:
+        return ""
+    return "".join(sdk.split()).upper().replace("–", "-").strip(":.")
+
+def extract_sdks(text: str) -> list:
+    """
+    Các số đăng ký xuất hiện trong một dòng text (đã normalize_sdk, theo thứ tự, không trùng).
+    Ưu tiên giá trị có nhãn ("SĐK: ..."), sau đó các chuỗi có dạng SDK.
+    """
+    if not text:
+        return []
+    found = []
+    for match in list(SDK_LABEL_PATTERN.finditer(text)) + list(SDK_PATTERN.finditer(text)):
+        sdk = normalize_sdk(match.group(1))
+        if sdk and sdk not in found:
+            found.append(sdk)
+    return found
@@ -1,13 +1,22 @@
 import sqlite3
 import os
 import time
-import gc
+import weakref
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from app.database.pool import ConnectionPool, POOL_ENABLED, get_pool
+
 DB_PATH = os.getenv("DB_PATH", "app/database/medical.db")
 DB_TYPE = os.getenv("DB_TYPE", "sqlite").lower()
 
+# Trigram substring index cho substring_search():
+# (table, column) -> FTS5 trigram table (SQLite) / GIN gin_trgm_ops index (Postgres)
+TRIGRAM_INDEXES = {
+    ("drugs", "ten_thuoc"): "drugs_trgm",
+    ("knowledge_base", "drug_name_norm"): "knowledge_base_trgm",
+}
+
 # Postgres Config
 PG_USER = os.getenv("POSTGRES_USER", "postgres")
 PG_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
@@ -21,10 +30,101 @@ def dict_factory(cursor, row):
         d[col[0]] = row[idx]
     return d
 
+
+class _PooledSqliteCursor(sqlite3.Cursor):
+    """Cursor that keeps its pooled connection wrapper alive while in use."""
+    _owner = None
+
+
+class SqliteConnectionWrapper:
+    """
+    Pooled SQLite connection with the same surface as sqlite3.Connection.
+    close() returns the physical connection to the pool instead of closing it.
+    """
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self.conn = entry.raw
+        self._cursors = weakref.WeakSet()
+
+    def _raw(self):
+        if self.conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return self.conn
+
+    @property
+    def row_factory(self):
+        return self._raw().row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._raw().row_factory = factory
+
+    def cursor(self, factory=None):
+        cur = self._raw().cursor(factory or _PooledSqliteCursor)
+        if isinstance(cur, _PooledSqliteCursor):
+            cur._owner = self
+        self._cursors.add(cur)
+        return cur
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self._raw().commit()
+
+    def rollback(self):
+        self._raw().rollback()
+
+    def close(self):
+        entry, self._entry = self._entry, None
+        if entry is None:
+            return
+        # The physical connection now belongs to the pool (and soon another caller):
+        # drop our reference so use-after-close raises instead of running on it
+        self.conn = None
+        # Finalize open statements so no read lock is held while idle in the pool
+        for cur in list(self._cursors):
+            try:
+                cur.close()
+            except Exception:
+                pass
+        self._pool.release(entry)
+
+    def __del__(self):
+        # Safety net for code paths that forget close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # sqlite3.Connection semantics: `with conn:` wraps a transaction
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get("conn")
+        if conn is None:
+            if name.startswith("__"):
+                raise AttributeError(name)
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
 class DatabaseCore:
     def __init__(self, db_path=DB_PATH):
         self.db_type = DB_TYPE
         self.db_path = db_path # Kept for SQLite fallback
+        self.trigram_tables = {}  # (table, column) -> index name, filled by schema init
         
         print(f"[DB Core] Initializing Database Mode: {self.db_type.upper()}")
 
@@ -115,20 +215,44 @@ class DatabaseCore:
             self.close()
 
     class PostgresConnectionWrapper:
-        def __init__(self, conn):
+        def __init__(self, conn, pool=None, entry=None):
             self.conn = conn
+            self._pool = pool
+            self._entry = entry
+
+        def _raw(self):
+            if self.conn is None:
+                raise psycopg2.InterfaceError("connection already closed")
+            return self.conn
 
         def cursor(self):
-            return DatabaseCore.PostgresCursorWrapper(self.conn.cursor())
+            wrapper = DatabaseCore.PostgresCursorWrapper(self._raw().cursor())
+            wrapper._owner = self  # keep pooled connection checked out while cursor lives
+            return wrapper
 
         def commit(self):
-            self.conn.commit()
+            self._raw().commit()
             
         def rollback(self):
-            self.conn.rollback()
+            self._raw().rollback()
 
         def close(self):
-            self.conn.close()
+            if self._pool is None:
+                if self.conn is not None:
+                    self.conn.close()
+                return
+            entry, self._entry = self._entry, None
+            if entry is not None:
+                # Connection về pool (có thể đã giao cho caller khác) -> bỏ tham chiếu
+                self.conn = None
+                self._pool.release(entry)
+
+        def __del__(self):
+            if self._pool is not None:
+                try:
+                    self.close()
+                except Exception:
+                    pass
             
         def __enter__(self):
             return self
@@ -138,42 +262,128 @@ class DatabaseCore:
 
         # Proxy other attrs
         def __getattr__(self, name):
-            return getattr(self.conn, name)
+            conn = self.__dict__.get("conn")
+            if conn is None:
+                if name.startswith("__"):
+                    raise AttributeError(name)
+                raise psycopg2.InterfaceError("connection already closed")
+            return getattr(conn, name)
 
-    def get_connection(self):
+    # =========================================================================
+    # CONNECTIONS (POOLED)
+    # =========================================================================
+    def database_key(self):
+        """Stable identity of the target database (shared pools / indexes are keyed on it)."""
         if self.db_type == 'postgres':
-            # Postgres Connection
-            try:
-                conn = psycopg2.connect(
-                    user=PG_USER,
-                    password=PG_PASSWORD,
-                    dbname=PG_DB,
-                    host=PG_HOST,
-                    port=PG_PORT,
-                    cursor_factory=RealDictCursor
-                )
-                conn.autocommit = False 
-                # Wrap it!
-                return self.PostgresConnectionWrapper(conn)
-            except Exception as e:
-                print(f"[DB Connection Error] {e}")
-                raise
+            return f"postgres://{PG_USER}@{PG_HOST}:{PG_PORT}/{PG_DB}"
+        return f"sqlite:{os.path.abspath(self.db_path)}"
+
+    def _get_pool(self):
+        """Shared pool for this database, or None when pooling is disabled."""
+        if not POOL_ENABLED:
+            return None
+        if self.db_type != 'postgres' and self.db_path == ':memory:':
+            return None  # Each :memory: connection is its own database
+        return get_pool(self.database_key(), self._build_pool)
+
+    def _build_pool(self):
+        if self.db_type == 'postgres':
+            return ConnectionPool(
+                name=self.database_key(),
+                connect=lambda: (self._connect_postgres(), None),
+                ping=_ping_postgres,
+                reset=_reset_postgres,
+                is_stale=lambda raw, meta: bool(raw.closed),
+            )
+        db_path = self.db_path
+        return ConnectionPool(
+            name=self.database_key(),
+            connect=lambda: (self._connect_sqlite(), _file_id(db_path)),
+            ping=_ping_sqlite,
+            reset=_reset_sqlite,
+            # DB file replaced on disk (upload/restore) -> reconnect
+            is_stale=lambda raw, meta: _file_id(db_path) != meta,
+        )
+
+    def pool_stats(self):
+        """Pool metrics for this database (None if pooling is disabled)."""
+        pool = self._get_pool()
+        return pool.stats() if pool else None
+
+    # =========================================================================
+    # SUBSTRING SEARCH (TRIGRAM INDEX)
+    # =========================================================================
+    def substring_search(self, cursor, table, column, needle, where="", params=(), distinct=False, limit=1):
+        """
+        Ranked "contains" search (case-insensitive) thay cho `LIKE '%x%'` scan.
+        Chạy trên `cursor` của caller; đọc kết quả bằng cursor.fetchone()/fetchall().
+
+        Rank: giá trị ngắn nhất trước (needle phủ nhiều nhất), rồi tới id (hoặc giá trị
+        khi `distinct=True`, trả về một cột `column` duy nhất).
+        SQLite dùng bảng FTS5 trigram, Postgres dùng index GIN pg_trgm cho ILIKE;
+        không có index thì fallback về LIKE scan (cùng kết quả, chậm hơn).
+        `where` chỉ được tham chiếu cột của `table`.
+        """
+        col = f"{table}.{column}"
+        fts = self.trigram_tables.get((table, column)) if self.db_type != 'postgres' else None
+        if fts:
+            source = f"{fts} JOIN {table} ON {table}.id = {fts}.rowid"
+            cond = f"{fts}.{column} LIKE ?"
         else:
-            # SQLite Connection
-            for attempt in range(5):
-                try:
-                    gc.collect() 
-                    conn = sqlite3.connect(self.db_path, timeout=60.0)
-                    conn.execute("PRAGMA journal_mode=DELETE;")
-                    conn.row_factory = dict_factory
-                    return conn
-                except Exception:
-                    time.sleep(1)
-            
-            conn = sqlite3.connect(self.db_path, timeout=60.0)
-            conn.execute("PRAGMA journal_mode=DELETE;")
-            conn.row_factory = dict_factory
+            op = "ILIKE" if self.db_type == 'postgres' else "LIKE"
+            source = table
+            cond = f"{col} {op} ?"
+        if where:
+            cond += f" AND ({where})"
+
+        if distinct:
+            sql = f"SELECT {col} FROM {source} WHERE {cond} GROUP BY {col} ORDER BY LENGTH({col}), {col} LIMIT ?"
+        else:
+            sql = f"SELECT {table}.* FROM {source} WHERE {cond} ORDER BY LENGTH({col}), {table}.id LIMIT ?"
+        cursor.execute(sql, (f"%{needle}%", *params, limit))
+
+    def _connect_postgres(self):
+        try:
+            conn = psycopg2.connect(
+                user=PG_USER,
+                password=PG_PASSWORD,
+                dbname=PG_DB,
+                host=PG_HOST,
+                port=PG_PORT,
+                cursor_factory=RealDictCursor
+            )
+            conn.autocommit = False 
             return conn
+        except Exception as e:
+            print(f"[DB Connection Error] {e}")
+            raise
+
+    def _connect_sqlite(self):
+        for attempt in range(5):
+            try:
+                return self._open_sqlite()
+            except Exception:
+                time.sleep(1)
+        return self._open_sqlite()
+
+    def _open_sqlite(self):
+        conn = sqlite3.connect(self.db_path, timeout=60.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=DELETE;")
+        conn.row_factory = dict_factory
+        return conn
+
+    def get_connection(self):
+        pool = self._get_pool()
+        if pool is not None:
+            entry = pool.acquire()
+            if self.db_type == 'postgres':
+                return self.PostgresConnectionWrapper(entry.raw, pool=pool, entry=entry)
+            return SqliteConnectionWrapper(pool, entry)
+
+        if self.db_type == 'postgres':
+            # Wrap it!
+            return self.PostgresConnectionWrapper(self._connect_postgres())
+        return self._connect_sqlite()
 
     # =========================================================================
     # POSTGRES SCHEMAS
@@ -206,6 +416,8 @@ class DatabaseCore:
                 """)
                 # GIN Index for FTS
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_drugs_search_vector ON drugs USING GIN(search_vector)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_drugs_ten_thuoc ON drugs(ten_thuoc)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_drugs_so_dang_ky ON drugs(so_dang_ky)")
                 
                 # Trigger to update search_vector (simple concatenation of fields)
                 # Note: Using 'simple' config or 'vietnamese' if available, defaulting to 'simple' for wide compat
@@ -233,6 +445,43 @@ class DatabaseCore:
                     $$;
                 """)
 
+                # 0a. Drug change feed (đọc bởi DrugIndexService để cập nhật index tăng dần)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS drug_changes (
+                        id SERIAL PRIMARY KEY,
+                        drug_id INTEGER,
+                        op TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
+                # 0a2. Cache kết quả web scrape (ScrapeCacheService), key = keyword đã normalize_for_search
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS web_scrape_cache (
+                        keyword_norm TEXT PRIMARY KEY,
+                        keyword TEXT,
+                        status TEXT,
+                        result TEXT,
+                        candidates TEXT,
+                        source_urls TEXT,
+                        scraped_at DOUBLE PRECISION,
+                        expires_at DOUBLE PRECISION
+                    )
+                """)
+
+                # 0a3. Cache keyword -> URL trang chi tiết từ search engine (SearchUrlCacheService)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS search_url_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        domain TEXT,
+                        keyword_norm TEXT,
+                        keyword TEXT,
+                        url TEXT,
+                        searched_at DOUBLE PRECISION,
+                        expires_at DOUBLE PRECISION
+                    )
+                """)
+
                 # 0b. Diseases Table
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS diseases (
@@ -401,6 +650,9 @@ class DatabaseCore:
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_kb_type ON knowledge_base(treatment_type)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_kb_icd ON knowledge_base(disease_icd)")
 
+                # 8. Trigram indexes (pg_trgm) cho substring_search
+                self._ensure_trigram_postgres(cursor)
+
             conn.commit()
         except Exception as e:
             conn.rollback()
@@ -435,8 +687,47 @@ class DatabaseCore:
                     note TEXT
                 )
             """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_drugs_ten_thuoc ON drugs(ten_thuoc)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_drugs_so_dang_ky ON drugs(so_dang_ky)")
             cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS drugs_fts USING fts5(ten_thuoc, hoat_chat, cong_ty_san_xuat, search_text)")
 
+            # Drug change feed (đọc bởi DrugIndexService để cập nhật index tăng dần)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS drug_changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    drug_id INTEGER,
+                    op TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Cache kết quả web scrape (ScrapeCacheService), key = keyword đã normalize_for_search
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS web_scrape_cache (
+                    keyword_norm TEXT PRIMARY KEY,
+                    keyword TEXT,
+                    status TEXT,
+                    result TEXT,
+                    candidates TEXT,
+                    source_urls TEXT,
+                    scraped_at REAL,
+                    expires_at REAL
+                )
+            """)
+
+            # Cache keyword -> URL trang chi tiết từ search engine (SearchUrlCacheService)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS search_url_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    domain TEXT,
+                    keyword_norm TEXT,
+                    keyword TEXT,
+                    url TEXT,
+                    searched_at REAL,
+                    expires_at REAL
+                )
+            """)
+
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS diseases (
                     id TEXT PRIMARY KEY,
@@ -540,6 +831,8 @@ class DatabaseCore:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_kb_icd ON knowledge_base(disease_icd)")
             
             self._migrate_kb_table(cursor)
+
+            self._ensure_trigram_sqlite(cursor)
                 
             conn.commit()
         except sqlite3.Error as e:
@@ -548,6 +841,62 @@ class DatabaseCore:
         finally:
             conn.close()
 
+    def _ensure_trigram_postgres(self, cursor):
+        # Savepoint: thiếu quyền CREATE EXTENSION không được làm hỏng cả transaction init
+        cursor.execute("SAVEPOINT trigram_init")
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            indexes = {}
+            for (table, column) in TRIGRAM_INDEXES:
+                name = f"idx_{table}_{column}_trgm"
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING GIN ({column} gin_trgm_ops)")
+                indexes[(table, column)] = name
+            cursor.execute("RELEASE SAVEPOINT trigram_init")
+            self.trigram_tables = indexes
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT trigram_init")
+            print(f"[DB Core Warning] pg_trgm unavailable, substring search uses ILIKE scans: {e}")
+
+    def _ensure_trigram_sqlite(self, cursor):
+        """
+        FTS5 trigram tables (external content trên bảng gốc) giữ đồng bộ bằng trigger,
+        nên mọi write path (kể cả script) đều được index. Rebuild khi số dòng lệch
+        (vd: bảng gốc bị tạo lại bởi script import).
+        """
+        for (table, column), fts in TRIGRAM_INDEXES.items():
+            try:
+                cursor.execute(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {fts}
+                    USING fts5({column}, content='{table}', content_rowid='id', tokenize='trigram')
+                """)
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                        INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});
+                    END
+                """)
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                        INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                    END
+                """)
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN
+                        INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                        INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});
+                    END
+                """)
+
+                cursor.execute(f"SELECT COUNT(*) AS n FROM {table}")
+                n_rows = cursor.fetchone()['n']
+                cursor.execute(f"SELECT COUNT(*) AS n FROM {fts}_docsize")
+                n_indexed = cursor.fetchone()['n']
+                if n_rows != n_indexed:
+                    print(f"[DB Core] Rebuilding trigram index {fts} ({n_indexed} -> {n_rows} rows)")
+                    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+                self.trigram_tables[(table, column)] = fts
+            except sqlite3.Error as e:
+                print(f"[DB Core Warning] Trigram index {fts} unavailable, substring search uses LIKE scans: {e}")
+
     def _migrate_drugs_table(self, cursor):
         cursor.execute("PRAGMA table_info(drugs)")
         columns = [info['name'] for info in cursor.fetchall()]
@@ -586,3 +935,42 @@ class DatabaseCore:
             if col not in cols:
                 try: cursor.execute(f"ALTER TABLE knowledge_base ADD COLUMN {col} {dtype}")
                 except Exception: pass
+
+
+# =========================================================================
+# POOL HOOKS
+# =========================================================================
+def _file_id(path):
+    try:
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino)
+    except OSError:
+        return None
+
+
+def _ping_sqlite(conn):
+    conn.execute("SELECT 1").fetchone()
+
+
+def _reset_sqlite(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    conn.row_factory = dict_factory
+
+
+def _ping_postgres(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1")
+        cur.fetchone()
+    finally:
+        cur.close()
+    conn.rollback()
+
+
+def _reset_postgres(conn):
+    if conn.closed:
+        raise RuntimeError("connection closed")
+    conn.rollback()
+    if conn.autocommit:
+        conn.autocommit = False
@@ -0,0 +1,296 @@
+"""
+Connection Pool - Process-wide pooled connections for DatabaseCore
+===================================================================
+Một pool dùng chung cho mỗi database (SQLite file hoặc Postgres DSN), thay vì
+mở/đóng connection mới ở mỗi lần gọi `DatabaseCore.get_connection()`.
+
+- Bounded: tối đa `max_size` connection, chờ tối đa `timeout` giây khi hết.
+- Health check: kiểm tra khi checkout (ping định kỳ, recycle theo tuổi).
+- Metrics: `ConnectionPool.stats()` / `get_pool_stats()`.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+POOL_ENABLED = os.getenv("DB_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))           # seconds to wait for a free connection
+POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "3600"))         # max connection age in seconds
+POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))  # ping idle connections older than this
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class _PooledConnection:
+    """Bookkeeping for one physical connection owned by the pool."""
+    __slots__ = ("raw", "created_at", "last_used", "meta")
+
+    def __init__(self, raw, meta=None):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+        self.meta = meta
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections.
+
+    Args:
+        name: Tên hiển thị trong metrics (vd: "sqlite:/app/app/database/medical.db").
+        connect: Hàm tạo connection vật lý mới, trả về (raw_conn, meta).
+        ping: Hàm kiểm tra connection còn sống (raise nếu hỏng).
+        reset: Hàm dọn trạng thái trước khi trả connection về pool (raise nếu hỏng).
+        is_stale: Hàm tuỳ chọn, True nếu connection cần bỏ (vd: file SQLite bị thay).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        connect: Callable[[], Any],
+        ping: Callable[[Any], None],
+        reset: Callable[[Any], None],
+        is_stale: Optional[Callable[[Any, Any], bool]] = None,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        recycle: float = POOL_RECYCLE,
+        ping_interval: float = POOL_PING_INTERVAL,
+    ):
+        self.name = name
+        self._connect = connect
+        self._ping = ping
+        self._reset = reset
+        self._is_stale = is_stale
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+
+        self._idle = deque()
+        self._size = 0  # physical connections alive (idle + checked out)
+        self._cond = threading.Condition(threading.Lock())
+        self._pid = os.getpid()
+
+        self._metrics = {
+            "checkouts": 0,
+            "returns": 0,
+            "created": 0,
+            "discarded": 0,
+            "health_check_failures": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_time_ms_total": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Checkout / Return
+    # ------------------------------------------------------------------
+    def acquire(self) -> _PooledConnection:
+        """Checkout a healthy connection, creating one if under `max_size`."""
+        self._check_fork()
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_start = time.monotonic()
+
+        while True:
+            entry = None
+            create = False
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"[DB Pool] {self.name}: no connection available after {self.timeout}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    entry = self._idle.pop()  # LIFO: reuse the warmest connection
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    entry = self._create()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(entry):
+                self._discard(entry)
+                continue
+
+            with self._cond:
+                self._metrics["checkouts"] += 1
+                if waited:
+                    self._metrics["waits"] += 1
+                    self._metrics["wait_time_ms_total"] += (time.monotonic() - wait_start) * 1000
+            return entry
+
+    def release(self, entry: _PooledConnection, discard: bool = False) -> None:
+        """Return a connection to the pool (or close it if broken/expired)."""
+        if self._pid != os.getpid():
+            # Connection belongs to the parent process; never reuse or close it here.
+            return
+
+        if not discard:
+            try:
+                self._reset(entry.raw)
+            except Exception as e:
+                print(f"[DB Pool] {self.name}: reset failed, discarding connection: {e}")
+                discard = True
+
+        if not discard and self.recycle and time.monotonic() - entry.created_at > self.recycle:
+            discard = True
+
+        if discard:
+            self._discard(entry)
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(entry)
+            self._metrics["returns"] += 1
+            self._cond.notify()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _create(self) -> _PooledConnection:
+        raw, meta = self._connect()
+        with self._cond:
+            self._metrics["created"] += 1
+        return _PooledConnection(raw, meta)
+
+    def _discard(self, entry: _PooledConnection) -> None:
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._metrics["discarded"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, entry: _PooledConnection) -> bool:
+        now = time.monotonic()
+        if self.recycle and now - entry.created_at > self.recycle:
+            return False
+        if self._is_stale and self._is_stale(entry.raw, entry.meta):
+            return False
+        if now - entry.last_used < self.ping_interval:
+            return True
+        try:
+            self._ping(entry.raw)
+            return True
+        except Exception as e:
+            with self._cond:
+                self._metrics["health_check_failures"] += 1
+            print(f"[DB Pool] {self.name}: health check failed: {e}")
+            return False
+
+    def _check_fork(self) -> None:
+        """After fork, drop inherited connections without closing the parent's sockets."""
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        with self._cond:
+            if pid != self._pid:
+                self._idle = deque()
+                self._size = 0
+                self._pid = pid
+
+    # ------------------------------------------------------------------
+    # Maintenance & Metrics
+    # ------------------------------------------------------------------
+    def warm_up(self) -> None:
+        """Pre-open up to `min_size` connections."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size or self._size >= self.max_size:
+                    return
+                self._size += 1
+            try:
+                entry = self._create()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                print(f"[DB Pool] {self.name}: warm-up failed: {e}")
+                return
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def close_all(self) -> None:
+        """Close all idle connections. Checked-out connections are closed on return."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            idle = len(self._idle)
+            data = dict(self._metrics)
+            data.update({
+                "name": self.name,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        data["wait_time_ms_total"] = round(data["wait_time_ms_total"], 2)
+        return data
+
+
+# ----------------------------------------------------------------------
+# Process-wide registry (one pool per database)
+# ----------------------------------------------------------------------
+_POOLS: Dict[str, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(key: str, factory: Callable[[], ConnectionPool]) -> ConnectionPool:
+    """Return the shared pool for `key`, creating it with `factory()` on first use."""
+    pool = _POOLS.get(key)
+    if pool is not None:
+        return pool
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = factory()
+            pool.warm_up()
+            _POOLS[key] = pool
+            print(f"[DB Pool] Created pool '{pool.name}' (min={pool.min_size}, max={pool.max_size})")
+    return pool
+
+
+def get_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every pool in this process."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.items())
+    return {key: pool.stats() for key, pool in pools}
+
+
+def close_all_pools() -> None:
+    """Close idle connections of every pool (shutdown / tests)."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close_all()
@@ -61,12 +61,25 @@ async def startup_event():
     # cleans app/monitor/*.log
     clean_old_logs(retention_days=3)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Release pooled DB connections
+    from app.database.pool import close_all_pools
+    close_all_pools()
+
+    # Close warm crawler browsers + HTTP fast-tier client
+    from app.service.crawler.browser_pool import browser_pool
+    await browser_pool.close()
+    from app.service.crawler.http_fetch import http_fetcher
+    await http_fetcher.close()
+
 @app.get("/api/v1/health")
 def health_check():
     """Health check endpoint for monitoring and load balancers."""
     from app.database.core import DatabaseCore
     
     db_status = "ok"
+    db_pool = None
     try:
         # Use DatabaseCore to support both SQLite and Postgres
         core = DatabaseCore()
@@ -74,6 +87,7 @@ def health_check():
         cursor = conn.cursor()
         cursor.execute("SELECT 1")
         conn.close()
+        db_pool = core.pool_stats()
     except Exception as e:
         db_status = f"error: {str(e)}"
     
@@ -81,6 +95,7 @@ def health_check():
         "status": "healthy",
         "version": "1.0.0",
         "database": db_status,
+        "db_pool": db_pool,
         "services": {
             "drug_search": "available",
             "consultation": "available",
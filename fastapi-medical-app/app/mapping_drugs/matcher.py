@@ -1,11 +1,13 @@
 """
 Drug Matcher Module - Multistage Drug Matching Engine
 ======================================================
-Standalone implementation với 4 tầng matching:
-1. Exact Match (100%)
+Standalone implementation với các tầng matching (theo thứ tự thử):
+1. Exact Match (100%) - số đăng ký (sdk), tên gốc, tên đã normalize
+1b. Composition Match (97%) - hoạt chất + hàm lượng
 2. Partial/LIKE Match (95%)
 3. RapidFuzz Token Sort (88%)
 4. TF-IDF Vector Search (90%)
+5. BM25 Okapi (85%)
 """
 
 import os
@@ -15,6 +17,10 @@ from datetime import datetime
 import numpy as np
 
 from .normalizer import normalize_for_matching
+from app.core.utils import extract_sdks
+from app.service.drug_index_service import project_row, tokenize
+from app.service.fuzzy_blocking import extract, extract_one
+from app.service.result_cache import MISS
 
 # Setup logging
 logger = logging.getLogger("mapping_drugs.matcher")
@@ -42,7 +48,6 @@ if not logger.handlers:
 # Lazy imports để tránh lỗi khi chưa cài thư viện
 _rapidfuzz_available = False
 _sklearn_available = False
-_bm25_available = False
 
 try:
     from rapidfuzz import process, fuzz
@@ -53,16 +58,11 @@ except ImportError:
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
     from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.preprocessing import normalize as sk_normalize
     _sklearn_available = True
 except ImportError:
     pass
 
-try:
-    from rank_bm25 import BM25Okapi
-    _bm25_available = True
-except ImportError:
-    pass
-
 
 class DrugMatcher:
     """
@@ -79,6 +79,12 @@ class DrugMatcher:
     # Thresholds
     FUZZY_THRESHOLD = 85.0       # RapidFuzz score >= 85
     VECTOR_THRESHOLD = 0.75      # Cosine similarity > 0.75
+    BM25_THRESHOLD = 5.0         # BM25 score > 5
+    CANDIDATE_FUZZY_CUTOFF = 60.0  # candidates(): RapidFuzz score tối thiểu để vào danh sách
+    # SDK trước: dòng có số đăng ký ("Augmentin 625mg VN-12345-22") dừng cascade ngay
+    EXACT_STEPS = ("EXACT_MATCH (sdk)", "EXACT_MATCH", "EXACT_MATCH (normalized)")
+    COMPOSITION_CONFIDENCE = 0.97  # "Amoxicillin 500mg + Clavulanic 125mg" khớp đúng hoat_chat
+    BATCH_CHUNK = 64             # match_batch: số query mỗi lần cdist / nhân sparse (giới hạn RAM)
     
     def __init__(self, db_core: Any = None):
         """
@@ -95,66 +101,84 @@ class DrugMatcher:
         else:
             self.db_core = DatabaseCore()
         
-        # Cache for fuzzy/vector/bm25 search
-        self.vectorizer = None
-        self.tfidf_matrix = None
-        self.bm25_index = None  # BM25 index
-        self.bm25_corpus = []   # Tokenized corpus for BM25
-        self.drug_cache: List[Dict] = []
-        self.fuzzy_names: List[str] = []
+        # Shared process-wide index (corpus, TF-IDF, BM25) - see drug_index_service
+        from app.service.drug_index_service import get_drug_index
+        self.index = get_drug_index(self.db_core)
+        # Kết quả match theo (tên normalized, tên gốc), xoá khi index đổi version
+        self.result_cache = self.index.result_cache("drug_matcher")
         
         # Load cache on init
         self._load_cache()
     
     def _load_cache(self) -> None:
-        """Load drugs vào RAM cho fuzzy/vector/bm25 search."""
+        """Đảm bảo shared drug index đã được load vào RAM."""
+        corpus = self.index.drugs()
+        print(f"[DrugMatcher] Using shared drug index: {len(corpus)} drugs (version {corpus.version})")
+    
+    # Read-only views on the current index snapshot (backward compatible attributes)
+    @property
+    def drug_cache(self) -> List[Dict]:
+        return self.index.drugs().rows
+    
+    @property
+    def fuzzy_names(self) -> List[str]:
+        return self.index.drugs().names
+    
+    @property
+    def vectorizer(self):
+        return self.index.drugs().vectorizer
+    
+    @property
+    def tfidf_matrix(self):
+        return self.index.drugs().tfidf_matrix
+    
+    @property
+    def bm25_index(self):
+        return self.index.drugs().bm25_index
+    
+    @property
+    def bm25_corpus(self) -> List[List[str]]:
+        return self.index.drugs().bm25_corpus
+    
+    def drug_details(self, drug_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Cột ngoài PROJECTED_FIELDS của `result['data']` (note, cong_ty_san_xuat...), đọc DB theo id."""
+        return self.index.drug_details(drug_id, columns)
+    
+    def match(self, drug_name: str) -> Dict[str, Any]:
+        """
+        Tìm thuốc trong DB (xem `_match_uncached`), qua result cache: tên đã
+        gặp ở cùng version của drug index trả kết quả ngay, không chạy cascade.
+        """
+        if not drug_name or not drug_name.strip():
+            return self._match_uncached(drug_name)
         
-        conn = self.db_core.get_connection()
-        # conn.row_factory = sqlite3.Row # Handled by Core
-        cursor = conn.cursor()
+        key = self._cache_key(drug_name)
+        version = self.index.drugs().version
+        cached = self.result_cache.get(key, version)
+        if cached is not MISS:
+            logger.info(f"[MATCH] Cache hit: '{key[1]}' -> {cached['method']}")
+            return cached
         
-        try:
-            # Chỉ lấy thuốc đã verified có SDK
-            cursor.execute("""
-                SELECT id, ten_thuoc, so_dang_ky, hoat_chat, search_text 
-                FROM drugs 
-                WHERE is_verified=1 AND so_dang_ky IS NOT NULL AND so_dang_ky != ''
-            """)
-            rows = cursor.fetchall()
-            self.drug_cache = [dict(row) for row in rows]
-            
-            if self.drug_cache:
-                # Build fuzzy names list
-                self.fuzzy_names = [d['ten_thuoc'] for d in self.drug_cache]
-                
-                # Build corpus for vectorizers
-                corpus = [d['search_text'] or d['ten_thuoc'] for d in self.drug_cache]
-                
-                # Build TF-IDF matrix nếu sklearn available
-                if _sklearn_available:
-                    self.vectorizer = TfidfVectorizer(token_pattern=r"(?u)\b\w+\b")
-                    self.tfidf_matrix = self.vectorizer.fit_transform(corpus)
-                
-                # Build BM25 index nếu rank_bm25 available
-                if _bm25_available:
-                    # Tokenize corpus for BM25
-                    self.bm25_corpus = [doc.lower().split() for doc in corpus]
-                    self.bm25_index = BM25Okapi(self.bm25_corpus)
-                    logger.info(f"[DrugMatcher] BM25 index built with {len(self.bm25_corpus)} documents")
-                
-                print(f"[DrugMatcher] Loaded {len(self.drug_cache)} drugs into cache")
-        except Exception as e:
-            print(f"[DrugMatcher] Cache load error: {e}")
-        finally:
-            conn.close()
+        result = self._match_uncached(drug_name)
+        self._remember(key, version, result)
+        return result
     
-    def match(self, drug_name: str) -> Dict[str, Any]:
+    def _cache_key(self, drug_name: str) -> tuple:
+        # Level 1/3 còn dùng tên gốc (exact raw, RapidFuzz) nên key gồm cả hai
+        return (normalize_for_matching(drug_name), drug_name.strip())
+    
+    def _remember(self, key: tuple, version: int, result: Dict[str, Any]) -> None:
+        self.result_cache.put(key, version, result, negative=result["status"] != "FOUND")
+    
+    def _match_uncached(self, drug_name: str) -> Dict[str, Any]:
         """
         Tìm thuốc trong DB theo thứ tự ưu tiên:
-        1. Exact Match (100%)
+        1. Exact Match (100%) - số đăng ký trong dòng, tên gốc, tên normalize
+        1b. Composition Match - hoạt chất + hàm lượng (97%)
         2. Partial/LIKE Match (95%)
         3. RapidFuzz (88%)
         4. TF-IDF Vector (90%)
+        5. BM25 (85%)
         
         Args:
             drug_name: Tên thuốc cần tìm
@@ -178,29 +202,31 @@ class DrugMatcher:
         logger.info(f"[MATCH] Input: '{raw_query}'")
         logger.info(f"[MATCH] Normalized: '{normalized}'")
         
+        # One snapshot for the whole cascade (indexes stay consistent if a refresh happens)
+        corpus = self.index.drugs()
+        
         conn = self.db_core.get_connection()
         cursor = conn.cursor()
         
         try:
-            # === LEVEL 1: EXACT MATCH ===
-            logger.debug(f"[MATCH] Step 1: Trying EXACT MATCH with '{raw_query}'")
-            result = self._exact_match(cursor, raw_query)
-            if result:
-                matched_name = result['data'].get('ten_thuoc', 'N/A')
-                logger.info(f"[MATCH] ✅ FOUND at Step 1 (EXACT): '{matched_name}'")
-                return result
-            logger.debug(f"[MATCH] Step 1: No exact match for '{raw_query}'")
-            
-            # Try với normalized
-            if normalized != raw_query.lower():
-                logger.debug(f"[MATCH] Step 1b: Trying EXACT MATCH with normalized '{normalized}'")
-                result = self._exact_match(cursor, normalized)
+            # === LEVEL 1: EXACT MATCH (in-memory hash map, SQL chỉ khi hit) ===
+            exact = corpus.exact_index(normalize_for_matching)
+            for method in self.EXACT_STEPS:
+                logger.debug(f"[MATCH] Step 1: Trying {method}")
+                pos = self._exact_lookup(exact, method, raw_query, normalized)
+                result = self._exact_match(corpus, pos, method)
                 if result:
-                    result["method"] = "EXACT_MATCH (normalized)"
                     matched_name = result['data'].get('ten_thuoc', 'N/A')
-                    logger.info(f"[MATCH] ✅ FOUND at Step 1b (EXACT normalized): '{matched_name}'")
+                    logger.info(f"[MATCH] ✅ FOUND at Step 1 ({method}): '{matched_name}'")
                     return result
-                logger.debug(f"[MATCH] Step 1b: No exact match for normalized")
+            logger.debug(f"[MATCH] Step 1: No exact match for '{raw_query}'")
+            
+            # === LEVEL 1b: COMPOSITION MATCH (hoạt chất + hàm lượng, hash lookup) ===
+            result = self._composition_match(corpus, corpus.composition_index().lookup(raw_query, corpus.ingredients))
+            if result:
+                matched_name = result['data'].get('ten_thuoc', 'N/A')
+                logger.info(f"[MATCH] ✅ FOUND at Step 1b (COMPOSITION): '{matched_name}'")
+                return result
             
             # === LEVEL 2: PARTIAL/LIKE MATCH ===
             logger.debug(f"[MATCH] Step 2: Trying PARTIAL MATCH with '{normalized}'")
@@ -212,9 +238,9 @@ class DrugMatcher:
             logger.debug(f"[MATCH] Step 2: No partial match")
             
             # === LEVEL 3: RAPIDFUZZ ===
-            if _rapidfuzz_available and self.drug_cache:
+            if _rapidfuzz_available and len(corpus):
                 logger.debug(f"[MATCH] Step 3: Trying FUZZY MATCH with '{raw_query}'")
-                result = self._fuzzy_match(cursor, raw_query)
+                result = self._fuzzy_match(raw_query, corpus)
                 if result:
                     matched_name = result['data'].get('ten_thuoc', 'N/A')
                     logger.info(f"[MATCH] ✅ FOUND at Step 3 (FUZZY): '{matched_name}' - {result['method']}")
@@ -224,9 +250,9 @@ class DrugMatcher:
                 logger.debug(f"[MATCH] Step 3: Skipped (rapidfuzz not available or cache empty)")
             
             # === LEVEL 4: TF-IDF VECTOR ===
-            if _sklearn_available and self.vectorizer and self.tfidf_matrix is not None:
+            if _sklearn_available and corpus.vectorizer and corpus.tfidf_matrix is not None:
                 logger.debug(f"[MATCH] Step 4: Trying VECTOR MATCH with '{normalized}'")
-                result = self._vector_match(cursor, normalized)
+                result = self._vector_match(normalized, corpus)
                 if result:
                     matched_name = result['data'].get('ten_thuoc', 'N/A')
                     logger.info(f"[MATCH] ✅ FOUND at Step 4 (VECTOR): '{matched_name}' - {result['method']}")
@@ -236,16 +262,16 @@ class DrugMatcher:
                 logger.debug(f"[MATCH] Step 4: Skipped (sklearn not available or vectorizer not ready)")
             
             # === LEVEL 5: BM25 ===
-            if _bm25_available and self.bm25_index:
+            if corpus.bm25_index is not None:
                 logger.debug(f"[MATCH] Step 5: Trying BM25 MATCH with '{normalized}'")
-                result = self._bm25_match(cursor, normalized)
+                result = self._bm25_match(normalized, corpus)
                 if result:
                     matched_name = result['data'].get('ten_thuoc', 'N/A')
                     logger.info(f"[MATCH] ✅ FOUND at Step 5 (BM25): '{matched_name}' - {result['method']}")
                     return result
                 logger.debug(f"[MATCH] Step 5: No BM25 match above threshold")
             else:
-                logger.debug(f"[MATCH] Step 5: Skipped (rank_bm25 not available or index not built)")
+                logger.debug(f"[MATCH] Step 5: Skipped (BM25 index not built)")
             
             # === NOT FOUND ===
             logger.warning(f"[MATCH] ❌ NOT FOUND: '{raw_query}' - All 5 steps failed")
@@ -254,93 +280,107 @@ class DrugMatcher:
         finally:
             conn.close()
     
-    def _exact_match(self, cursor, query: str) -> Optional[Dict]:
-        """Level 1: Exact name match."""
-        cursor.execute("""
-            SELECT * FROM drugs 
-            WHERE ten_thuoc = ? AND is_verified=1 AND so_dang_ky IS NOT NULL
-        """, (query,))
-        row = cursor.fetchone()
-        
-        if row:
-            return {
-                "status": "FOUND",
-                "data": dict(row),
-                "confidence": 1.0,
-                "method": "EXACT_MATCH"
-            }
-        return None
+    def _exact_lookup(self, exact, method: str, raw_query: str, normalized: str) -> Optional[int]:
+        """Level 1 lookup in the corpus hash map (no SQL): SDK in the line, raw name, normalized name."""
+        if method == "EXACT_MATCH":
+            return exact.lookup_name(raw_query)
+        if method == "EXACT_MATCH (normalized)":
+            # So với tên gốc, rồi tên đã normalize trong map
+            pos = exact.lookup_name(normalized)
+            return pos if pos is not None else exact.lookup_norm(normalized)
+        pos = exact.lookup_sdk(raw_query)
+        if pos is None and any(c.isdigit() for c in raw_query):
+            for sdk in extract_sdks(raw_query):
+                pos = exact.lookup_sdk(sdk)
+                if pos is not None:
+                    break
+        return pos
+    
+    def _exact_match(self, corpus, pos: Optional[int], method: str) -> Optional[Dict]:
+        """Level 1: Exact match found in the corpus hash map (row từ RAM, không SQL)."""
+        if pos is None:
+            return None
+        return {
+            "status": "FOUND",
+            "data": corpus.record(pos),
+            "confidence": 1.0,
+            "method": method
+        }
+    
+    def _composition_match(self, corpus, pos: Optional[int]) -> Optional[Dict]:
+        """Level 1b: same (hoạt chất, hàm lượng, đơn vị) set as a drug's hoat_chat."""
+        if pos is None:
+            return None
+        return {
+            "status": "FOUND",
+            "data": corpus.record(pos),
+            "confidence": self.COMPOSITION_CONFIDENCE,
+            "method": "COMPOSITION_MATCH"
+        }
     
     def _partial_match(self, cursor, normalized: str) -> Optional[Dict]:
-        """Level 2: Partial/LIKE match."""
-        cursor.execute("""
-            SELECT * FROM drugs 
-            WHERE ten_thuoc LIKE ? AND is_verified=1 AND so_dang_ky IS NOT NULL
-            LIMIT 1
-        """, (f"%{normalized}%",))
+        """Level 2: Partial match (trigram index, shortest containing name first)."""
+        self.db_core.substring_search(
+            cursor, "drugs", "ten_thuoc", normalized,
+            where="is_verified=1 AND so_dang_ky IS NOT NULL"
+        )
         row = cursor.fetchone()
         
         if row:
             return {
                 "status": "FOUND",
-                "data": dict(row),
+                "data": project_row(row),
                 "confidence": 0.95,
                 "method": "PARTIAL_MATCH"
             }
         return None
     
-    def _fuzzy_match(self, cursor, raw_query: str) -> Optional[Dict]:
-        """Level 3: RapidFuzz token sort ratio."""
-        fuzzy_res = process.extractOne(
-            raw_query, 
-            self.fuzzy_names, 
-            scorer=fuzz.token_sort_ratio
+    def _fuzzy_match(self, raw_query: str, corpus) -> Optional[Dict]:
+        """Level 3: RapidFuzz token sort ratio (chỉ chấm các ứng viên qua blocker)."""
+        fuzzy_res = extract_one(
+            raw_query,
+            corpus.names,
+            corpus.fuzzy_blocker(),
+            self.FUZZY_THRESHOLD
         )
         
         if fuzzy_res:
             match_name, score, idx = fuzzy_res
             if score >= self.FUZZY_THRESHOLD:
-                match_data = self.drug_cache[idx]
-                cursor.execute("SELECT * FROM drugs WHERE id = ?", (match_data['id'],))
-                full_row = cursor.fetchone()
-                if full_row:
-                    return {
-                        "status": "FOUND",
-                        "data": dict(full_row),
-                        "confidence": 0.88,
-                        "method": f"FUZZY_MATCH (score={score:.1f})"
-                    }
+                return {
+                    "status": "FOUND",
+                    "data": corpus.record(idx),
+                    "confidence": 0.88,
+                    "method": f"FUZZY_MATCH (score={score:.1f})"
+                }
         return None
     
-    def _vector_match(self, cursor, normalized: str) -> Optional[Dict]:
+    def _vector_match(self, normalized: str, corpus) -> Optional[Dict]:
         """Level 4: TF-IDF cosine similarity."""
-        query_vec = self.vectorizer.transform([normalized])
-        cosine_sim = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
+        query_vec = corpus.vectorizer.transform([normalized])
+        cosine_sim = cosine_similarity(query_vec, corpus.tfidf_matrix).flatten()
         
         if cosine_sim.size > 0:
             best_idx = int(np.argmax(cosine_sim))
             best_score = float(cosine_sim[best_idx])
             
             if best_score > self.VECTOR_THRESHOLD:
-                match_data = self.drug_cache[best_idx]
-                cursor.execute("SELECT * FROM drugs WHERE id = ?", (match_data['id'],))
-                full_row = cursor.fetchone()
-                if full_row:
-                    return {
-                        "status": "FOUND",
-                        "data": dict(full_row),
-                        "confidence": 0.90,
-                        "method": f"VECTOR_MATCH (cosine={best_score:.2f})"
-                    }
+                return {
+                    "status": "FOUND",
+                    "data": corpus.record(best_idx),
+                    "confidence": 0.90,
+                    "method": f"VECTOR_MATCH (cosine={best_score:.2f})"
+                }
         return None
     
-    def _bm25_match(self, cursor, normalized: str) -> Optional[Dict]:
-        """Level 5: BM25 Okapi ranking."""
-        # Tokenize query
-        query_tokens = normalized.lower().split()
+    def _bm25_match(self, normalized: str, corpus) -> Optional[Dict]:
+        """Level 5: BM25 Okapi ranking (precomputed BM25Index weight matrix)."""
+        # Tokenize query (cùng `tokenize` với BM25Index; tách theo khoảng trắng, không dùng
+        # TOKEN_PATTERN của TF-IDF để giữ nguyên token SĐK như "vd-30311-18")
+        query_tokens = tokenize(normalized)
         
         # Get BM25 scores
-        scores = self.bm25_index.get_scores(query_tokens)
+        scores = corpus.bm25_index.get_scores(query_tokens)
         
         if len(scores) > 0:
             best_idx = int(np.argmax(scores))
@@ -348,17 +388,13 @@ class DrugMatcher:
             
             # BM25 scores vary widely, use relative threshold
             # Score > 5 is typically a good match
-            if best_score > 5.0:
-                match_data = self.drug_cache[best_idx]
-                cursor.execute("SELECT * FROM drugs WHERE id = ?", (match_data['id'],))
-                full_row = cursor.fetchone()
-                if full_row:
-                    return {
-                        "status": "FOUND",
-                        "data": dict(full_row),
-                        "confidence": 0.85,
-                        "method": f"BM25_MATCH (score={best_score:.2f})"
-                    }
+            if best_score > self.BM25_THRESHOLD:
+                return {
+                    "status": "FOUND",
+                    "data": corpus.record(best_idx),
+                    "confidence": 0.85,
+                    "method": f"BM25_MATCH (score={best_score:.2f})"
+                }
         return None
     
     def _not_found(self, reason: str) -> Dict[str, Any]:
@@ -372,12 +408,255 @@ class DrugMatcher:
     
     def match_batch(self, drug_names: List[str]) -> List[Dict[str, Any]]:
         """
-        Match nhiều thuốc cùng lúc.
+        Match nhiều thuốc cùng lúc (kết quả giống hệt gọi `match` từng tên).
+        
+        Chạy cùng cascade nhưng theo từng tầng cho cả batch: normalize một lần,
+        fuzzy bằng `process.cdist(workers=-1)`, vector bằng một phép nhân sparse
+        cho cả batch, row kết quả lấy từ drug index trong RAM.
         
         Args:
             drug_names: Danh sách tên thuốc
             
         Returns:
-            Danh sách kết quả match
+            Danh sách kết quả match (cùng thứ tự input)
         """
-        return [self.match(name) for name in drug_names]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(drug_names)
+        pending: Dict[int, tuple] = {}  # index -> (raw_query, normalized)
+        corpus = self.index.drugs()
+        cached_hits = 0
+        for i, name in enumerate(drug_names):
+            if not name or not name.strip():
+                results[i] = self._not_found("EMPTY_INPUT")
+                continue
+            key = self._cache_key(name)
+            cached = self.result_cache.get(key, corpus.version)
+            if cached is not MISS:
+                results[i] = cached
+                cached_hits += 1
+            else:
+                pending[i] = (key[1], key[0])
+        if not pending:
+            return results
+        
+        start = datetime.now()
+        logger.info(f"[MATCH_BATCH] ========== START BATCH ({len(pending)} names, "
+                    f"{cached_hits} from cache) ==========")
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        
+        computed = dict(pending)
+        
+        def resolve(hits: Dict[int, tuple], confidence: float) -> None:
+            """hits: index -> (corpus position, method); row lấy từ RAM."""
+            for i, (pos, method) in hits.items():
+                results[i] = {
+                    "status": "FOUND", "data": corpus.record(pos), "confidence": confidence, "method": method
+                }
+                del pending[i]
+        
+        try:
+            # === LEVEL 1: EXACT MATCH (raw -> normalized -> SDK) ===
+            exact = corpus.exact_index(normalize_for_matching)
+            for method in self.EXACT_STEPS:
+                hits = {}
+                for i, (raw, norm) in pending.items():
+                    pos = self._exact_lookup(exact, method, raw, norm)
+                    if pos is not None:
+                        hits[i] = (pos, method)
+                resolve(hits, 1.0)
+            
+            # === LEVEL 1b: COMPOSITION MATCH ===
+            composition = corpus.composition_index()
+            hits = {}
+            for i, (raw, _) in pending.items():
+                pos = composition.lookup(raw, corpus.ingredients)
+                if pos is not None:
+                    hits[i] = (pos, "COMPOSITION_MATCH")
+            resolve(hits, self.COMPOSITION_CONFIDENCE)
+            
+            # === LEVEL 2: PARTIAL/LIKE MATCH (trigram index, từng tên) ===
+            for i, (raw, norm) in list(pending.items()):
+                result = self._partial_match(cursor, norm)
+                if result:
+                    results[i] = result
+                    del pending[i]
+            
+            # === LEVEL 3: RAPIDFUZZ (cdist, đa luồng) ===
+            if pending and _rapidfuzz_available and len(corpus):
+                resolve(self._fuzzy_batch([raw for raw, _ in pending.values()], list(pending), corpus), 0.88)
+            
+            # === LEVEL 4: TF-IDF VECTOR (một phép nhân sparse cho cả batch) ===
+            if pending and _sklearn_available and corpus.vectorizer and corpus.tfidf_matrix is not None:
+                resolve(self._vector_batch([norm for _, norm in pending.values()], list(pending), corpus), 0.90)
+            
+            # === LEVEL 5: BM25 ===
+            if pending and corpus.bm25_index is not None:
+                resolve(self._bm25_batch([norm for _, norm in pending.values()], list(pending), corpus), 0.85)
+            
+            for i in pending:
+                results[i] = self._not_found("NO_MATCH")
+        finally:
+            conn.close()
+        
+        for i, (raw, norm) in computed.items():
+            self._remember((norm, raw), corpus.version, results[i])
+        
+        found = sum(1 for r in results if r["status"] == "FOUND")
+        elapsed = (datetime.now() - start).total_seconds()
+        logger.info(f"[MATCH_BATCH] Done: {found}/{len(results)} found in {elapsed:.2f}s")
+        return results
+    
+    def _fuzzy_batch(self, queries: List[str], keys: List[int], corpus) -> Dict[int, tuple]:
+        """Level 3 cho cả batch: cùng kết quả với `process.extractOne` từng query."""
+        # extractOne bỏ qua tên None (dòng đã xoá); "" luôn có score 0 < threshold
+        blocker = corpus.fuzzy_blocker()
+        hits = {}
+        for c in range(0, len(queries), self.BATCH_CHUNK):
+            chunk = queries[c:c + self.BATCH_CHUNK]
+            # cdist chỉ trên hợp các ứng viên của chunk (tăng dần -> giữ thứ tự tie-break)
+            cols = np.unique(np.concatenate([
+                blocker.candidates(q, self.FUZZY_THRESHOLD) for q in chunk
+            ]))
+            if not len(cols):
+                continue
+            choices = [corpus.names[i] if corpus.names[i] is not None else "" for i in cols]
+            scores = process.cdist(
+                chunk, choices,
+                scorer=fuzz.token_sort_ratio, dtype=np.float64,
+                score_cutoff=self.FUZZY_THRESHOLD, workers=-1
+            )
+            best = scores.argmax(axis=1)  # argmax lấy index đầu tiên khi bằng điểm, như extractOne
+            for r, j in enumerate(best):
+                score = float(scores[r, j])
+                if score >= self.FUZZY_THRESHOLD:
+                    hits[keys[c + r]] = (int(cols[j]), f"FUZZY_MATCH (score={score:.1f})")
+        return hits
+    
+    def _vector_batch(self, normalized: List[str], keys: List[int], corpus) -> Dict[int, tuple]:
+        """Level 4 cho cả batch: cosine = normalize(Q) . normalize(M)^T như cosine_similarity."""
+        matrix_t = sk_normalize(corpus.tfidf_matrix).T
+        hits = {}
+        for c in range(0, len(normalized), self.BATCH_CHUNK):
+            query = sk_normalize(corpus.vectorizer.transform(normalized[c:c + self.BATCH_CHUNK]))
+            sims = (query @ matrix_t).tocsr()
+            for r, (best_idx, best_score) in enumerate(self._row_argmax(sims)):
+                if best_score > self.VECTOR_THRESHOLD:
+                    hits[keys[c + r]] = (best_idx, f"VECTOR_MATCH (cosine={best_score:.2f})")
+        return hits
+    
+    def _bm25_batch(self, normalized: List[str], keys: List[int], corpus) -> Dict[int, tuple]:
+        """Level 5 cho cả batch: một phép nhân sparse với ma trận trọng số BM25."""
+        hits = {}
+        for c in range(0, len(normalized), self.BATCH_CHUNK):
+            scores = corpus.bm25_index.get_batch_scores([tokenize(n) for n in normalized[c:c + self.BATCH_CHUNK]])
+            for r, (best_idx, best_score) in enumerate(self._row_argmax(scores)):
+                if best_score > self.BM25_THRESHOLD:
+                    hits[keys[c + r]] = (best_idx, f"BM25_MATCH (score={best_score:.2f})")
+        return hits
+    
+    @staticmethod
+    def _row_argmax(matrix):
+        """(index, score) lớn nhất của từng hàng CSR, cột nhỏ nhất khi bằng điểm (như np.argmax dense)."""
+        for r in range(matrix.shape[0]):
+            lo, hi = matrix.indptr[r], matrix.indptr[r + 1]
+            if lo == hi:
+                yield -1, 0.0
+                continue
+            data, cols = matrix.data[lo:hi], matrix.indices[lo:hi]
+            best = data.max()
+            yield int(cols[data == best].min()), float(best)
+    
+    def candidates(self, drug_name: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Top-k thuốc ứng viên kèm điểm của từng tầng (không dừng ở tầng đầu tiên).
+        
+        Mỗi tầng lấy top-k riêng (argpartition trên kết quả sparse / rapidfuzz
+        `extract(limit=k)`), gộp theo drug id rồi xếp theo `confidence`:
+        exact 1.0, composition 0.97, partial 0.95, fuzzy 0.88*ratio, vector 0.90*cosine,
+        bm25 0.85*min(1, score/BM25_THRESHOLD) - cùng thứ tự ưu tiên như `match`.
+        
+        Returns:
+            [{"data": {...}, "confidence": float, "method": tầng tốt nhất,
+              "scores": {"exact"|"composition"|"partial"|"fuzzy"|"vector"|"bm25": điểm gốc}}, ...]
+        """
+        if not drug_name or not drug_name.strip() or k <= 0:
+            return []
+        
+        raw_query = drug_name.strip()
+        normalized = normalize_for_matching(drug_name)
+        corpus = self.index.drugs()
+        found: Dict[int, Dict[str, Any]] = {}  # drug id -> candidate
+        
+        def add(drug_id: int, level: str, score: float, confidence: float, method: str) -> None:
+            cand = found.setdefault(drug_id, {"data": None, "confidence": 0.0, "method": None, "scores": {}})
+            cand["scores"][level] = max(score, cand["scores"].get(level, score))
+            if confidence > cand["confidence"]:
+                cand["confidence"], cand["method"] = confidence, method
+        
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            # Level 1: exact (hash map)
+            exact = corpus.exact_index(normalize_for_matching)
+            for method in self.EXACT_STEPS:
+                pos = self._exact_lookup(exact, method, raw_query, normalized)
+                if pos is not None:
+                    add(corpus.ids[pos], "exact", 1.0, 1.0, method)
+            
+            # Level 1b: composition (hoạt chất + hàm lượng)
+            for pos in corpus.composition_index().lookup_all(raw_query)[:k]:
+                add(corpus.ids[pos], "composition", 1.0, self.COMPOSITION_CONFIDENCE, "COMPOSITION_MATCH")
+            
+            # Level 2: partial (trigram index, tên ngắn nhất trước)
+            self.db_core.substring_search(
+                cursor, "drugs", "ten_thuoc", normalized,
+                where="is_verified=1 AND so_dang_ky IS NOT NULL", limit=k
+            )
+            for row in cursor.fetchall():
+                row = project_row(row)
+                add(row['id'], "partial", 1.0, 0.95, "PARTIAL_MATCH")
+                found[row['id']]["data"] = row
+            
+            # Level 3: RapidFuzz top-k
+            if _rapidfuzz_available and len(corpus):
+                for _, score, idx in extract(
+                    raw_query, corpus.names, corpus.fuzzy_blocker(),
+                    self.CANDIDATE_FUZZY_CUTOFF, k
+                ):
+                    add(corpus.ids[idx], "fuzzy", float(score), 0.88 * score / 100.0, "FUZZY_MATCH")
+            
+            # Level 4: TF-IDF cosine, top-k trên các phần tử khác 0
+            if _sklearn_available and corpus.vectorizer and corpus.tfidf_matrix is not None:
+                sims = cosine_similarity(
+                    corpus.vectorizer.transform([normalized]), corpus.tfidf_matrix, dense_output=False
+                ).tocsr()
+                for idx, score in zip(*self._top_k(sims.indices, sims.data, k)):
+                    add(corpus.ids[idx], "vector", score, 0.90 * score, "VECTOR_MATCH")
+            
+            # Level 5: BM25 top-k
+            if corpus.bm25_index is not None:
+                scores = corpus.bm25_index.get_batch_scores([tokenize(normalized)])
+                positive = scores.data > 0
+                for idx, score in zip(*self._top_k(scores.indices[positive], scores.data[positive], k)):
+                    add(corpus.ids[idx], "bm25", score, 0.85 * min(1.0, score / self.BM25_THRESHOLD), "BM25_MATCH")
+        finally:
+            conn.close()
+        
+        result = []
+        for drug_id, cand in found.items():
+            if cand["data"] is None:
+                pos = corpus.positions.get(drug_id)
+                cand["data"] = corpus.record(pos) if pos is not None else None
+            if cand["data"] is not None:
+                result.append(cand)
+        result.sort(key=lambda c: (-c["confidence"], c["data"]['id']))
+        return result[:k]
+    
+    @staticmethod
+    def _top_k(indices: np.ndarray, scores: np.ndarray, k: int):
+        """Top-k (index, score) theo score giảm dần, dùng argpartition thay vì sort toàn bộ."""
+        if len(scores) > k:
+            part = np.argpartition(-scores, k - 1)[:k]
+            indices, scores = indices[part], scores[part]
+        order = np.lexsort((indices, -scores))
+        return [int(i) for i in indices[order]], [float(v) for v in scores[order]]
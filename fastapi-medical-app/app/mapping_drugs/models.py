@@ -3,7 +3,7 @@ Pydantic Models cho Claims vs Medicine Matching API
 ====================================================
 """
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 from datetime import datetime
 
 
@@ -129,3 +129,26 @@ class DrugMatchResponse(BaseModel):
     active_ingredient: Optional[str] = None
     confidence: float
     method: str
+
+
+class DrugCandidatesRequest(BaseModel):
+    """Request lấy top-k thuốc ứng viên."""
+    drug_name: str
+    k: int = Field(5, ge=1, le=50, description="Số ứng viên tối đa")
+
+
+class DrugCandidate(BaseModel):
+    """Một thuốc ứng viên kèm điểm từng tầng matching."""
+    drug_id: int
+    official_name: Optional[str] = None
+    sdk: Optional[str] = None
+    active_ingredient: Optional[str] = None
+    confidence: float
+    method: str
+    scores: Dict[str, float] = Field(default_factory=dict, description="exact/partial/fuzzy/vector/bm25")
+
+
+class DrugCandidatesResponse(BaseModel):
+    """Response top-k ứng viên cho 1 thuốc."""
+    input_name: str
+    candidates: List[DrugCandidate]
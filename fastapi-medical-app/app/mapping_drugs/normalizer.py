@@ -2,62 +2,13 @@
 Normalizer Module - Chuẩn hóa tên thuốc cho matching
 =====================================================
 Standalone implementation, không phụ thuộc API bên ngoài.
+`normalize_for_matching` / `normalize_many` dùng chung với app/core (app/core/normalizer.py).
 """
 
 import re
-import unicodedata
 from typing import Optional
 
-
-def normalize_for_matching(text: str) -> str:
-    """
-    Chuẩn hóa tên thuốc để fuzzy match trong DB.
-    
-    Quy tắc:
-    - Lowercase
-    - Bỏ dấu tiếng Việt (convert to ASCII)
-    - Giữ lại: a-z, 0-9, space, -, +, %, .
-    - Bỏ leading zeros (05ml -> 5ml)
-    
-    Args:
-        text: Tên thuốc thô (raw drug name)
-        
-    Returns:
-        Tên thuốc đã chuẩn hóa
-    """
-    if not text:
-        return ""
-
-    text = text.lower()
-    
-    # Bỏ dấu tiếng Việt
-    text = unicodedata.normalize('NFKD', text)
-    text = "".join([c for c in text if not unicodedata.combining(c)])
-    text = text.replace('đ', 'd')
-    text = text.replace('Đ', 'd')
-
-    # Thay separators thành space
-    text = text.replace("/", " ")
-    text = re.sub(r'[\(\)\[\]]', ' ', text)
-
-    # Chỉ giữ ký tự hợp lệ: a-z, 0-9, space, -, +, %, .
-    text = re.sub(r'[^a-z0-9\s\-\+\%\.]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Bỏ leading zeros: 05ml -> 5ml, 03 -> 3
-    def strip_leading_zeros(match):
-        num = match.group(1).lstrip('0') or '0'  # Giữ ít nhất 1 số 0
-        suffix = match.group(2) or ''
-        return num + suffix
-    
-    text = re.sub(
-        r'\b0+(\d+)(ml|mg|mcg|g|iu|ui|l|%)?', 
-        strip_leading_zeros, 
-        text, 
-        flags=re.IGNORECASE
-    )
-    
-    return text
+from app.core.normalizer import normalize_for_matching, normalize_many  # noqa: F401 (re-export)
 
 
 def normalize_drug_name(text: str) -> Optional[str]:
@@ -4,6 +4,7 @@ FastAPI Router cho Claims vs Medicine Matching API
 Endpoints:
 - POST /api/v1/mapping/match - Match Claims với Medicine
 - POST /api/v1/mapping/test - Test match 1 thuốc
+- POST /api/v1/mapping/candidates - Top-k thuốc ứng viên kèm điểm từng tầng
 """
 
 from fastapi import APIRouter, HTTPException
@@ -14,7 +15,8 @@ from .service import ClaimsMedicineMatchingService
 from .matcher import DrugMatcher
 from .models import (
     MatchingRequest, MatchingResponse,
-    DrugMatchRequest, DrugMatchResponse
+    DrugMatchRequest, DrugMatchResponse,
+    DrugCandidatesRequest, DrugCandidatesResponse, DrugCandidate
 )
 
 router = APIRouter()
@@ -172,8 +174,7 @@ async def test_drug_match_batch(drug_names: List[str]):
         matcher = get_drug_matcher()
         results = []
         
-        for name in drug_names:
-            result = matcher.match(name)
+        for name, result in zip(drug_names, matcher.match_batch(drug_names)):
             data = result.get('data', {}) or {}
             
             results.append(DrugMatchResponse(
@@ -191,10 +192,45 @@ async def test_drug_match_batch(drug_names: List[str]):
         raise HTTPException(status_code=500, detail=f"Batch match error: {str(e)}")
 
 
+@router.post("/candidates", response_model=DrugCandidatesResponse)
+async def drug_candidates(request: DrugCandidatesRequest):
+    """
+    Top-k thuốc ứng viên cho 1 tên thuốc, kèm điểm của từng tầng matching.
+    
+    Khác `/test` (dừng ở tầng đầu tiên đạt ngưỡng), endpoint này trả về nhiều
+    ứng viên để re-rank phía client; chỉ các item thực sự mơ hồ mới cần gửi AI.
+    
+    **Output:**
+    - `candidates`: sắp xếp theo `confidence` giảm dần
+    - `scores`: điểm gốc từng tầng (exact/partial = 1, fuzzy 0-100, vector cosine, bm25)
+    """
+    if not request.drug_name or not request.drug_name.strip():
+        raise HTTPException(status_code=400, detail="Drug name cannot be empty")
+    
+    try:
+        matcher = get_drug_matcher()
+        candidates = [
+            DrugCandidate(
+                drug_id=c['data']['id'],
+                official_name=c['data'].get('ten_thuoc'),
+                sdk=c['data'].get('so_dang_ky'),
+                active_ingredient=c['data'].get('hoat_chat'),
+                confidence=c['confidence'],
+                method=c['method'],
+                scores=c['scores']
+            )
+            for c in matcher.candidates(request.drug_name, request.k)
+        ]
+        return DrugCandidatesResponse(input_name=request.drug_name, candidates=candidates)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Candidates error: {str(e)}")
+
+
 @router.get("/health")
 async def health_check():
     """Health check cho mapping module."""
     matcher = get_drug_matcher()
+    index_stats = matcher.index.stats()
     
     return {
         "status": "healthy",
@@ -202,5 +238,7 @@ async def health_check():
         "cache_loaded": len(matcher.drug_cache) > 0,
         "drugs_in_cache": len(matcher.drug_cache),
         "fuzzy_enabled": len(matcher.fuzzy_names) > 0,
-        "vector_enabled": matcher.vectorizer is not None
+        "vector_enabled": matcher.vectorizer is not None,
+        "index_version": index_stats["version"],
+        "result_cache": matcher.result_cache.stats()
     }
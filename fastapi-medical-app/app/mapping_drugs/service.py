@@ -12,7 +12,7 @@ from datetime import datetime
 import uuid
 
 from .matcher import DrugMatcher
-from .normalizer import normalize_for_matching
+from .normalizer import normalize_for_matching, normalize_many
 from .models import (
     ClaimItem, MedicineItem, MatchingRequest, MatchingResponse,
     MatchedPair, MatchEvidence, Anomaly, AnomaliesReport, 
@@ -395,15 +395,15 @@ class ClaimsMedicineMatchingService:
     def _enrich_items(self, items: list, item_type: str) -> List[Dict]:
         """Làm giàu items với DB info."""
         enriched = []
-        for item in items:
-            item_dict = item.model_dump() if hasattr(item, 'model_dump') else dict(item)
-            
+        item_dicts = [item.model_dump() if hasattr(item, 'model_dump') else dict(item) for item in items]
+        normalized = normalize_many(d.get('service', '') for d in item_dicts)
+        for item_dict, service_norm in zip(item_dicts, normalized):
             # Match với DB
             service_name = item_dict.get('service', '')
             db_result = self.matcher.match(service_name)
             
             item_dict['_type'] = item_type
-            item_dict['_normalized'] = normalize_for_matching(service_name)
+            item_dict['_normalized'] = service_norm
             item_dict['_db_status'] = db_result['status']
             item_dict['_db_confidence'] = db_result['confidence']
             item_dict['_db_method'] = db_result['method']
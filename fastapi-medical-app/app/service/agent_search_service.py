@@ -4,10 +4,12 @@ Uses direct AsyncAzureOpenAI client and simple Agent Loop (Plan -> Act -> Observ
 Removed all mcp-agent dependencies.
 """
 import os
+import copy
 import json
 from dotenv import load_dotenv
 from openai import AsyncAzureOpenAI, AsyncOpenAI
 from app.service.playwright_manager import playwright_manager
+from app.service.crawler.scheduler import PRIORITY_INTERACTIVE, crawl_scheduler
 from app.service.search_normalizer import normalize_drug_name
 
 load_dotenv()
@@ -74,16 +76,35 @@ Khi tìm thấy thông tin trong DOM, trả về:
 NẾU BẠN ĐANG Ở TRANG CHI TIẾT THUỐC VÀ DOM CONTENT CÓ THÔNG TIN => PHẢI TRẢ ANSWER, KHÔNG REFLECT!
 """
 
+def _search_name(drug_name: str) -> str:
+    # Normalize drug name for search
+    search_name = normalize_drug_name(drug_name)
+    if not search_name:
+        search_name = drug_name.split()[0] if drug_name else "unknown"  # Fallback to first word
+    return search_name
+
+
 async def run_agent_search(drug_name: str) -> dict:
     """
     Runs the Browser Agent to search for drug information.
+    Các request đồng thời cho cùng tên (sau normalize) dùng chung một lượt agent
+    qua crawl_scheduler; mỗi caller nhận bản copy với input_name của mình.
+    """
+    key = ("agent", _search_name(drug_name).lower())
+    result = await crawl_scheduler.submit(key, lambda: _run_agent_search(drug_name), PRIORITY_INTERACTIVE)
+    result = copy.deepcopy(result)
+    if isinstance(result.get("data"), dict):
+        result["data"]["input_name"] = drug_name
+    return result
+
+
+async def _run_agent_search(drug_name: str) -> dict:
+    """
+    Agent loop (Plan -> Act -> Observe).
     Based on the working solution in browser_mcp_agent/app/main.py.
     """
-    # Normalize drug name for search
-    search_name = normalize_drug_name(drug_name)
-    if not search_name:
-        search_name = drug_name.split()[0] if drug_name else "unknown"  # Fallback to first word
-    
+    search_name = _search_name(drug_name)
+
     print(f"[Agent] Starting search for: {drug_name} -> Normalized: {search_name}")
     
     client, model_name = get_openai_client()
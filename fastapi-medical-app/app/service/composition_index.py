@@ -0,0 +1,176 @@
+"""
+Composition Index - Tra cứu thuốc theo (hoạt chất, hàm lượng, đơn vị)
+======================================================================
+Dòng claim kiểu "Amoxicillin 500mg + Clavulanic 125mg" thường không khớp tên
+thương mại nhưng khớp đúng cột `hoat_chat` của thuốc
+("Amoxicillin 500mg; Acid clavulanic 125mg"). Index này parse `hoat_chat`
+thành tập component {(hoạt chất, hàm lượng, đơn vị)} và map tập đó -> thuốc,
+nên tra cứu là một lần hash O(số component).
+
+Parse cho dữ liệu `hoat_chat` thật (khác `normalize_drug_name` ở core/utils):
+- component tách bởi `;`, `+`, `,` (không tách dấu phẩy thập phân "37,5mg"), "và"/"and";
+- bỏ phần trong ngoặc ("dưới dạng ..."), tiền tố "Mỗi gói chứa:";
+- hàm lượng quy về đơn vị chuẩn (g/mcg -> mg, UI -> iu); dạng nồng độ
+  ("10mg/5ml", "Mỗi 5ml chứa: ... 10mg") quy về mg/ml, mg/g; "/gói", "/viên",
+  "Mỗi gói ... chứa:" là hàm lượng một đơn vị, giữ mg;
+- tên hoạt chất: bỏ dấu, bỏ "acid", bỏ muối đứng sau tên (hydroclorid, natri, trihydrat...),
+  bỏ đuôi "e" kiểu tiếng Anh (metronidazole -> metronidazol).
+
+Chỉ index / tra cứu khi MỌI component đều có hàm lượng - chuỗi có phần không
+parse được (tên biệt dược, dạng bào chế...) đi tiếp các tầng sau.
+"""
+
+import re
+import unicodedata
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+Component = Tuple[str, float, str]
+Composition = FrozenSet[Component]
+
+_UNITS = {"mg": ("mg", 1.0), "g": ("mg", 1000.0), "mcg": ("mg", 0.001), "µg": ("mg", 0.001),
+          "ug": ("mg", 0.001), "iu": ("iu", 1.0), "ui": ("iu", 1.0), "ml": ("ml", 1.0), "%": ("%", 1.0)}
+
+_PAREN = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+_PREFIX = re.compile(r"^.*?:")
+_NUM = r"(\d+(?:[.,]\d+)?)"
+# "Mỗi 5 ml chứa:" -> nồng độ; "Mỗi gói 1g chứa:" (có tên đơn vị đóng gói) -> hàm lượng / đơn vị
+_PER_VOLUME = re.compile(r"^\s*moi\s+" + _NUM + r"?\s*(ml|g)\b")
+_SPLIT = re.compile(r";|\+|,(?!\d)|(?<!\d),|\bva\b|\band\b")
+_DOSE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(mg|mcg|µg|ug|g|iu|ui|ml|%)(?![a-z])")
+_PER = re.compile(r"^\s*/\s*" + _NUM + r"?\s*([a-z]+)")  # mẫu số: /5ml, /gói, /100ml
+_PREFIX_WORDS = {"acid", "axit"}
+# Muối / dạng hydrat: chỉ bỏ khi đứng sau tên hoạt chất ("Montelukast natri"),
+# giữ khi là từ đầu ("Natri clorid" khác "Kali clorid").
+_SALTS = {
+    "hydroclorid", "hydrochlorid", "hydrochloride", "hcl", "natri", "sodium", "kali",
+    "potassium", "calci", "calcium", "magnesi", "trihydrat", "trihydrate", "monohydrat", "monohydrate",
+    "dihydrat", "dihydrate", "hemihydrat", "hemihydrate", "sulfat", "sulphate", "sulfate", "maleat",
+    "maleate", "besylat", "besilat", "tartrat", "citrat", "acetat", "fumarat", "succinat", "mesylat",
+}
+
+
+def _fold(text: str) -> str:
+    """lowercase + bỏ dấu tiếng Việt."""
+    text = unicodedata.normalize("NFKD", text.lower().replace("đ", "d"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _plain(text: str) -> str:
+    return " ".join(_fold(text).split())
+
+
+def _ingredient_key(text: str) -> str:
+    words = []
+    for word in re.findall(r"[a-z0-9]+", text):
+        if word in _PREFIX_WORDS or (words and word in _SALTS):
+            continue
+        if len(word) > 5 and word.endswith("e") and word[-2] not in "aeiou":
+            word = word[:-1]
+        words.append(word)
+    return " ".join(words)
+
+
+def _number(text: Optional[str], default: float = 1.0) -> float:
+    return float(text.replace(",", ".")) if text else default
+
+
+def parse_composition(text: Optional[str]) -> Optional[Composition]:
+    """
+    "Amoxicillin 500 mg; Acid clavulanic 125mg" ->
+    {("amoxicillin", 500.0, "mg"), ("clavulanic", 125.0, "mg")}.
+    None nếu chuỗi rỗng hoặc có component không có hàm lượng.
+    """
+    if not text:
+        return None
+    text = _PAREN.sub(" ", _fold(text).replace("\xa0", " "))
+    per_text = None  # (lượng, đơn vị) của tiền tố "Mỗi 5ml chứa:"
+    if ":" in text:
+        volume = _PER_VOLUME.match(text)
+        if volume:
+            per_text = (_number(volume.group(1)), volume.group(2))
+        text = _PREFIX.sub(" ", text, count=1)
+
+    components = set()
+    for part in _SPLIT.split(text):
+        part = part.strip(" .-")
+        if not part:
+            continue
+        dose = _DOSE.search(part)
+        if dose is None:
+            return None
+        rest = part[dose.end():]
+        per = per_text
+        denominator = _PER.match(rest)
+        if denominator:
+            rest = rest[denominator.end():]
+            if denominator.group(2) in ("ml", "g"):
+                per = (_number(denominator.group(1)), denominator.group(2))
+        if re.search(r"[a-z]{2,}", rest):
+            return None  # chữ sau hàm lượng (tên biệt dược, dạng bào chế...)
+        name = _ingredient_key(part[:dose.start()])
+        if not name:
+            return None
+        unit, factor = _UNITS[dose.group(2)]
+        amount = _number(dose.group(1)) * factor
+        if per and unit in ("mg", "iu") and per[0] > 0:
+            amount, unit = amount / per[0], f"{unit}/{per[1]}"
+        components.add((name, round(amount, 6), unit))
+    return frozenset(components) or None
+
+
+class CompositionIndex:
+    """
+    Composition -> [(id, position)], trùng thì id nhỏ nhất thắng (như ExactIndex).
+    Copy-on-write để snapshot delta dùng chung với snapshot cũ.
+    """
+
+    def __init__(self):
+        self.by_composition: Dict[Composition, List[Tuple[int, int]]] = {}
+
+    def add(self, pos: int, drug_id: int, ingredients: Optional[str]) -> None:
+        key = parse_composition(ingredients)
+        if key is not None:
+            self.by_composition[key] = self.by_composition.get(key, []) + [(drug_id, pos)]
+
+    def remove(self, pos: int, ingredients: Optional[str]) -> None:
+        key = parse_composition(ingredients)
+        if key is None:
+            return
+        entries = [e for e in self.by_composition.get(key, ()) if e[1] != pos]
+        if entries:
+            self.by_composition[key] = entries
+        else:
+            self.by_composition.pop(key, None)
+
+    def copy(self) -> "CompositionIndex":
+        new = CompositionIndex()
+        new.by_composition = dict(self.by_composition)
+        return new
+
+    def lookup_all(self, text: str) -> List[int]:
+        """Positions of every drug whose hoat_chat has exactly the composition of `text` (id order)."""
+        key = parse_composition(text)
+        entries = self.by_composition.get(key) if key is not None else None
+        return [pos for _, pos in sorted(entries)] if entries else []
+
+    def lookup(self, text: str, ingredients: Optional[Sequence[Optional[str]]] = None) -> Optional[int]:
+        """
+        Position of the drug whose hoat_chat has exactly the composition of `text`.
+
+        Nhiều thuốc cùng thành phần (generic): ưu tiên thuốc có `hoat_chat`
+        trùng nguyên văn `text` (khi truyền cột `ingredients`), sau đó id nhỏ nhất.
+        """
+        key = parse_composition(text)
+        entries = self.by_composition.get(key) if key is not None else None
+        if not entries:
+            return None
+        entries = sorted(entries)
+        if ingredients is not None and len(entries) > 1:
+            wanted = _plain(text)
+            for _, pos in entries:
+                if _plain(ingredients[pos] or "") == wanted:
+                    return pos
+        return entries[0][1]
+
+    def __len__(self) -> int:
+        return len(self.by_composition)
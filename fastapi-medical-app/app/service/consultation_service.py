@@ -1,5 +1,6 @@
 import math
 from typing import List, Dict, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
 from app.models import ConsultResult 
 from app.database.core import DatabaseCore
 from app.core.utils import normalize_text
@@ -19,21 +20,29 @@ class ConsultationService:
         """
         Integrated Consultation: Internal KB with Fuzzy Matching.
         
+        Fuzzy match + tra KB là việc đồng bộ (CPU/DB) -> chạy trong threadpool
+        để không chặn event loop.
+        """
+        return await run_in_threadpool(self.consult_batch, request)
+
+    def consult_batch(self, request) -> List[Dict]:
+        """
         Logic:
-        1. Iterate Drug x Diagnosis pairs.
-        2. Use KBFuzzyMatchService for fuzzy drug name lookup.
+        1. Resolve các tên thuốc distinct một lần (KBFuzzyMatchService.find_best_matches).
+        2. Iterate Drug x Diagnosis pairs: dòng KB tốt nhất tra trong snapshot KB.
         3. Return TDV > AI classification priority.
         """
         results = []
+        name_matches = self.kb_matcher.find_best_matches([item.name for item in request.items])
+        disease_icds = list(dict.fromkeys(diag.code.strip().lower() for diag in request.diagnoses))
         
         for item in request.items:
             is_resolved = False
+            name_match = name_matches.get(item.name)
             
-            for diag in request.diagnoses:
-                disease_icd = diag.code.strip().lower()
-                
+            for disease_icd in (disease_icds if name_match else ()):
                 # Use fuzzy matching instead of exact
-                match = self.kb_matcher.find_best_match_with_icd(item.name, disease_icd)
+                match = self.kb_matcher.find_best_match_with_icd(item.name, disease_icd, match=name_match)
                 
                 if match:
                     # Vote & Promote: Priority TDV > AI
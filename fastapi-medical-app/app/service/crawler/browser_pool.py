@@ -0,0 +1,277 @@
+"""
+Browser Pool - Chromium dùng chung cho crawler thay vì launch mỗi lần gọi
+=========================================================================
+Trước đây mỗi keyword (scrape_drug_web_advanced, fallback multi-engine,
+search_icd_online mỗi site, web_crawler_v2, agent search) đều
+`async_playwright()` + `chromium.launch` - vài giây mỗi request.
+
+Pool giữ một Playwright instance và tối đa BROWSER_POOL_SIZE browser ấm:
+- `browser()`: mượn một browser (ít lease nhất), trả lại khi ra khỏi `async with`.
+  Tổng số lease đồng thời <= BROWSER_POOL_SIZE * BROWSER_POOL_MAX_LEASES.
+- `context(**options)` / `page(**options)`: context được tái sử dụng theo
+  `profile` + bộ option, đóng khi đã mở quá BROWSER_CONTEXT_PAGE_BUDGET page hoặc lease lỗi.
+  `setup(context)` chạy một lần khi context được tạo (init script, route...);
+  `options_factory()` cho option đổi theo từng context mới (vd. user agent xoay vòng).
+  Truyền setup/options_factory thì phải đặt `profile` (vd. "drug").
+- Replay (CRAWL_REPLAY_DIR): corpus đang bật được gắn lên mọi context mới;
+  context không dùng lại khi bật/tắt/đổi corpus.
+- Crash recovery: browser mất kết nối được launch lại ở lần mượn sau;
+  pool tạo trên event loop khác (asyncio.run mới) được khởi tạo lại.
+
+Usage:
+    async with browser_pool.page() as page:
+        await page.goto(url)
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .replay import active_corpus, install_active_corpus
+from .stealth_config import BROWSER_ARGS
+from .utils import logger
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_POOL_MAX_LEASES = int(os.getenv("BROWSER_POOL_MAX_LEASES", "4"))
+BROWSER_CONTEXT_PAGE_BUDGET = int(os.getenv("BROWSER_CONTEXT_PAGE_BUDGET", "20"))
+BROWSER_POOL_IDLE_CONTEXTS = int(os.getenv("BROWSER_POOL_IDLE_CONTEXTS", "4"))
+BROWSER_POOL_HEADLESS = os.getenv("BROWSER_POOL_HEADLESS", "1") != "0"
+
+
+def _default_playwright_factory():
+    from playwright.async_api import async_playwright
+    return async_playwright()
+
+
+class _BrowserSlot:
+    """Một browser trong pool + số lease đang dùng + context rảnh (theo option)."""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.leases = 0
+        self.idle_contexts: Dict[tuple, List["_PooledContext"]] = {}
+        self.alive = True
+        try:
+            browser.on("disconnected", lambda *_: self._mark_dead())
+        except Exception:
+            pass
+
+    def _mark_dead(self):
+        self.alive = False
+
+    def is_alive(self) -> bool:
+        if not self.alive:
+            return False
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+
+class _PooledContext:
+    def __init__(self, context):
+        self.context = context
+        self.pages_opened = 0
+        try:
+            context.on("page", lambda *_: self._count_page())
+        except Exception:
+            pass
+
+    def _count_page(self):
+        self.pages_opened += 1
+
+
+class BrowserPool:
+    def __init__(self, size: int = None, max_leases: int = None, page_budget: int = None,
+                 idle_contexts: int = None, headless: bool = None, launch_args: List[str] = None,
+                 playwright_factory: Callable[[], Any] = None):
+        self.size = max(1, size or BROWSER_POOL_SIZE)
+        self.max_leases = max(1, max_leases or BROWSER_POOL_MAX_LEASES)
+        self.page_budget = max(1, page_budget or BROWSER_CONTEXT_PAGE_BUDGET)
+        self.idle_contexts = BROWSER_POOL_IDLE_CONTEXTS if idle_contexts is None else idle_contexts
+        self.headless = BROWSER_POOL_HEADLESS if headless is None else headless
+        self.launch_args = list(BROWSER_ARGS if launch_args is None else launch_args)
+        self.playwright_factory = playwright_factory or _default_playwright_factory
+        self._reset()
+
+    def _reset(self):
+        self._loop = None
+        self._playwright = None
+        self._slots: List[_BrowserSlot] = []
+        self._lock = None
+        self._leases = None
+        self.launches = 0
+
+    def _bind_loop(self):
+        """Playwright objects thuộc về event loop tạo ra chúng -> loop mới thì khởi tạo lại."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None:
+                logger.warning("[BrowserPool] Event loop changed - discarding browsers from the old loop")
+            self._reset()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._leases = asyncio.Semaphore(self.size * self.max_leases)
+
+    async def _launch(self):
+        if self._playwright is None:
+            self._playwright = await self.playwright_factory().start()
+        browser = await self._playwright.chromium.launch(headless=self.headless, args=self.launch_args)
+        self.launches += 1
+        logger.info(f"[BrowserPool] Launched browser #{self.launches}")
+        return browser
+
+    async def _checkout_slot(self) -> _BrowserSlot:
+        async with self._lock:
+            dead = [slot for slot in self._slots if not slot.is_alive()]
+            for slot in dead:
+                logger.warning("[BrowserPool] Browser disconnected - replacing it")
+                self._slots.remove(slot)
+                await self._close_quietly(slot.browser)
+            if len(self._slots) < self.size and all(slot.leases for slot in self._slots):
+                try:
+                    self._slots.append(_BrowserSlot(await self._launch()))
+                except Exception:
+                    if not self._slots:
+                        # Playwright driver có thể đã chết - lần sau start lại từ đầu
+                        await self._stop_playwright()
+                        raise
+                    logger.exception("[BrowserPool] Launch failed, sharing existing browsers")
+            slot = min(self._slots, key=lambda s: s.leases)
+            slot.leases += 1
+            return slot
+
+    @asynccontextmanager
+    async def browser(self, headless: bool = None):
+        """
+        Mượn một browser của pool. `headless` khác cấu hình pool (debug) ->
+        launch browser riêng, đóng khi trả.
+        """
+        self._bind_loop()
+        if headless is not None and headless != self.headless:
+            async with self._leases:
+                if self._playwright is None:
+                    self._playwright = await self.playwright_factory().start()
+                browser = await self._playwright.chromium.launch(headless=headless, args=self.launch_args)
+                try:
+                    yield browser
+                finally:
+                    await self._close_quietly(browser)
+            return
+        async with self._leases:
+            slot = await self._checkout_slot()
+            try:
+                yield slot.browser
+            finally:
+                slot.leases -= 1
+
+    @asynccontextmanager
+    async def context(self, setup: Callable[[Any], Awaitable[None]] = None,
+                      options_factory: Callable[[], Dict[str, Any]] = None,
+                      profile: str = None, **options):
+        """
+        Mượn một context (tái sử dụng theo `profile` + `options` của new_context).
+        Page mở trong lease được đóng khi trả; context đóng hẳn khi hết page
+        budget, khi browser chết hoặc lease ném exception.
+
+        setup: `await setup(context)` một lần cho mỗi context mới tạo.
+        options_factory: option thêm cho new_context, gọi lại mỗi lần tạo context
+            (không tính vào key tái sử dụng).
+        profile: tên do caller đặt cho cặp setup/options_factory, bắt buộc khi
+            truyền một trong hai - context chỉ dùng lại trong cùng profile
+            (closure/lambda không cho key ổn định). Mỗi profile một setup cố định.
+        """
+        if (setup is not None or options_factory is not None) and not profile:
+            raise ValueError("browser_pool.context: setup/options_factory cần `profile`")
+        self._bind_loop()
+        # Giữ chính corpus trong key (không dùng id): id có thể bị tái sử dụng sau GC
+        key = (profile, repr(sorted(options.items())), active_corpus())
+        async with self._leases:
+            slot = await self._checkout_slot()
+            pooled = None
+            ok = False
+            try:
+                idle = slot.idle_contexts.get(key) or []
+                while idle and pooled is None:
+                    candidate = idle.pop()
+                    if candidate.pages_opened < self.page_budget:
+                        pooled = candidate
+                    else:
+                        await self._close_quietly(candidate.context)
+                if pooled is None:
+                    extra = options_factory() if options_factory else {}
+                    pooled = _PooledContext(await slot.browser.new_context(**options, **extra))
+                    await install_active_corpus(pooled.context)
+                    if setup is not None:
+                        await setup(pooled.context)
+                yield pooled.context
+                ok = True
+            finally:
+                slot.leases -= 1
+                if pooled is not None:
+                    await self._release_context(slot, key, pooled, ok)
+
+    @asynccontextmanager
+    async def page(self, **options):
+        """Mượn một page mới trên context tái sử dụng (xem `context`)."""
+        async with self.context(**options) as context:
+            yield await context.new_page()
+
+    async def _release_context(self, slot: _BrowserSlot, key: tuple, pooled: _PooledContext, ok: bool):
+        reusable = (
+            ok and slot.is_alive() and slot in self._slots
+            and pooled.pages_opened < self.page_budget
+            and len(slot.idle_contexts.get(key, ())) < self.idle_contexts
+        )
+        if reusable:
+            try:
+                for page in list(pooled.context.pages):
+                    await page.close()
+            except Exception:
+                reusable = False
+        if reusable:
+            slot.idle_contexts.setdefault(key, []).append(pooled)
+        else:
+            await self._close_quietly(pooled.context)
+
+    async def close(self):
+        """Đóng toàn bộ browser + Playwright (gọi lúc shutdown)."""
+        if self._loop is None or self._loop is not asyncio.get_running_loop():
+            self._reset()
+            return
+        async with self._lock:
+            for slot in self._slots:
+                for contexts in slot.idle_contexts.values():
+                    for pooled in contexts:
+                        await self._close_quietly(pooled.context)
+                await self._close_quietly(slot.browser)
+            self._slots = []
+            await self._stop_playwright()
+
+    async def _stop_playwright(self):
+        if self._playwright is not None:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    @staticmethod
+    async def _close_quietly(target):
+        try:
+            await target.close()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "browsers": len(self._slots),
+            "leases": [slot.leases for slot in self._slots],
+            "idle_contexts": sum(len(v) for slot in self._slots for v in slot.idle_contexts.values()),
+            "launches": self.launches,
+        }
+
+
+# Singleton dùng chung cho core_drug, core_icd, web_crawler_v2 và agent search
+browser_pool = BrowserPool()
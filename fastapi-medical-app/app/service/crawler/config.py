@@ -45,7 +45,11 @@ def get_drug_web_config():
                 "chi_dinh": ["#section-1"],
                 "chong_chi_dinh": ["#section-2"]
             },
-            "popup_selectors": [".close-button", "button[aria-label='Close']"]
+            "popup_selectors": [".close-button", "button[aria-label='Close']"],
+            # Trang search + chi tiết render phía server -> thử httpx + lxml trước Playwright
+            "fast_tier": {
+                "search_url": "https://www.thuocbietduoc.com.vn/thuoc/drgsearch.aspx?key={keyword}"
+            }
         },
         {
             "site_name": "TrungTamThuoc",
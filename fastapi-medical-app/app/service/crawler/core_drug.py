@@ -1,7 +1,12 @@
 import time
 import asyncio
+from contextlib import asynccontextmanager
+from .browser_pool import browser_pool
 from .utils import logger, SCREENSHOT_DIR
 from .extractors import extract_drug_details
+from .http_fetch import fast_scrape_site_drug
+from .replay import install_active_corpus
+from .scheduler import crawl_scheduler
 from .stealth_config import (
     STEALTH_INIT_SCRIPT, 
     get_random_user_agent,
@@ -42,6 +47,66 @@ async def try_selectors(page, selectors, timeout=5000):
     
     return None, None
 
+async def goto(page, url, timeout=60000, wait_until="domcontentloaded"):
+    """page.goto dưới giới hạn theo domain của crawl_scheduler (mọi navigation của crawler)."""
+    async with crawl_scheduler.domain_slot(url):
+        return await page.goto(url, timeout=timeout, wait_until=wait_until)
+
+# Option context cố định cho mọi site thuốc -> browser_pool tái sử dụng context
+DRUG_CONTEXT_OPTIONS = {
+    "ignore_https_errors": True,
+    "viewport": {'width': 1920, 'height': 1080},  # Larger viewport
+    "locale": "vi-VN",
+    "timezone_id": "Asia/Ho_Chi_Minh",
+}
+
+def drug_context_options():
+    """Stealth: Random UA - chọn lại mỗi khi pool tạo context mới."""
+    return {"user_agent": get_random_user_agent()}
+
+async def setup_drug_context(context):
+    """Chạy một lần cho mỗi context: anti-detection script."""
+    await context.add_init_script(STEALTH_INIT_SCRIPT)
+
+@asynccontextmanager
+async def drug_context(browser=None):
+    """
+    Context cho scrape thuốc. Mặc định mượn từ browser_pool (context ấm, page
+    budget); `browser` riêng (debug headless=False) -> context dùng một lần.
+    """
+    if browser is None:
+        async with browser_pool.context(
+            setup=setup_drug_context, options_factory=drug_context_options, profile="drug",
+            **DRUG_CONTEXT_OPTIONS
+        ) as context:
+            yield context
+        return
+    context = await browser.new_context(**DRUG_CONTEXT_OPTIONS, **drug_context_options())
+    try:
+        # Replay mode: trang lấy từ fixture corpus (CRAWL_REPLAY_DIR), không ra mạng
+        await install_active_corpus(context)
+        await setup_drug_context(context)
+        yield context
+    finally:
+        await context.close()
+
+async def submit_search(page, submit, site_name, timeout=10000):
+    """
+    Submit form search rồi chờ trang kết quả. Trang trước khi search (vd. trang chủ
+    NhaThuocLongChau đã có link /thuoc/) cũng khớp item_container, nên phải chờ
+    navigation xong rồi mới chờ list - nếu không sẽ đọc nhầm link của trang cũ.
+    """
+    try:
+        async with page.expect_navigation(wait_until="domcontentloaded", timeout=timeout):
+            await submit()
+    except Exception as e:
+        # Search render bằng JS (URL không đổi) -> chờ request của search xong
+        logger.info(f"[{site_name}] No navigation after search submit ({e}), waiting for network idle")
+        try:
+            await page.wait_for_load_state("networkidle", timeout=timeout // 2)
+        except Exception:
+            pass
+
 async def register_auto_popups(page, selectors=None):
     """
     Register auto-closing handlers for popups.
@@ -90,37 +155,59 @@ async def handle_popups(page, selectors=None):
 
 async def scrape_single_site_drug(browser, site_config, keyword, direct_url=None):
     """
-    Logic cào thuốc (v6 - Popup Handling & Improved Stability)
+    Logic cào thuốc (v7 - HTTP fast tier trước Playwright)
+
+    Site có `fast_tier` trong config được thử bằng httpx + lxml trước; chỉ trang
+    không trích được SĐK/hoạt chất (hoặc search không ra link tĩnh) mới mở Chromium.
+    """
+    site_name = site_config.get('site_name', 'Unknown')
+    try:
+        fast = await fast_scrape_site_drug(site_config, keyword, direct_url=direct_url)
+    except Exception as e:
+        logger.warning(f"[{site_name}] HTTP fast tier failed, using browser: {e}")
+        fast = None
+    if fast is None:
+        return await scrape_single_site_drug_browser(browser, site_config, keyword, direct_url=direct_url)
+
+    results, escalate_links = fast
+    for link in escalate_links:
+        logger.info(f"[{site_name}] Escalating to browser: {link}")
+        results.extend(await scrape_single_site_drug_browser(browser, site_config, keyword, direct_url=link))
+    return results
+
+
+async def scrape_single_site_drug_browser(browser, site_config, keyword, direct_url=None):
+    """
+    Logic cào thuốc bằng Playwright (v6 - Popup Handling & Improved Stability)
     """
     site_name = site_config.get('site_name', 'Unknown')
-    url = site_config.get('url')
-    results = []
     
     start_time = time.time()
     logger.info(f"[{site_name}] STARTER - Clean Keyword: '{keyword}'")
     
+    async with drug_context(browser) as context:
+        results = await _scrape_in_context(context, site_config, keyword, direct_url)
+    elapsed = time.time() - start_time
+    logger.info(f"[{site_name}] FINISHED in {elapsed:.2f}s")
+    return results
+
+
+async def _scrape_in_context(context, site_config, keyword, direct_url=None):
+    """Search / detail trên một context (page được pool đóng khi trả context)."""
+    site_name = site_config.get('site_name', 'Unknown')
+    url = site_config.get('url')
+    results = []
     popup_selectors = site_config.get('popup_selectors', [])
-    
-    context = await browser.new_context(
-        user_agent=get_random_user_agent(),  # Stealth: Random UA
-        ignore_https_errors=True,
-        viewport={'width': 1920, 'height': 1080},  # Larger viewport
-        locale="vi-VN",
-        timezone_id="Asia/Ho_Chi_Minh",
-    )
-    
-    # Stealth: Inject anti-detection script
-    await context.add_init_script(STEALTH_INIT_SCRIPT)
-    
+
     page = await context.new_page()
     
     # Block heavy resources
-    # Block heavy resources
+    # (fallback -> route của context nếu có, mặc định ra mạng như continue_)
     async def block_resources(route):
         if route.request.resource_type in ["image", "font", "media", "other"]:
             await route.abort()
         else:
-            await route.continue_()
+            await route.fallback()
     await page.route("**/*", block_resources)
     
     page.set_default_timeout(60000)
@@ -129,8 +216,7 @@ async def scrape_single_site_drug(browser, site_config, keyword, direct_url=None
         # --- DIRECT URL PATH ---
         if direct_url:
             logger.info(f"[{site_name}] Navigating directly to: {direct_url}")
-            await page.goto(direct_url, timeout=60000, wait_until="domcontentloaded")
-            await page.goto(direct_url, timeout=60000, wait_until="domcontentloaded")
+            await goto(page, direct_url)
             # await register_auto_popups(page, popup_selectors)
             await handle_popups(page, popup_selectors)
             
@@ -145,8 +231,7 @@ async def scrape_single_site_drug(browser, site_config, keyword, direct_url=None
         # --- ORIGINAL SEARCH PATH ---
         else:
             logger.info(f"[{site_name}] Navigating to search: {url}")
-            await page.goto(url, timeout=60000, wait_until="domcontentloaded")
-            await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+            await goto(page, url)
             # await register_auto_popups(page, popup_selectors)
             await handle_popups(page, popup_selectors)
             
@@ -161,34 +246,33 @@ async def scrape_single_site_drug(browser, site_config, keyword, direct_url=None
             await input_el.fill(keyword)
             
             action_type = search_cfg.get('action_type', 'ENTER')
-            if action_type == "ENTER":
-                await page.keyboard.press("Enter")
-            else:
+            btn_el = None
+            if action_type != "ENTER":
                 btn_sels = search_cfg.get('button_selectors', [])
                 _, btn_el = await try_selectors(page, btn_sels, timeout=5000)
+            
+            async def submit():
                 if btn_el:
                     await btn_el.click()
                 else:
                     await page.keyboard.press("Enter")
             
-            # Stabilization wait after search
-            logger.info(f"[{site_name}] Waiting for results to load...")
-            await asyncio.sleep(4) 
-            await asyncio.sleep(4) 
-            await handle_popups(page, popup_selectors)
+            await submit_search(page, submit, site_name)
             
             # --- LIST PHASE ---
             list_cfg = site_config.get('list_logic', {})
             container_sel = list_cfg.get('item_container', 'a')
             
             try:
-                # Use wait_for_selector for robustness
+                # Trang kết quả đã load (submit_search) -> chờ chính list thay vì sleep cố định
+                logger.info(f"[{site_name}] Waiting for results to load...")
                 effective_sel = f"xpath={container_sel}" if container_sel.startswith("//") else container_sel
                 await page.wait_for_selector(effective_sel, timeout=15000)
                 items = page.locator(effective_sel)
             except:
                 logger.warning(f"[{site_name}] No list items found with {container_sel}")
                 return []
+            await handle_popups(page, popup_selectors)
             
             count = await items.count()
             logger.info(f"[{site_name}] Found {count} items.")
@@ -215,8 +299,7 @@ async def scrape_single_site_drug(browser, site_config, keyword, direct_url=None
                     try:
                         detail_page = await context.new_page()
                         await detail_page.route("**/*", block_resources)
-                        await detail_page.goto(link_url, timeout=60000, wait_until="domcontentloaded")
-                        await detail_page.goto(link_url, timeout=60000, wait_until="domcontentloaded")
+                        await goto(detail_page, link_url)
                         # await register_auto_popups(detail_page, popup_selectors)
                         await handle_popups(detail_page, popup_selectors)
                         
@@ -238,9 +321,5 @@ async def scrape_single_site_drug(browser, site_config, keyword, direct_url=None
             
     except Exception as e:
         logger.error(f"[{site_name}] GLOBAL ERROR: {e}")
-    finally:
-        await context.close()
-        elapsed = time.time() - start_time
-        logger.info(f"[{site_name}] FINISHED in {elapsed:.2f}s")
-            
+        
     return results
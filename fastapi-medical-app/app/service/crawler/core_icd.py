@@ -1,5 +1,6 @@
 import asyncio
-from playwright.async_api import async_playwright
+from .browser_pool import browser_pool
+from .core_drug import goto
 from .config import get_icd_web_config
 
 async def scrape_single_site_icd(site_config, keyword):
@@ -7,14 +8,10 @@ async def scrape_single_site_icd(site_config, keyword):
     site_name = site_config['TenTrang']
     results = []
     
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
-        
+    async with browser_pool.page() as page:
         try:
             print(f"   -> [Web] Truy cập: {site_name}")
-            await page.goto(site_config['URL'], timeout=60000)
+            await goto(page, site_config['URL'], timeout=60000, wait_until="load")
             await page.locator(site_config['XPath_Input_Search']).fill(keyword)
             await page.keyboard.press("Enter")
             
@@ -71,8 +68,6 @@ async def scrape_single_site_icd(site_config, keyword):
                     "Content": content.strip()
                 })
         except: pass
-        finally:
-            await browser.close()
     return results
 
 async def search_icd_online(keyword):
@@ -1,6 +1,43 @@
+import functools
 import re
+import time
 from .utils import parse_drug_info
 
+# lxml (+ cssselect) cho extractor HTML tĩnh của fast tier - thiếu thì fast tier tắt
+try:
+    import lxml.html
+    from lxml import etree
+    from lxml.cssselect import CSSSelector
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# Mapping: Tên trường -> Các Label có thể xuất hiện trên UI
+# (dùng chung cho extractor Playwright và extractor HTML tĩnh)
+SIBLING_LABELS = {
+    "so_dang_ky": ["Số đăng ký", "SĐK", "Reg.No", "Sđk"],
+    "dang_bao_che": ["Dạng bào chế", "Bào chế", "Dạng chế phẩm"],
+    "quy_cach_dong_goi": ["Quy cách đóng gói", "Đóng gói", "Quy cách"],
+    "cong_ty_sx": ["Công ty sản xuất", "Nhà sản xuất", "Cơ sở sản xuất", "Sản xuất bởi"],
+    "nuoc_sx": ["Nước sản xuất", "Xuất xứ"],
+    "cong_ty_dk": ["Công ty đăng ký", "Đơn vị đăng ký", "Cơ sở đăng ký"],
+    "nhom_thuoc": ["Nhóm thuốc", "Danh mục", "Loại thuốc"],
+    "ham_luong": ["Hàm lượng", "Nồng độ", "Thành phần hàm lượng"]
+}
+
+SECTION_LABELS = {
+    "chi_dinh": ["Chỉ định", "Chỉ định điều trị", "Công dụng", "Chỉ định và công dụng"],
+    "chong_chi_dinh": ["Chống chỉ định", "Chống chỉ định và thận trọng"],
+    "lieu_dung": ["Liều dùng", "Cách dùng", "Hướng dẫn sử dụng", "Liều dùng và cách dùng"],
+    "tac_dung_phu": ["Tác dụng phụ", "Tác dụng không mong muốn", "Phản ứng có hại"],
+    "than_trong": ["Thận trọng", "Lưu ý", "Cảnh báo và thận trọng"]
+}
+
+SIBLING_XPATH = "//*[self::div or self::p or self::span or self::td][contains(text(), '{label}')]/following-sibling::*[self::div or self::p or self::span or self::td]"
+SECTION_START_XPATH = "//h2[contains(., '{label}')] | //h3[contains(., '{label}')]"
+FULL_CONTENT_SELECTOR = "main, #content, .content, article, body"
+
+
 async def extract_drug_details(target, site_config, site_name, logger):
     """
     Trích xuất dữ liệu chi tiết thuốc sử dụng Playwright Page/Locator.
@@ -19,7 +56,7 @@ async def extract_drug_details(target, site_config, site_name, logger):
         """
         try:
             # Tìm node bắt đầu chứa label
-            start_xpath = f"//h2[contains(., '{start_label}')] | //h3[contains(., '{start_label}')]"
+            start_xpath = SECTION_START_XPATH.format(label=start_label)
             start_loc = page.locator(f"xpath={start_xpath}").first
             if await start_loc.count() == 0: return None
 
@@ -47,7 +84,7 @@ async def extract_drug_details(target, site_config, site_name, logger):
     # --- 1. LẤY FULL CONTENT (Dùng cho RAG/Search) ---
     try:
         # Ưu tiên lấy trong vùng nội dung chính để loại bỏ header/footer
-        main_content = target.locator("main, #content, .content, article, body")
+        main_content = target.locator(FULL_CONTENT_SELECTOR)
         if await main_content.count() > 0:
             full_content = await main_content.first.inner_text()
         else:
@@ -59,26 +96,6 @@ async def extract_drug_details(target, site_config, site_name, logger):
     # --- 2. CHIẾN THUẬT: SIBLING FINDING & SECTION RANGE (Logic chính) ---
     # Tìm kiếm label -> lấy nội dung anh em hoặc nội dung trong range H2/H3
     
-    # Mapping: Tên trường -> Các Label có thể xuất hiện trên UI
-    sibling_map = {
-        "so_dang_ky": ["Số đăng ký", "SĐK", "Reg.No", "Sđk"],
-        "dang_bao_che": ["Dạng bào chế", "Bào chế", "Dạng chế phẩm"],
-        "quy_cach_dong_goi": ["Quy cách đóng gói", "Đóng gói", "Quy cách"],
-        "cong_ty_sx": ["Công ty sản xuất", "Nhà sản xuất", "Cơ sở sản xuất", "Sản xuất bởi"],
-        "nuoc_sx": ["Nước sản xuất", "Xuất xứ"],
-        "cong_ty_dk": ["Công ty đăng ký", "Đơn vị đăng ký", "Cơ sở đăng ký"],
-        "nhom_thuoc": ["Nhóm thuốc", "Danh mục", "Loại thuốc"],
-        "ham_luong": ["Hàm lượng", "Nồng độ", "Thành phần hàm lượng"]
-    }
-
-    section_map = {
-        "chi_dinh": ["Chỉ định", "Chỉ định điều trị", "Công dụng", "Chỉ định và công dụng"],
-        "chong_chi_dinh": ["Chống chỉ định", "Chống chỉ định và thận trọng"],
-        "lieu_dung": ["Liều dùng", "Cách dùng", "Hướng dẫn sử dụng", "Liều dùng và cách dùng"],
-        "tac_dung_phu": ["Tác dụng phụ", "Tác dụng không mong muốn", "Phản ứng có hại"],
-        "than_trong": ["Thận trọng", "Lưu ý", "Cảnh báo và thận trọng"]
-    }
-
     # A. Xử lý các trường đặc biệt (Class/Tag cụ thể)
     try:
         # Tên thuốc (thường là H1 hoặc class cụ thể)
@@ -92,12 +109,12 @@ async def extract_drug_details(target, site_config, site_name, logger):
         pass
 
     # B. Xử lý các trường Sibling (Label -> Value)
-    for field, labels in sibling_map.items():
+    for field, labels in SIBLING_LABELS.items():
         if field in extracted_fields: continue
 
         for label in labels:
             # Ưu tiên các div/p/span chứa chính xác label
-            xpath = f"//*[self::div or self::p or self::span or self::td][contains(text(), '{label}')]/following-sibling::*[self::div or self::p or self::span or self::td]"
+            xpath = SIBLING_XPATH.format(label=label)
             try:
                 loc = target.locator(f"xpath={xpath}")
                 if await loc.count() > 0:
@@ -110,7 +127,7 @@ async def extract_drug_details(target, site_config, site_name, logger):
                 continue
 
     # C. Xử lý các trường Section Range (H2/H3 blocks)
-    for field, labels in section_map.items():
+    for field, labels in SECTION_LABELS.items():
         if field in extracted_fields and extracted_fields[field]: continue
         for label in labels:
             content = await extract_section_range(target, label)
@@ -143,3 +160,176 @@ async def extract_drug_details(target, site_config, site_name, logger):
                     continue
     
     return full_content, extracted_fields
+
+
+# =========================================================================
+# Extractor HTML tĩnh (fast tier - httpx + lxml, không cần Chromium)
+# =========================================================================
+
+_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "tbody", "td", "th",
+    "thead", "tr", "ul",
+}
+_SKIP_TAGS = {"script", "style", "noscript", "template", "head"}
+
+
+def html_inner_text(element):
+    """
+    Xấp xỉ `inner_text()` của Playwright trên cây lxml: block element xuống dòng,
+    bỏ script/style, gộp khoảng trắng trong từng dòng.
+    """
+    parts = []
+
+    def walk(el):
+        tag = el.tag if isinstance(el.tag, str) else ""
+        if tag in _SKIP_TAGS:
+            if el.tail:
+                parts.append(el.tail)
+            return
+        block = tag in _BLOCK_TAGS
+        if block:
+            parts.append("\n")
+        if el.text and tag:
+            parts.append(el.text)
+        for child in el:
+            walk(child)
+        if block:
+            parts.append("\n")
+        if el.tail:
+            parts.append(el.tail)
+
+    tail, element.tail = element.tail, None  # tail không thuộc element
+    try:
+        walk(element)
+    finally:
+        element.tail = tail
+    lines = (re.sub(r"[ \t\r\f\v\xa0]+", " ", line).strip() for line in "".join(parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+@functools.lru_cache(maxsize=512)
+def _compile_selector(selector):
+    """Selector config -> lxml XPath/CSSSelector đã compile (tái sử dụng giữa các trang)."""
+    if selector.startswith("xpath="):
+        xpath = selector[len("xpath="):]
+    elif selector.startswith(("//", "./", "/html")):
+        xpath = selector
+    else:
+        return CSSSelector(selector)
+    if xpath == ".":
+        return lambda element: [element]
+    return etree.XPath(xpath)
+
+
+def select_html(root, selector):
+    """
+    Chạy selector trong config (CSS, `xpath=...` hoặc `//...`) trên cây lxml -
+    cùng cú pháp `try_selectors`/`extract_drug_details` dùng với Playwright.
+    """
+    if not selector:
+        return []
+    return [node for node in _compile_selector(selector)(root) if hasattr(node, "tag")]
+
+
+def parse_html(html, base_url=None):
+    root = lxml.html.fromstring(html)
+    if base_url:
+        root.make_links_absolute(base_url, resolve_base_href=True)
+    return root
+
+
+def extract_drug_details_html(html, site_config, site_name, logger, base_url=None, timings=None):
+    """
+    Bản tĩnh của `extract_drug_details` trên HTML server-render: cùng thứ tự chiến thuật
+    (h1/.ingredient-content -> sibling label -> section H2/H3 -> selector trong config),
+    trả về (full_content, extracted_fields) cùng định dạng.
+
+    timings: dict tuỳ chọn, cộng dồn số giây theo field (+ "_parse", "_content") - cho benchmark.
+    """
+    fields_config = site_config.get('fields', {})
+    extracted_fields = {}
+
+    def spent(key, started):
+        if timings is not None:
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        root = html if hasattr(html, "xpath") else parse_html(html, base_url)
+    except Exception as e:
+        logger.warning(f"[{site_name}] HTML parse failed: {e}")
+        return "", {}
+    spent("_parse", started)
+
+    def first_text(nodes):
+        for node in nodes[:1]:
+            return html_inner_text(node).strip()
+        return None
+
+    # --- 1. FULL CONTENT ---
+    started = time.perf_counter()
+    full_content = first_text(select_html(root, FULL_CONTENT_SELECTOR)) or html_inner_text(root)
+    spent("_content", started)
+
+    # --- 2A. Trường đặc biệt ---
+    started = time.perf_counter()
+    ten_thuoc = first_text(select_html(root, "//h1"))
+    if ten_thuoc is not None:
+        extracted_fields["ten_thuoc"] = ten_thuoc
+    spent("ten_thuoc", started)
+    started = time.perf_counter()
+    hoat_chat = first_text(select_html(root, ".ingredient-content"))
+    if hoat_chat is not None:
+        extracted_fields["hoat_chat"] = hoat_chat
+    spent("hoat_chat", started)
+
+    # --- 2B. Sibling (Label -> Value) ---
+    for field, labels in SIBLING_LABELS.items():
+        if field in extracted_fields: continue
+        started = time.perf_counter()
+        for label in labels:
+            val = (first_text(select_html(root, SIBLING_XPATH.format(label=label))) or "").lstrip(":").strip()
+            if val:
+                extracted_fields[field] = val
+                break
+        spent(field, started)
+
+    # --- 2C. Section Range (H2/H3) ---
+    for field, labels in SECTION_LABELS.items():
+        if extracted_fields.get(field): continue
+        started = time.perf_counter()
+        for label in labels:
+            starts = select_html(root, SECTION_START_XPATH.format(label=label))
+            if not starts:
+                continue
+            texts = []
+            for node in starts[0].itersiblings():
+                if not isinstance(node.tag, str):
+                    continue
+                if node.tag in ("h2", "h3"):
+                    break
+                texts.append(html_inner_text(node))
+            content = "\n".join(t.strip() for t in texts if t.strip())
+            if content:
+                extracted_fields[field] = content
+                break
+        spent(field, started)
+
+    # --- 3. CONFIG-BASED ---
+    for field, selectors in fields_config.items():
+        if extracted_fields.get(field):
+            continue
+        started = time.perf_counter()
+        for sel in selectors:
+            try:
+                val = first_text(select_html(root, sel))
+            except Exception:
+                continue
+            if val:
+                extracted_fields[field] = val
+                break
+        spent(field, started)
+
+    return full_content, extracted_fields
@@ -1,31 +1,146 @@
 """
 Google Search Service for finding drug detail pages.
 Uses Google's site-specific search to find direct URLs quickly.
+
+- `find_drug_url_async`: không chặn event loop - lookup chạy trong threadpool,
+  tối đa GOOGLE_SEARCH_MAX_IN_FLIGHT lookup cùng lúc (toàn process), kết quả
+  (kể cả không tìm thấy) lưu bền trong bảng `search_url_cache` có TTL.
+- Backend thay được: GOOGLE_SEARCH_BACKEND=stub đọc kết quả từ file JSON
+  GOOGLE_SEARCH_STUB_FILE ({"tên thuốc": ["url", ...]}) để chạy offline / test.
 """
+import asyncio
+import functools
+import json
 import logging
-from typing import Optional, List
-from googlesearch import search
+import os
+import weakref
+from typing import Callable, Dict, Iterable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from .replay import active_corpus
+
+try:
+    from googlesearch import search
+except ImportError:
+    search = None
 
 logger = logging.getLogger(__name__)
 
+GOOGLE_SEARCH_MAX_IN_FLIGHT = int(os.getenv("GOOGLE_SEARCH_MAX_IN_FLIGHT", "2"))
+GOOGLE_SEARCH_BACKEND = os.getenv("GOOGLE_SEARCH_BACKEND", "google")
+GOOGLE_SEARCH_STUB_FILE = os.getenv("GOOGLE_SEARCH_STUB_FILE", "")
+
+
+def google_backend(query: str, num_results: int) -> Iterable[str]:
+    """Backend mặc định: thư viện googlesearch-python (gọi HTTP tới Google, blocking)."""
+    if search is None:
+        raise RuntimeError("googlesearch-python is not installed")
+    return search(query, num_results=num_results, lang='vi')
+
+
+class StubSearchBackend:
+    """
+    Backend offline: trả URL theo tên thuốc (không phân biệt hoa thường, bỏ phần
+    `site:...` của query). Dùng cho test và chạy crawler không cần mạng.
+    """
+
+    def __init__(self, results: Dict[str, List[str]] = None, path: str = None):
+        if results is None and path:
+            with open(path, encoding="utf-8") as f:
+                results = json.load(f)
+        self.results = {k.strip().lower(): list(v) for k, v in (results or {}).items()}
+        self.queries: List[str] = []
+
+    def __call__(self, query: str, num_results: int) -> Iterable[str]:
+        self.queries.append(query)
+        terms = " ".join(t for t in query.split() if not t.startswith("site:"))
+        return self.results.get(terms.strip().lower(), [])[:num_results]
+
+
+_replay_backends = weakref.WeakKeyDictionary()  # FixtureCorpus -> StubSearchBackend
+
+
+@functools.lru_cache(maxsize=None)
+def _file_stub_backend(path: Optional[str]) -> StubSearchBackend:
+    return StubSearchBackend(path=path)
+
+
+def default_backend() -> Callable[[str, int], Iterable[str]]:
+    """Backend theo cấu hình hiện tại - gọi mỗi lookup nên replay bật/tắt lúc chạy vẫn có hiệu lực."""
+    corpus = active_corpus()
+    if corpus is not None:
+        # Replay mode: kết quả search ghi sẵn trong manifest của corpus
+        backend = _replay_backends.get(corpus)
+        if backend is None:
+            backend = _replay_backends[corpus] = StubSearchBackend(corpus.search)
+        return backend
+    if GOOGLE_SEARCH_BACKEND == "stub":
+        return _file_stub_backend(GOOGLE_SEARCH_STUB_FILE or None)
+    return google_backend
+
+
 class GoogleSearchService:
     """
     Service to find drug detail pages using Google Search.
     Much faster and more accurate than internal site search.
     """
-    
-    def __init__(self, domain: str = "thuocbietduoc.com.vn"):
+
+    # Semaphore giới hạn lookup đồng thời, dùng chung mọi instance (một cái mỗi event loop)
+    _semaphores = weakref.WeakKeyDictionary()
+
+    def __init__(self, domain: str = "thuocbietduoc.com.vn", backend: Callable[[str, int], Iterable[str]] = None,
+                 url_cache=None, max_in_flight: int = None):
         """
         Initialize Google Search Service.
         
         Args:
             domain: Target domain to search within
+            backend: callable(query, num_results) -> URLs (mặc định theo GOOGLE_SEARCH_BACKEND)
+            url_cache: SearchUrlCacheService (mặc định: DB của app)
+            max_in_flight: số lookup đồng thời tối đa
         """
         self.domain = domain
-        
+        self._backend = backend  # None -> default_backend() ở mỗi lookup
+        if url_cache is None:
+            from app.service.scrape_cache_service import SearchUrlCacheService
+            url_cache = SearchUrlCacheService()
+        self.url_cache = url_cache
+        self.max_in_flight = max(1, max_in_flight or GOOGLE_SEARCH_MAX_IN_FLIGHT)
+
+    @property
+    def backend(self) -> Callable[[str, int], Iterable[str]]:
+        return self._backend or default_backend()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    async def find_drug_url_async(self, drug_name: str, max_results: int = 5) -> Optional[str]:
+        """
+        Bản async của `find_drug_url`: tra cache, search (bounded) và ghi cache
+        đều chạy trong threadpool. Lỗi search (vd. bị Google chặn) không cache.
+        """
+        cached = await run_in_threadpool(self.url_cache.get, self.domain, drug_name)
+        if cached is not None:
+            logger.info(f"[GoogleSearch] Cache hit for '{drug_name}': {cached['url']}")
+            return cached["url"]
+        async with self._semaphore():
+            try:
+                url = await run_in_threadpool(self._search, drug_name, max_results)
+            except Exception as e:
+                logger.error(f"[GoogleSearch] Error: {e}")
+                return None
+        await run_in_threadpool(self.url_cache.put, self.domain, drug_name, url)
+        return url
+
     def find_drug_url(self, drug_name: str, max_results: int = 5) -> Optional[str]:
         """
         Find direct URL to drug detail page using Google Search.
+        Blocking - trong code async dùng `find_drug_url_async`.
         
         Args:
             drug_name: Name of the drug to search
@@ -34,26 +149,33 @@ class GoogleSearchService:
         Returns:
             Direct URL to drug page or None if not found
         """
+        cached = self.url_cache.get(self.domain, drug_name)
+        if cached is not None:
+            return cached["url"]
         try:
-            # Construct Google search query: site:domain.com drug_name
-            query = f"site:{self.domain} {drug_name}"
-            logger.info(f"[GoogleSearch] Query: '{query}'")
-            
-            # Search and filter results
-            for idx, url in enumerate(search(query, num_results=max_results, lang='vi')):
-                logger.info(f"[GoogleSearch] Result {idx+1}: {url}")
-                
-                # Filter: Must be from target domain and look like detail page
-                if self.domain in url and self._is_detail_page(url):
-                    logger.info(f"[GoogleSearch] ✓ Selected: {url}")
-                    return url
-                    
-            logger.warning(f"[GoogleSearch] No valid URL found for '{drug_name}'")
-            return None
-            
+            url = self._search(drug_name, max_results)
         except Exception as e:
             logger.error(f"[GoogleSearch] Error: {e}")
             return None
+        self.url_cache.put(self.domain, drug_name, url)
+        return url
+
+    def _search(self, drug_name: str, max_results: int) -> Optional[str]:
+        # Construct Google search query: site:domain.com drug_name
+        query = f"site:{self.domain} {drug_name}"
+        logger.info(f"[GoogleSearch] Query: '{query}'")
+        
+        # Search and filter results
+        for idx, url in enumerate(self.backend(query, max_results)):
+            logger.info(f"[GoogleSearch] Result {idx+1}: {url}")
+            
+            # Filter: Must be from target domain and look like detail page
+            if self.domain in url and self._is_detail_page(url):
+                logger.info(f"[GoogleSearch] ✓ Selected: {url}")
+                return url
+                
+        logger.warning(f"[GoogleSearch] No valid URL found for '{drug_name}'")
+        return None
     
     def _is_detail_page(self, url: str) -> bool:
         """
@@ -79,3 +201,14 @@ class GoogleSearchService:
             
         # Check if it matches detail patterns
         return any(pattern in url_lower for pattern in detail_patterns)
+
+
+_services: Dict[str, GoogleSearchService] = {}
+
+
+def get_google_search_service(domain: str = "thuocbietduoc.com.vn") -> GoogleSearchService:
+    """Instance dùng chung theo domain (tránh khởi tạo DB cache mỗi lần crawl)."""
+    service = _services.get(domain)
+    if service is None:
+        service = _services[domain] = GoogleSearchService(domain=domain)
+    return service
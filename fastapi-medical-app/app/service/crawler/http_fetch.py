@@ -0,0 +1,185 @@
+"""
+HTTP Fast Tier - cào trang thuốc server-render bằng httpx + lxml trước khi dùng Chromium
+=======================================================================================
+Phần lớn trang chi tiết ThuocBietDuoc render sẵn phía server, nên không cần
+Playwright (context + page + chờ JS) để đọc SĐK / hoạt chất.
+
+- `HttpFetcher`: một `httpx.AsyncClient` dùng chung (keep-alive, giới hạn kết nối),
+  tạo lại khi event loop đổi (giống BrowserPool).
+- `fast_scrape_site_drug`: với site có block `fast_tier` trong config, lấy trang search
+  qua `search_url` (hoặc `direct_url`), đọc link theo `list_logic`/`detail_logic`,
+  tải các trang chi tiết song song và parse bằng `extract_drug_details_html`
+  (cùng field selectors trong `crawler/config.py`).
+- Trang không trích được đủ HTTP_FAST_REQUIRED_FIELDS (so_dang_ky, hoat_chat) được
+  trả về để `scrape_single_site_drug` escalate sang Playwright.
+
+Tắt bằng HTTP_FAST_TIER_ENABLED=0.
+"""
+
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote_plus, urljoin
+
+import httpx
+
+from .extractors import LXML_AVAILABLE, extract_drug_details_html, parse_html, select_html
+from .replay import active_corpus
+from .scheduler import crawl_scheduler
+from .stealth_config import get_random_user_agent
+from .utils import logger, parse_drug_info
+
+HTTP_FAST_TIER_ENABLED = os.getenv("HTTP_FAST_TIER_ENABLED", "1") != "0"
+HTTP_FAST_TIMEOUT = float(os.getenv("HTTP_FAST_TIMEOUT", "10"))
+HTTP_FAST_MAX_CONNECTIONS = int(os.getenv("HTTP_FAST_MAX_CONNECTIONS", "16"))
+HTTP_FAST_REQUIRED_FIELDS = ("so_dang_ky", "hoat_chat")
+
+
+class HttpFetcher:
+    """httpx.AsyncClient dùng chung cho fast tier (connection pool + keep-alive)."""
+
+    def __init__(self, timeout: float = None, max_connections: int = None, transport=None):
+        self.timeout = HTTP_FAST_TIMEOUT if timeout is None else timeout
+        self.max_connections = max_connections or HTTP_FAST_MAX_CONNECTIONS
+        self.transport = transport  # test: httpx.MockTransport
+        self._client = None
+        self._loop = None
+        self._transport_in_use = None
+        self.requests = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        corpus = active_corpus()
+        transport = self.transport or (corpus.transport() if corpus else None)
+        if self._client is None or self._loop is not loop or self._transport_in_use is not transport:
+            # Client của loop cũ (asyncio.run trước đó) không dùng lại được;
+            # replay (CRAWL_REPLAY_DIR) bật/tắt -> đổi transport
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                follow_redirects=True,
+                verify=False,  # giống ignore_https_errors=True của Playwright context
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                headers={
+                    "User-Agent": get_random_user_agent(),
+                    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+                    "Accept-Language": "vi-VN,vi;q=0.9,en;q=0.8",
+                },
+                transport=transport,
+            )
+            self._loop = loop
+            self._transport_in_use = transport
+        return self._client
+
+    async def get_html(self, url: str) -> Optional[str]:
+        """HTML của `url`, None nếu lỗi mạng / status != 200 / không phải HTML."""
+        self.requests += 1
+        try:
+            async with crawl_scheduler.domain_slot(url):
+                response = await self._get_client().get(url)
+        except httpx.HTTPError as e:
+            logger.warning(f"[HttpFast] GET {url} failed: {e}")
+            return None
+        content_type = response.headers.get("content-type", "text/html")
+        if response.status_code != 200 or "html" not in content_type:
+            logger.info(f"[HttpFast] GET {url} -> {response.status_code} ({content_type})")
+            return None
+        return response.text
+
+    async def close(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+
+def fast_tier_enabled(site_config: Dict) -> bool:
+    return HTTP_FAST_TIER_ENABLED and LXML_AVAILABLE and bool(site_config.get("fast_tier"))
+
+
+def has_required_fields(content: str, fields: Dict) -> bool:
+    """Trang đủ dùng khi có SĐK + hoạt chất (từ selector hoặc regex trên content)."""
+    regex = None
+    for field in HTTP_FAST_REQUIRED_FIELDS:
+        if fields.get(field):
+            continue
+        regex = regex if regex is not None else parse_drug_info(content)
+        if not regex.get(field):
+            return False
+    return True
+
+
+def extract_list_links(html: str, site_config: Dict, base_url: str) -> List[str]:
+    """Link trang chi tiết trên trang kết quả search (list_logic + detail_logic.link_xpath)."""
+    list_cfg = site_config.get("list_logic", {})
+    link_xp = site_config.get("detail_logic", {}).get("link_xpath", ".") or "."
+    root = parse_html(html, base_url)
+    links = []
+    for item in select_html(root, list_cfg.get("item_container", "a")):
+        targets = [item] if link_xp == "." else select_html(item, link_xp)
+        href = next((t.get("href") for t in targets if t.get("href")), None)
+        if href:
+            link = urljoin(base_url, href)
+            if link not in links:
+                links.append(link)
+        if len(links) >= list_cfg.get("max_items", 1):
+            break
+    return links
+
+
+async def fast_scrape_site_drug(site_config: Dict, keyword: str, direct_url: str = None,
+                                fetcher: HttpFetcher = None) -> Optional[Tuple[List[Dict], List[str]]]:
+    """
+    Fast tier cho một site. Trả về (results, escalate_links):
+    - results: item cùng định dạng `scrape_single_site_drug` ({Source, Link, Content, _extracted_data})
+    - escalate_links: trang chi tiết cần Playwright (tải lỗi hoặc thiếu SĐK/hoạt chất)
+    None -> fast tier không áp dụng được (site không cấu hình, search không ra link...),
+    caller chạy toàn bộ đường Playwright.
+    """
+    if not fast_tier_enabled(site_config):
+        return None
+    fetcher = fetcher or http_fetcher
+    site_name = site_config.get("site_name", "Unknown")
+
+    if direct_url:
+        links = [direct_url]
+    else:
+        search_url = site_config["fast_tier"].get("search_url")
+        if not search_url:
+            return None
+        search_url = search_url.format(keyword=quote_plus(keyword))
+        html = await fetcher.get_html(search_url)
+        if not html:
+            return None
+        try:
+            links = extract_list_links(html, site_config, search_url)
+        except Exception as e:
+            logger.warning(f"[HttpFast][{site_name}] Could not parse search page: {e}")
+            return None
+        if not links:
+            # Có thể list render bằng JS -> để Playwright search
+            logger.info(f"[HttpFast][{site_name}] No list items in static HTML for '{keyword}'")
+            return None
+
+    async def fetch_detail(link):
+        html = await fetcher.get_html(link)
+        if not html:
+            return None
+        content, fields = extract_drug_details_html(html, site_config, site_name, logger, base_url=link)
+        if not has_required_fields(content, fields):
+            return None
+        return {"Source": site_name, "Link": link, "Content": content, "_extracted_data": fields}
+
+    details = await asyncio.gather(*(fetch_detail(link) for link in links))
+    results = [item for item in details if item]
+    escalate = [link for link, item in zip(links, details) if not item]
+    logger.info(
+        f"[HttpFast][{site_name}] '{keyword}': {len(results)} page(s) parsed, {len(escalate)} escalated to browser"
+    )
+    return results, escalate
+
+
+# Singleton dùng chung (đóng lúc shutdown cùng browser_pool)
+http_fetcher = HttpFetcher()
@@ -1,17 +1,39 @@
 import re
 import asyncio
-from playwright.async_api import async_playwright
+from contextlib import asynccontextmanager
+from .browser_pool import browser_pool
 from .utils import logger, parse_drug_info
 from .config import get_drug_web_config
 from .core_drug import scrape_single_site_drug
-from .google_search import GoogleSearchService
+from .google_search import get_google_search_service
 from .search_engines import search_drug_links
-from .stealth_config import BROWSER_ARGS
 from app.core.utils import normalize_for_search
 
+# Thời gian tối đa cho mỗi site trong một lượt search
+SITE_TIMEOUT_SECONDS = 25.0
+
+@asynccontextmanager
+async def debug_browser(headless=None):
+    """
+    None -> scrape_single_site_drug mượn context từ browser_pool (không giữ lease
+    browser bên ngoài). headless khác cấu hình pool (debug) -> browser riêng.
+    """
+    if headless is None or headless == browser_pool.headless:
+        yield None
+        return
+    async with browser_pool.browser(headless=headless) as browser:
+        yield browser
+
 async def scrape_drug_web_advanced(keyword, **kwargs):
     """
     Advanced Parallel Search & Merge with Google Search Fallback
+
+    kwargs:
+        headless: bool (default True)
+        candidates_out: list - nếu truyền, nhận các candidate đã parse (cho ScrapeCacheService)
+
+    Kết quả not_found có "complete": False nếu có site timeout/lỗi hoặc fallback
+    multi-engine lỗi -> không phải "không có trên web", không nên cache negative.
     """
     config_list = get_drug_web_config()
     
@@ -24,6 +46,8 @@ async def scrape_drug_web_advanced(keyword, **kwargs):
     
     # Try multiple search variants if needed
     variants = [clean_kw]
+    # Site/engine timeout hoặc lỗi trong lượt này (lỗi tạm thời, không phải "không tìm thấy")
+    failures = []
     
     # Fallback variant: Try only the first word or words before the first number
     if " " in clean_kw:
@@ -31,81 +55,68 @@ async def scrape_drug_web_advanced(keyword, **kwargs):
         if simplified and simplified != clean_kw and len(simplified) > 2:
             variants.append(simplified)
 
-    async with async_playwright() as p:
-        # Allow headless toggle for debugging
-        headless_mode = kwargs.get('headless', True) # Support passing via function arg
-        display_mode = False if headless_mode is False else True # Logic inversion fix: launch(headless=True) is default
-        
-        # Better: just use a variable
-        is_headless = True
-        if "headless" in kwargs:
-             is_headless = kwargs["headless"]
-        
-        browser = await p.chromium.launch(
-            headless=is_headless,
-            args=BROWSER_ARGS  # Use centralized stealth config
-        )
-        try:
-            # --- GOOGLE SEARCH FIRST STRATEGY (NEW) ---
-            google_service = GoogleSearchService(domain="thuocbietduoc.com.vn")
+    # Context ấm từ browser_pool (browser=None); headless=False để debug -> browser riêng
+    async with debug_browser(kwargs.get("headless")) as browser:
+        # --- GOOGLE SEARCH FIRST STRATEGY (NEW) ---
+        google_service = get_google_search_service("thuocbietduoc.com.vn")
             
-            for kw_variant in variants:
-                logger.info(f"[WebAdvanced] Attempting search with: '{kw_variant}'")
+        for kw_variant in variants:
+            logger.info(f"[WebAdvanced] Attempting search with: '{kw_variant}'")
                 
-                # Try Google Search first for ThuocBietDuoc
-                direct_url = None
-                try:
-                    logger.info(f"[GoogleSearch] Searching for direct URL...")
-                    direct_url = google_service.find_drug_url(kw_variant)
-                except Exception as e:
-                    logger.warning(f"[GoogleSearch] Failed: {e}")
+            # Try Google Search first for ThuocBietDuoc
+            direct_url = None
+            try:
+                logger.info(f"[GoogleSearch] Searching for direct URL...")
+                direct_url = await google_service.find_drug_url_async(kw_variant)
+            except Exception as e:
+                logger.warning(f"[GoogleSearch] Failed: {e}")
                 
 
                 
-                # Use asyncio.gather with return_exceptions=True
-                # But wrap each task with a timeout to prevent long hangs
-                async def wrapped_task(t, name):
-                    try:
-                        return await asyncio.wait_for(t, timeout=25.0)
-                    except asyncio.TimeoutError:
-                        logger.warning(f"[{name}] Task timed out after 25s")
-                        return []
-                    except Exception as e:
-                        logger.error(f"[{name}] Task failed: {e}")
-                        return []
+            # Use asyncio.gather with return_exceptions=True
+            # But wrap each task with a timeout to prevent long hangs
+            async def wrapped_task(t, name):
+                try:
+                    return await asyncio.wait_for(t, timeout=SITE_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    logger.warning(f"[{name}] Task timed out after {SITE_TIMEOUT_SECONDS:g}s")
+                    failures.append(name)
+                    return []
+                except Exception as e:
+                    logger.error(f"[{name}] Task failed: {e}")
+                    failures.append(name)
+                    return []
 
-                # Rebuild tasks with wrappers if needed, but scrape_single_site_drug is async
-                # Better: Modify how we append to tasks to include wrapper logic implicitly or explicitly
-                # Since tasks are coroutines, we can wrap them.
+            # Rebuild tasks with wrappers if needed, but scrape_single_site_drug is async
+            # Better: Modify how we append to tasks to include wrapper logic implicitly or explicitly
+            # Since tasks are coroutines, we can wrap them.
                 
-                wrapped_tasks = []
-                for site in config_list:
-                    if site.get('enabled', True):
-                         # Logic repeated for wrapper context
-                         coro = None
-                         if site['site_name'] == 'ThuocBietDuoc' and direct_url:
-                             coro = scrape_single_site_drug(browser, site, kw_variant, direct_url=direct_url)
-                         else:
-                             coro = scrape_single_site_drug(browser, site, kw_variant)
+            wrapped_tasks = []
+            for site in config_list:
+                if site.get('enabled', True):
+                     # Logic repeated for wrapper context
+                     coro = None
+                     if site['site_name'] == 'ThuocBietDuoc' and direct_url:
+                         coro = scrape_single_site_drug(browser, site, kw_variant, direct_url=direct_url)
+                     else:
+                         coro = scrape_single_site_drug(browser, site, kw_variant)
                          
-                         wrapped_tasks.append(wrapped_task(coro, site['site_name']))
+                     wrapped_tasks.append(wrapped_task(coro, site['site_name']))
                 
-                results_lists = await asyncio.gather(*wrapped_tasks, return_exceptions=True)
+            results_lists = await asyncio.gather(*wrapped_tasks, return_exceptions=True)
                 
-                # Check if we got ANY candidates from this variant
-                has_results = False
-                for r_list in results_lists:
-                    if isinstance(r_list, list) and len(r_list) > 0:
-                        has_results = True
-                        break
+            # Check if we got ANY candidates from this variant
+            has_results = False
+            for r_list in results_lists:
+                if isinstance(r_list, list) and len(r_list) > 0:
+                    has_results = True
+                    break
                 
-                if has_results:
-                    logger.info(f"[WebAdvanced] Found potential results for variant: '{kw_variant}'")
-                    break 
-                else:
-                    logger.warning(f"[WebAdvanced] No items found for variant: '{kw_variant}'. Trying fallback...")
-        finally:
-            await browser.close()
+            if has_results:
+                logger.info(f"[WebAdvanced] Found potential results for variant: '{kw_variant}'")
+                break 
+            else:
+                logger.warning(f"[WebAdvanced] No items found for variant: '{kw_variant}'. Trying fallback...")
             
     # 2. Flatten & Parse
     candidates = []
@@ -142,64 +153,67 @@ async def scrape_drug_web_advanced(keyword, **kwargs):
         logger.info(f"[WebAdvanced] No results from direct sites. Trying multi-engine search fallback...")
         
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True, args=BROWSER_ARGS)
-                try:
-                    # Use multi-engine search to find drug links
-                    engine_result = await search_drug_links(
-                        browser, 
-                        keyword,
-                        max_links=5,
-                        query_variants=[f"{clean_kw} thuoc", clean_kw]
-                    )
+            async with browser_pool.browser() as browser:
+                # Use multi-engine search to find drug links
+                engine_result = await search_drug_links(
+                    browser, 
+                    keyword,
+                    max_links=5,
+                    query_variants=[f"{clean_kw} thuoc", clean_kw]
+                )
+            # Trả browser trước khi scrape link: scrape_single_site_drug mượn context riêng từ pool
+            if engine_result.get("success") and engine_result.get("links"):
+                logger.info(f"[MultiEngine] Found {len(engine_result['links'])} links via {engine_result.get('engines_used')}")
                     
-                    if engine_result.get("success") and engine_result.get("links"):
-                        logger.info(f"[MultiEngine] Found {len(engine_result['links'])} links via {engine_result.get('engines_used')}")
+                # Scrape detail from found links (scrape_single_site_drug already imported at top)
+                for link in engine_result.get("links", [])[:3]:  # Max 3 links
+                    # Determine site config based on URL
+                    site_config = None
+                    for cfg in config_list:
+                        if cfg.get('site_name', '').lower() in link.lower():
+                            site_config = cfg
+                            break
                         
-                        # Scrape detail from found links (scrape_single_site_drug already imported at top)
-                        for link in engine_result.get("links", [])[:3]:  # Max 3 links
-                            # Determine site config based on URL
-                            site_config = None
-                            for cfg in config_list:
-                                if cfg.get('site_name', '').lower() in link.lower():
-                                    site_config = cfg
-                                    break
-                            
-                            if not site_config:
-                                # Default config for unknown sites
-                                site_config = {
-                                    "site_name": "MultiEngine",
-                                    "detail_logic": {"has_detail_page": True, "content_container": "main"},
-                                    "fields": {"so_dang_ky": [], "hoat_chat": []}
-                                }
-                            
-                            try:
-                                results = await scrape_single_site_drug(browser, site_config, keyword, direct_url=link)
-                                for item in results:
-                                    content = item.get('Content', '')
-                                    parsed = parse_drug_info(content)
-                                    if '_extracted_data' in item and item['_extracted_data']:
-                                        for f_key, f_val in item['_extracted_data'].items():
-                                            parsed[f_key] = f_val
-                                    item.update(parsed)
-                                    if 'ten_thuoc' not in item or not item['ten_thuoc']:
-                                        item['ten_thuoc'] = keyword
-                                    candidates.append(item)
-                            except Exception as link_err:
-                                logger.warning(f"[MultiEngine] Failed to scrape {link}: {link_err}")
-                                
-                finally:
-                    await browser.close()
-                    
+                    if not site_config:
+                        # Default config for unknown sites
+                        site_config = {
+                            "site_name": "MultiEngine",
+                            "detail_logic": {"has_detail_page": True, "content_container": "main"},
+                            "fields": {"so_dang_ky": [], "hoat_chat": []}
+                        }
+                        
+                    try:
+                        results = await scrape_single_site_drug(None, site_config, keyword, direct_url=link)
+                        for item in results:
+                            content = item.get('Content', '')
+                            parsed = parse_drug_info(content)
+                            if '_extracted_data' in item and item['_extracted_data']:
+                                for f_key, f_val in item['_extracted_data'].items():
+                                    parsed[f_key] = f_val
+                            item.update(parsed)
+                            if 'ten_thuoc' not in item or not item['ten_thuoc']:
+                                item['ten_thuoc'] = keyword
+                            candidates.append(item)
+                    except Exception as link_err:
+                        logger.warning(f"[MultiEngine] Failed to scrape {link}: {link_err}")
+                        failures.append(link)
+                
         except Exception as fallback_err:
             logger.error(f"[MultiEngine] Fallback failed: {fallback_err}")
+            failures.append("MultiEngine")
         
         # Check again after fallback
         if not candidates:
-            return {"status": "not_found", "message": "No drugs found on web or search engines."}
+            return {
+                "status": "not_found",
+                "message": "No drugs found on web or search engines.",
+                "complete": not failures,
+            }
         
     sdk_candidates = [c for c in candidates if c.get('so_dang_ky')]
     logger.info(f"[WebAdvanced] Candidates with SDK: {len(sdk_candidates)}")
+    if kwargs.get("candidates_out") is not None:
+        kwargs["candidates_out"].extend(candidates)
     
     if not sdk_candidates:
         logger.warning(f"[WebAdvanced] No SDK found. Returning best item without SDK.")
@@ -0,0 +1,161 @@
+"""
+Crawl Replay - phục vụ HTML đã ghi (fixture corpus) cho crawler thay vì site thật
+================================================================================
+Corpus là một thư mục gồm các file HTML + `manifest.json`:
+
+    {
+      "pages": {
+        "https://www.thuocbietduoc.com.vn/thuoc-48012/hapacol-250.aspx":
+            {"file": "thuocbietduoc_detail.html", "site": "ThuocBietDuoc", "kind": "detail"}
+      },
+      "search": {"hapacol 250": ["https://www.thuocbietduoc.com.vn/thuoc-48012/hapacol-250.aspx"]}
+    }
+
+- URL được so khớp sau khi chuẩn hoá (bỏ scheme, 'www.', '/' cuối, sắp query).
+- `route_handler`: handler Playwright (`context.route("**/*", ...)`) - trang có trong
+  corpus được fulfill, document không có -> 404, resource khác bị abort.
+- `transport()`: httpx.MockTransport cho HTTP fast tier.
+- `search`: kết quả search engine cho StubSearchBackend (GoogleSearchService).
+
+Bật replay cho toàn crawler bằng CRAWL_REPLAY_DIR=<thư mục corpus> (hoặc
+`set_active_corpus`). Mọi context Playwright của crawler (BrowserPool.context,
+create_stealth_context, browser debug của core_drug) gọi `install_active_corpus`
+khi được tạo. Ghi corpus mới: scripts/record_crawl_fixtures.py.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+
+from .utils import logger
+
+CRAWL_REPLAY_DIR = os.getenv("CRAWL_REPLAY_DIR", "")
+
+MANIFEST_NAME = "manifest.json"
+HTML_CONTENT_TYPE = "text/html; charset=utf-8"
+
+
+def normalize_url(url: str) -> str:
+    """Key so khớp URL: host (bỏ www.) + path (bỏ '/' cuối) + query đã sắp xếp."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{host}{path}" + (f"?{query}" if query else "")
+
+
+class FixtureCorpus:
+    def __init__(self, root: str):
+        self.root = root
+        self.pages: Dict[str, Dict[str, Any]] = {}
+        self.search: Dict[str, List[str]] = {}
+        self._index: Dict[str, str] = {}
+        self._html: Dict[str, str] = {}
+        self._transport = None
+        self.hits = 0
+        self.misses: List[str] = []
+        manifest = os.path.join(root, MANIFEST_NAME)
+        if os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                data = json.load(f)
+            self.pages = data.get("pages", {})
+            self.search = data.get("search", {})
+        self._index = {normalize_url(url): url for url in self.pages}
+
+    def entries(self, site: str = None, kind: str = None) -> List[Dict[str, Any]]:
+        """Các trang trong corpus (lọc theo site / kind), kèm `url`."""
+        return [
+            dict(meta, url=url) for url, meta in self.pages.items()
+            if (site is None or meta.get("site") == site) and (kind is None or meta.get("kind") == kind)
+        ]
+
+    def get(self, url: str) -> Optional[str]:
+        """HTML đã ghi cho `url`, None nếu không có trong corpus."""
+        original = self._index.get(normalize_url(url))
+        if original is None:
+            self.misses.append(url)
+            return None
+        self.hits += 1
+        html = self._html.get(original)
+        if html is None:
+            with open(os.path.join(self.root, self.pages[original]["file"]), encoding="utf-8") as f:
+                html = self._html[original] = f.read()
+        return html
+
+    def add(self, url: str, html: str, site: str, kind: str = "detail", file_name: str = None) -> str:
+        """Ghi một trang vào corpus (file HTML + manifest). Trả về tên file."""
+        if file_name is None:
+            slug = "".join(c if c.isalnum() else "_" for c in normalize_url(url))[:80].strip("_")
+            file_name = f"{site.lower()}_{slug}.html"
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, file_name), "w", encoding="utf-8") as f:
+            f.write(html)
+        self.pages[url] = {"file": file_name, "site": site, "kind": kind}
+        self._index[normalize_url(url)] = url
+        self._html[url] = html
+        return file_name
+
+    def save(self):
+        with open(os.path.join(self.root, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump({"pages": self.pages, "search": self.search}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+    async def route_handler(self, route):
+        """Playwright route handler: fulfill từ corpus, không bao giờ ra mạng."""
+        request = route.request
+        html = self.get(request.url)
+        if html is not None:
+            await route.fulfill(status=200, content_type=HTML_CONTENT_TYPE, body=html)
+        elif request.resource_type == "document":
+            logger.warning(f"[Replay] No fixture for {request.url}")
+            await route.fulfill(status=404, content_type=HTML_CONTENT_TYPE, body="<html><body></body></html>")
+        else:
+            await route.abort()
+
+    async def install(self, target):
+        """Gắn replay lên Playwright context/page."""
+        await target.route("**/*", self.route_handler)
+
+    def transport(self) -> httpx.MockTransport:
+        if self._transport is not None:
+            return self._transport
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            html = self.get(str(request.url))
+            if html is None:
+                return httpx.Response(404, text="", headers={"content-type": HTML_CONTENT_TYPE})
+            return httpx.Response(200, text=html, headers={"content-type": HTML_CONTENT_TYPE})
+
+        self._transport = httpx.MockTransport(handler)
+        return self._transport
+
+
+_active_corpus: Optional[FixtureCorpus] = None
+
+
+def set_active_corpus(corpus: Optional[FixtureCorpus]):
+    """Bật (corpus) / tắt (None) replay cho crawler trong process."""
+    global _active_corpus
+    _active_corpus = corpus
+    if corpus is not None:
+        logger.info(f"[Replay] Serving crawler requests from {corpus.root} ({len(corpus.pages)} pages)")
+
+
+def active_corpus() -> Optional[FixtureCorpus]:
+    return _active_corpus
+
+
+async def install_active_corpus(context):
+    """Gắn replay lên context Playwright mới nếu replay đang bật."""
+    corpus = _active_corpus
+    if corpus is not None:
+        await corpus.install(context)
+
+
+if CRAWL_REPLAY_DIR:
+    set_active_corpus(FixtureCorpus(CRAWL_REPLAY_DIR))
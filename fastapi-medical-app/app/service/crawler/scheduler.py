@@ -0,0 +1,240 @@
+"""
+Crawl Scheduler - giới hạn tốc độ theo domain + gộp crawl trùng đang chạy
+=========================================================================
+Nhiều request /identify hoặc /agent-search cùng miss DB cho một thuốc trước đây
+mở từng ấy lượt scrape song song, và không có gì chặn số page bắn vào
+thuocbietduoc.com.vn cùng lúc.
+
+- `submit(key, factory, priority)`: crawl có cùng key (keyword đã normalize) đang
+  chạy -> các caller chờ chung một future. Crawl mới xếp hàng theo priority
+  (số nhỏ chạy trước, cùng priority thì FIFO), tối đa CRAWL_MAX_CONCURRENT crawl
+  cùng lúc. Caller bị huỷ (deadline) không huỷ crawl khi còn caller khác đang chờ.
+- `domain_slot(url)`: bọc mỗi lượt navigate/GET - tối đa CRAWL_DOMAIN_CONCURRENCY
+  request đồng thời mỗi domain + token bucket CRAWL_DOMAIN_RATE req/s (burst
+  CRAWL_DOMAIN_BURST). Override từng domain qua CRAWL_DOMAIN_LIMITS (JSON), ví dụ
+  {"thuocbietduoc.com.vn": {"concurrency": 2, "rate": 1, "burst": 2}}.
+
+Usage:
+    result = await crawl_scheduler.submit(("drug", key), lambda: scrape(keyword))
+    async with crawl_scheduler.domain_slot(url):
+        await page.goto(url)
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from urllib.parse import urlsplit
+
+from .utils import logger
+
+CRAWL_MAX_CONCURRENT = int(os.getenv("CRAWL_MAX_CONCURRENT", "4"))
+CRAWL_DOMAIN_CONCURRENCY = int(os.getenv("CRAWL_DOMAIN_CONCURRENCY", "2"))
+CRAWL_DOMAIN_RATE = float(os.getenv("CRAWL_DOMAIN_RATE", "2"))      # request/giây mỗi domain, 0 = không giới hạn
+CRAWL_DOMAIN_BURST = int(os.getenv("CRAWL_DOMAIN_BURST", "4"))
+CRAWL_DOMAIN_LIMITS = json.loads(os.getenv("CRAWL_DOMAIN_LIMITS", "{}") or "{}")
+
+# Priority: số nhỏ chạy trước
+PRIORITY_INTERACTIVE = 0   # một thuốc / agent search người dùng đang chờ
+PRIORITY_BATCH = 10        # batch /identify nhiều tên
+
+
+def domain_of(url: str) -> str:
+    """Host (lowercase, bỏ 'www.') của URL; chuỗi không phải URL coi là domain."""
+    host = urlsplit(url).hostname if "//" in url else url
+    host = (host or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class TokenBucket:
+    """Token bucket: `rate` token/giây, tối đa `burst` token tích luỹ."""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:  # FIFO giữa các caller cùng domain
+            while True:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _PrioritySlots:
+    """Semaphore cấp slot theo priority (heap) thay vì thứ tự đến."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for *_, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut  # release() chuyển thẳng slot cho waiter (active không đổi)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # đã được cấp slot nhưng bị huỷ ngay sau đó
+            raise
+
+    def release(self):
+        while self._waiters:
+            *_, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+
+class _Inflight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _DomainLimit:
+    def __init__(self, concurrency: int, rate: float, burst: int):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.bucket = TokenBucket(rate, burst)
+        self.active = 0
+        self.requests = 0
+
+
+class CrawlScheduler:
+    def __init__(self, max_concurrent: int = None, domain_concurrency: int = None,
+                 domain_rate: float = None, domain_burst: int = None,
+                 domain_limits: Dict[str, Dict[str, Any]] = None):
+        self.max_concurrent = max_concurrent or CRAWL_MAX_CONCURRENT
+        self.domain_concurrency = domain_concurrency or CRAWL_DOMAIN_CONCURRENCY
+        self.domain_rate = CRAWL_DOMAIN_RATE if domain_rate is None else domain_rate
+        self.domain_burst = domain_burst or CRAWL_DOMAIN_BURST
+        self.domain_limits = {
+            domain_of(domain): limits
+            for domain, limits in (CRAWL_DOMAIN_LIMITS if domain_limits is None else domain_limits).items()
+        }
+        self._loop = None
+        self._reset()
+
+    def _reset(self):
+        self._slots = _PrioritySlots(self.max_concurrent)
+        self._inflight: Dict[Hashable, _Inflight] = {}
+        self._domains: Dict[str, _DomainLimit] = {}
+        self.submitted = 0
+        self.coalesced = 0
+
+    def _bind_loop(self):
+        """Primitive asyncio thuộc về event loop tạo ra chúng -> loop mới thì khởi tạo lại."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._reset()
+            self._loop = loop
+
+    async def submit(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                     priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """
+        Chạy `factory()` dưới giới hạn của scheduler, hoặc chờ crawl cùng `key` đang chạy.
+        Kết quả (hoặc exception) được chia sẻ cho mọi caller cùng key.
+        """
+        self._bind_loop()
+        self.submitted += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = _Inflight(asyncio.ensure_future(self._run(factory, priority)))
+            self._inflight[key] = entry
+            entry.task.add_done_callback(lambda _t, k=key, e=entry: self._forget(k, e))
+        else:
+            self.coalesced += 1
+            logger.info(f"[CrawlScheduler] Joining in-flight crawl for {key!r}")
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task)
+        except asyncio.CancelledError:
+            if entry.waiters == 1 and not entry.task.done():
+                # Caller cuối cùng bỏ cuộc -> huỷ crawl và chờ nó dọn xong
+                entry.task.cancel()
+                await asyncio.wait({entry.task})
+            raise
+        finally:
+            entry.waiters -= 1
+
+    def _forget(self, key, entry):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    async def _run(self, factory, priority):
+        await self._slots.acquire(priority)
+        try:
+            return await factory()
+        finally:
+            self._slots.release()
+
+    def _domain(self, domain: str) -> _DomainLimit:
+        limit = self._domains.get(domain)
+        if limit is None:
+            override = self.domain_limits.get(domain, {})
+            limit = _DomainLimit(
+                override.get("concurrency", self.domain_concurrency),
+                override.get("rate", self.domain_rate),
+                override.get("burst", self.domain_burst),
+            )
+            self._domains[domain] = limit
+        return limit
+
+    @asynccontextmanager
+    async def domain_slot(self, url: str):
+        """Giữ một slot của domain (concurrency + token bucket) trong suốt request."""
+        self._bind_loop()
+        domain = domain_of(url)
+        if not domain:
+            yield
+            return
+        limit = self._domain(domain)
+        async with limit.semaphore:
+            await limit.bucket.acquire()
+            limit.active += 1
+            limit.requests += 1
+            try:
+                yield
+            finally:
+                limit.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._slots.active,
+            "queued": self._slots.queued,
+            "inflight_keys": len(self._inflight),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "domains": {
+                domain: {"active": limit.active, "requests": limit.requests}
+                for domain, limit in self._domains.items()
+            },
+        }
+
+
+# Singleton dùng chung cho identify, agent search và các crawler
+crawl_scheduler = CrawlScheduler()
@@ -10,6 +10,7 @@ from typing import List, Dict, Tuple
 from urllib.parse import urlparse, quote_plus
 import logging
 
+from .core_drug import goto
 from .stealth_config import (
     human_pause, 
     human_scroll, 
@@ -98,7 +99,7 @@ async def search_google(page, query: str, max_links: int = 10) -> List[str]:
         url = f"https://www.google.com/search?q={quote_plus(query)}&num=20&hl=vi"
         logger.info(f"[Google] Searching: {query}")
         
-        await page.goto(url, timeout=GOTO_TIMEOUT, wait_until="domcontentloaded")
+        await goto(page, url, timeout=GOTO_TIMEOUT)
         await human_pause(1.5, 2.5)
         await human_scroll(page, "light")
         await human_pause(0.5, 1.0)
@@ -158,7 +159,7 @@ async def search_bing(page, query: str, max_links: int = 10) -> List[str]:
         url = f"https://www.bing.com/search?q={quote_plus(query)}&count=20"
         logger.info(f"[Bing] Searching: {query}")
         
-        await page.goto(url, timeout=GOTO_TIMEOUT, wait_until="domcontentloaded")
+        await goto(page, url, timeout=GOTO_TIMEOUT)
         await human_pause(1.5, 2.5)
         await human_scroll(page, "light")
         await human_pause(0.5, 1.0)
@@ -213,7 +214,7 @@ async def search_duckduckgo(page, query: str, max_links: int = 10) -> List[str]:
         url = f"https://html.duckduckgo.com/html/?q={quote_plus(query)}"
         logger.info(f"[DDG] Searching: {query}")
         
-        await page.goto(url, timeout=GOTO_TIMEOUT, wait_until="domcontentloaded")
+        await goto(page, url, timeout=GOTO_TIMEOUT)
         await human_pause(1.0, 2.0)
         
         links = await page.query_selector_all("a.result__a")
@@ -9,6 +9,8 @@ import random
 import asyncio
 from typing import List
 
+from .replay import install_active_corpus
+
 # ======================================================
 # BROWSER ARGS (from V03)
 # ======================================================
@@ -155,6 +157,9 @@ async def create_stealth_context(browser, persistent: bool = False):
         java_script_enabled=True,
     )
     
+    # Replay mode (CRAWL_REPLAY_DIR): không ra mạng
+    await install_active_corpus(context)
+    
     # Inject stealth script
     await context.add_init_script(STEALTH_INIT_SCRIPT)
     
@@ -2,6 +2,8 @@ import logging
 import os
 import re
 
+from app.core.utils import SDK_PATTERN
+
 # --- LOGGING SETUP ---
 LOG_DIR = "app/logs"
 if not os.path.exists(LOG_DIR):
@@ -30,6 +32,19 @@ SCREENSHOT_DIR = "app/logs/screenshots"
 if not os.path.exists(SCREENSHOT_DIR):
     os.makedirs(SCREENSHOT_DIR)
 
+# Regex của parse_drug_info - compile một lần (chạy trên mọi candidate),
+# tách thành hằng để scripts/benchmark_extraction.py profile từng pattern.
+SDK_PATTERNS = [
+    # SDK Pattern: VN-1234-56, VD-..., V..., QL...
+    # Robust patterns for various formats
+    re.compile(r'(?:SĐK|Số đăng ký|SĐK|SDK|Reg\.No)[:\.]?\s*([A-Z0-9\-\/]{5,20})', re.IGNORECASE), # Min 5 chars
+    re.compile(r'(VN-\d{4,10}-\d{2}|VD-\d{4,10}-\d{2}|QLD-\d+-\d+|GC-\d+-\d+|VNA-\d+-\d+|VNB-\d+-\d+)', re.IGNORECASE), # Common Patterns
+    re.compile(r'([A-Z]{1,3}-\d{4,10}-\d{2})', re.IGNORECASE), # General Pattern
+]
+HOAT_CHAT_PATTERN = re.compile(r"(?:Hoạt chất|Thành phần)[:\.]?\s*(.+?)(?:\n|$)", re.IGNORECASE)
+CONG_TY_PATTERN = re.compile(r"(?:Công ty|Nhà) sản xuất[:\.]?\s*(.+?)(?:\n|$)", re.IGNORECASE)
+
+
 def parse_drug_info(raw_text):
     """Extract structured info from raw text using Regex"""
     data = {
@@ -43,34 +58,26 @@ def parse_drug_info(raw_text):
     if not raw_text:
         return data
 
-    # SDK Pattern: VN-1234-56, VD-..., V..., QL...
-    # Robust patterns for various formats
-    patterns = [
-        r'(?:SĐK|Số đăng ký|SĐK|SDK|Reg\.No)[:\.]?\s*([A-Z0-9\-\/]{5,20})', # Min 5 chars
-        r'(VN-\d{4,10}-\d{2}|VD-\d{4,10}-\d{2}|QLD-\d+-\d+|GC-\d+-\d+|VNA-\d+-\d+|VNB-\d+-\d+)', # Common Patterns
-        r'([A-Z]{1,3}-\d{4,10}-\d{2})' # General Pattern
-    ]
-    
-    for p in patterns:
-        match = re.search(p, raw_text, re.IGNORECASE)
+    for pattern in SDK_PATTERNS:
+        match = pattern.search(raw_text)
         if match:
             data["so_dang_ky"] = match.group(1).strip().strip(':').strip('.')
             break
             
-    # Simple direct SDK pattern if no prefix found
+    # Direct SDK pattern if no prefix found (same pattern as the matcher's SDK fast path)
     if not data["so_dang_ky"]:
-        # Match something like VD-12345-12 or VN-123456-12
-        match = re.search(r'([A-Z]{1,3}-\d{4,10}-\d{2})', raw_text)
+        # Match something like VD-12345-12, VN-123456-12, V1033-H12-10
+        match = SDK_PATTERN.search(raw_text)
         if match:
              data["so_dang_ky"] = match.group(1)
 
     # Hoat Chat
-    hc_match = re.search(r"(?:Hoạt chất|Thành phần)[:\.]?\s*(.+?)(?:\n|$)", raw_text, re.IGNORECASE)
+    hc_match = HOAT_CHAT_PATTERN.search(raw_text)
     if hc_match:
         data["hoat_chat"] = hc_match.group(1).strip()
         
     # Cong Ty
-    ct_match = re.search(r"(?:Công ty|Nhà) sản xuất[:\.]?\s*(.+?)(?:\n|$)", raw_text, re.IGNORECASE)
+    ct_match = CONG_TY_PATTERN.search(raw_text)
     if ct_match:
         data["cong_ty_san_xuat"] = ct_match.group(1).strip()
         
@@ -5,6 +5,7 @@ import sqlite3
 import os
 from typing import Optional, Dict, List
 from app.database.core import DatabaseCore, dict_factory
+from app.service.drug_index_service import notify_kb_changes
 
 class DiseaseService:
     """
@@ -133,6 +134,7 @@ class DiseaseService:
             cursor.execute("DELETE FROM knowledge_base WHERE icd_code = ?", (icd_code,))
             affected = cursor.rowcount
             conn.commit()
+            notify_kb_changes(self.db_core)
             return affected > 0
         except Exception as e:
             conn.rollback()
@@ -152,6 +154,7 @@ class DiseaseService:
             cursor.execute("DELETE FROM knowledge_base WHERE id = ?", (row_id,))
             affected = cursor.rowcount
             conn.commit()
+            notify_kb_changes(self.db_core)
             return affected > 0
         except Exception as e:
             conn.rollback()
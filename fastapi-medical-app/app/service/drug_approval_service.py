@@ -2,6 +2,7 @@ import sqlite3
 from datetime import datetime
 from app.database.core import DatabaseCore
 from app.core.utils import normalize_text
+from app.service.drug_index_service import notify_drug_changes, record_drug_change
 
 class DrugApprovalService:
     def __init__(self, db_core: DatabaseCore = None):
@@ -137,8 +138,10 @@ class DrugApprovalService:
                      row_id = cursor.lastrowid
                 
                 self._update_fts(cursor, row_id, ten, hoat_chat, cong_ty, search_text)
+                record_drug_change(cursor, row_id, 'insert')
                 
                 conn.commit()
+                notify_drug_changes(self.db_core)
                 return {"status": "success", "message": f"Saved new drug: {ten} ({sdk})"}
 
         except Exception as e: # Catch all
@@ -221,6 +224,7 @@ class DrugApprovalService:
                     conflict_id
                 ))
                 self._update_fts(cursor, conflict_id, staging['ten_thuoc'], staging['hoat_chat'], staging['cong_ty_san_xuat'], staging['search_text'])
+                record_drug_change(cursor, conflict_id, 'update')
 
             else:
                 now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -258,6 +262,7 @@ class DrugApprovalService:
                      new_id = cursor.lastrowid
                 
                 self._update_fts(cursor, new_id, staging['ten_thuoc'], staging['hoat_chat'], staging['cong_ty_san_xuat'], staging['search_text'])
+                record_drug_change(cursor, new_id, 'insert')
                 final_drug_id = new_id # Fix variable usage below
 
             if conflict_id:
@@ -279,6 +284,7 @@ class DrugApprovalService:
 
             cursor.execute("DELETE FROM drug_staging WHERE id = ?", (staging_id,))
             conn.commit()
+            notify_drug_changes(self.db_core)
             return {"status": "success", "message": "Staging approved and merged."}
             
         except sqlite3.Error as e:
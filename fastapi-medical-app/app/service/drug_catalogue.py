@@ -0,0 +1,250 @@
+"""
+Drug Catalogue - Columnar storage cho các cột thuốc giữ trong RAM
+=================================================================
+Thay cho list các dict mỗi dòng (vài trăm byte overhead / dòng, nhân số worker):
+
+- `ids`, `verified`: numpy array.
+- Chuỗi (tên, SDK, hoạt chất, chỉ định, search text): `StringPool` - một blob
+  UTF-8 + mảng offset, decode khi truy cập.
+- `classification`: int-coded (`CodedColumn`), vài giá trị lặp lại.
+- `DrugRow`: view một dòng (`__slots__`), dùng như dict read-only
+  (`row['ten_thuoc']`, `row.get(...)`, `row.to_dict()`).
+
+Catalogue bất biến. Delta (thêm dòng) tạo catalogue mới dùng chung blob cũ,
+dòng mới nằm trong overlay nhỏ cho tới lần compaction (full build) sau.
+"""
+
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Các cột thuốc mà caller của cascade thực sự dùng: giữ trong RAM, kết quả match
+# trả từ đây. Cột rộng/hiếm dùng (note, cong_ty_san_xuat...) đọc qua `drug_details`.
+PROJECTED_FIELDS = ("id", "ten_thuoc", "so_dang_ky", "hoat_chat", "chi_dinh", "is_verified", "classification")
+
+
+class StringPool(Sequence):
+    """Immutable sequence of Optional[str] stored as one UTF-8 blob + offsets."""
+
+    def __init__(self, values: Iterable[Optional[str]] = ()):
+        # Ghi thẳng vào một bytearray: không giữ list bytes tạm (giảm peak lúc build)
+        blob = bytearray()
+        ends = array("q")
+        null = array("b")
+        for value in values:
+            if value is None:
+                null.append(1)
+            else:
+                null.append(0)
+                blob += value.encode("utf-8")
+            ends.append(len(blob))
+        self._blob = bytes(blob)
+        self._offsets = np.zeros(len(ends) + 1, dtype=np.int64)
+        self._offsets[1:] = np.frombuffer(ends, dtype=np.int64) if ends else 0
+        self._null = np.frombuffer(null, dtype=np.int8).astype(bool)
+        self._n_base = len(ends)
+        self._extra: List[Optional[str]] = []  # overlay: dòng thêm bằng delta
+
+    def extended(self, values: Iterable[Optional[str]]) -> "StringPool":
+        """New pool with `values` appended (blob shared, values kept in the overlay)."""
+        new = StringPool.__new__(StringPool)
+        new.__dict__.update(self.__dict__)
+        new._extra = self._extra + list(values)
+        return new
+
+    def __len__(self) -> int:
+        return self._n_base + len(self._extra)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i >= self._n_base:
+            return self._extra[i - self._n_base]
+        if self._null[i]:
+            return None
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].decode("utf-8")
+
+    def __iter__(self):
+        blob, offsets, null = self._blob, self._offsets.tolist(), self._null.tolist()
+        for i in range(self._n_base):
+            yield None if null[i] else blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+        yield from self._extra
+
+    def nbytes(self) -> int:
+        return len(self._blob) + self._offsets.nbytes + self._null.nbytes
+
+
+class CodedColumn(Sequence):
+    """Low-cardinality Optional[str] column stored as int16 codes (-1 = None)."""
+
+    def __init__(self, values: Iterable[Optional[str]] = ()):
+        self.categories: List[str] = []
+        self._lookup: Dict[str, int] = {}
+        self.codes = np.asarray([self._code(v) for v in values], dtype=np.int16)
+
+    def _code(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def extended(self, values: Iterable[Optional[str]]) -> "CodedColumn":
+        new = CodedColumn.__new__(CodedColumn)
+        new.categories = list(self.categories)
+        new._lookup = dict(self._lookup)
+        added = np.asarray([new._code(v) for v in values], dtype=np.int16)
+        new.codes = np.concatenate([self.codes, added])
+        return new
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        code = self.codes[i]
+        return self.categories[code] if code >= 0 else None
+
+
+class DrugRow:
+    """Read-only view of one catalogue row; supports the dict access callers used before."""
+
+    __slots__ = PROJECTED_FIELDS + ("search_text",)
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """PROJECTED_FIELDS as a plain dict (shape of match results)."""
+        return {name: getattr(self, name) for name in PROJECTED_FIELDS}
+
+    def __repr__(self) -> str:
+        return f"DrugRow(id={self.id}, ten_thuoc={self.ten_thuoc!r}, so_dang_ky={self.so_dang_ky!r})"
+
+
+class DrugCatalogue:
+    """Columnar, immutable drug catalogue (position = corpus row position)."""
+
+    def __init__(self, rows: Iterable[Dict[str, Any]] = ()):
+        rows = list(rows)
+        self.ids = np.asarray([r['id'] for r in rows], dtype=np.int64)
+        self.verified = np.asarray([r.get('is_verified') or 0 for r in rows], dtype=np.int8)
+        self.names = StringPool(r['ten_thuoc'] for r in rows)
+        self.sdks = StringPool(r['so_dang_ky'] for r in rows)
+        self.ingredients = StringPool(r.get('hoat_chat') for r in rows)
+        self.indications = StringPool(r.get('chi_dinh') for r in rows)
+        self.search_texts = StringPool(r.get('search_text') for r in rows)
+        self.classifications = CodedColumn(r.get('classification') for r in rows)
+
+    def with_added(self, rows: List[Dict[str, Any]]) -> "DrugCatalogue":
+        new = DrugCatalogue.__new__(DrugCatalogue)
+        new.ids = np.concatenate([self.ids, np.asarray([r['id'] for r in rows], dtype=np.int64)])
+        new.verified = np.concatenate([
+            self.verified, np.asarray([r.get('is_verified') or 0 for r in rows], dtype=np.int8)
+        ])
+        new.names = self.names.extended(r['ten_thuoc'] for r in rows)
+        new.sdks = self.sdks.extended(r['so_dang_ky'] for r in rows)
+        new.ingredients = self.ingredients.extended(r.get('hoat_chat') for r in rows)
+        new.indications = self.indications.extended(r.get('chi_dinh') for r in rows)
+        new.search_texts = self.search_texts.extended(r.get('search_text') for r in rows)
+        new.classifications = self.classifications.extended(r.get('classification') for r in rows)
+        return new
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, pos: int) -> DrugRow:
+        return DrugRow(
+            id=int(self.ids[pos]),
+            ten_thuoc=self.names[pos],
+            so_dang_ky=self.sdks[pos],
+            hoat_chat=self.ingredients[pos],
+            chi_dinh=self.indications[pos],
+            is_verified=int(self.verified[pos]),
+            classification=self.classifications[pos],
+            search_text=self.search_texts[pos],
+        )
+
+    def documents(self) -> List[str]:
+        """Text indexed by TF-IDF/BM25: search_text, or the name when empty."""
+        return [doc or name for doc, name in zip(self.search_texts, self.names)]
+
+    def nbytes(self) -> int:
+        pools = (self.names, self.sdks, self.ingredients, self.indications, self.search_texts)
+        return (self.ids.nbytes + self.verified.nbytes + self.classifications.codes.nbytes
+                + sum(pool.nbytes() for pool in pools))
+
+
+class RowsView(Sequence):
+    """`DrugCorpus.rows`: sequence of DrugRow built on access (backward compatible `drug_cache`)."""
+
+    def __init__(self, catalogue: DrugCatalogue):
+        self._catalogue = catalogue
+
+    def __len__(self) -> int:
+        return len(self._catalogue)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._catalogue.row(i)
+
+
+class IntColumn(Sequence):
+    """Numpy int column read as Python ints (ids đi vào SQL params / JSON)."""
+
+    def __init__(self, values: np.ndarray):
+        self.array = values
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.array[i].tolist()
+        return int(self.array[i])
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+
+class MaskedColumn(Sequence):
+    """Column view where tombstoned positions (live == False) read as None."""
+
+    def __init__(self, column: Sequence, live: Optional[np.ndarray]):
+        self._column = column
+        self._live = live
+
+    def __len__(self) -> int:
+        return len(self._column)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if self._live is not None and not self._live[i]:
+            return None
+        return self._column[i]
+
+    def __iter__(self):
+        if self._live is None:
+            yield from self._column
+            return
+        for value, alive in zip(self._column, self._live.tolist()):
+            yield value if alive else None
@@ -1,24 +1,98 @@
+import asyncio
+import os
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
 from app.service.drug_search_service import DrugSearchService
 from app.service.crawler import scrape_drug_web_advanced as scrape_drug_web
+from app.service.crawler.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, crawl_scheduler
+from app.service.scrape_cache_service import ScrapeCacheService, is_not_found, scrape_cache_key
 from app.core.utils import normalize_drug_name
 
+# Số web fallback (browser) chạy song song trong một batch
+IDENTIFY_WEB_CONCURRENCY = int(os.getenv("IDENTIFY_WEB_CONCURRENCY", "3"))
+# Hạn chót cho cả batch (giây); hết hạn -> trả kết quả đã có, tên còn lại "Timeout". 0 = không giới hạn
+IDENTIFY_DEADLINE_SECONDS = float(os.getenv("IDENTIFY_DEADLINE_SECONDS", "90"))
+# Cột ngoài PROJECTED_FIELDS cần cho kết quả DB
+DB_DETAIL_COLUMNS = ["note"]
+
+
 class DrugIdentificationService:
-    def __init__(self, search_service: DrugSearchService = None):
+    def __init__(self, search_service: DrugSearchService = None,
+                 web_concurrency: int = None, deadline_seconds: float = None,
+                 scrape_cache: ScrapeCacheService = None):
         if search_service is None:
             self.search_service = DrugSearchService()
         else:
             self.search_service = search_service
+        # Kết quả web scrape lưu trong DB (TTL) - tra trước khi mở browser
+        if scrape_cache is None:
+            scrape_cache = ScrapeCacheService(getattr(self.search_service, "db_core", None))
+        self.scrape_cache = scrape_cache
+        self.web_concurrency = max(1, web_concurrency or IDENTIFY_WEB_CONCURRENCY)
+        self.deadline_seconds = IDENTIFY_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
 
     async def process_batch(self, drug_names: list) -> list:
-        results = []
-        seen_sdk = {} # Check duplicates based on SDK in the current batch
-        
+        """
+        1. DB: search tất cả tên trong một lần (threadpool, không chặn event loop).
+        2. Web fallback cho các tên DB không đủ tin cậy, chạy song song
+           (tối đa `web_concurrency` cùng lúc) tới hạn `deadline_seconds`.
+        3. Gộp kết quả theo thứ tự input + đánh dấu trùng SDK trong batch.
+        """
+        started = time.monotonic()
+
         # Pre-process unique list to avoid duplicates in input
         input_drugs = list(dict.fromkeys(drug_names))
-        
+        keywords = [self._keyword(drug_raw) for drug_raw in input_drugs]
+
+        db_results = await run_in_threadpool(self.search_service.search_drug_smart_many, keywords, DB_DETAIL_COLUMNS)
+        found = {}
+        misses = []
+        for drug_raw, keyword, db_result in zip(input_drugs, keywords, db_results):
+            drug_data = self._from_db(drug_raw, db_result)
+            if drug_data:
+                found[drug_raw] = drug_data
+            else:
+                misses.append((drug_raw, keyword))
+
+        timed_out = set()
+        if misses:
+            semaphore = asyncio.Semaphore(self.web_concurrency)
+            priority = PRIORITY_INTERACTIVE if len(misses) == 1 else PRIORITY_BATCH
+
+            async def web_fallback(drug_raw, keyword):
+                async with semaphore:
+                    return drug_raw, await self._from_web(drug_raw, keyword, priority)
+
+            tasks = [asyncio.ensure_future(web_fallback(drug_raw, keyword)) for drug_raw, keyword in misses]
+            timeout = None
+            if self.deadline_seconds and self.deadline_seconds > 0:
+                timeout = max(0.0, self.deadline_seconds - (time.monotonic() - started))
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                # Chờ các task bị huỷ dọn dẹp (đóng browser) trước khi trả kết quả
+                await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                if task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    print(f"[Identify] Web fallback error: {task.exception()}")
+                    continue
+                drug_raw, drug_data = task.result()
+                if drug_data:
+                    found[drug_raw] = drug_data
+            if pending:
+                timed_out = {drug_raw for (drug_raw, _), task in zip(misses, tasks) if task in pending}
+                print(f"[Identify] Deadline {self.deadline_seconds}s reached, {len(pending)} web lookups cancelled")
+
+        results = []
+        seen_sdk = {} # Check duplicates based on SDK in the current batch
         for drug_raw in input_drugs:
-            drug_data = await self.identify_drug(drug_raw)
-            
+            drug_data = found.get(drug_raw)
+
             if drug_data:
                 # Duplicate Logic within Batch
                 sdk = drug_data.get('sdk')
@@ -31,34 +105,49 @@ class DrugIdentificationService:
                         seen_sdk[sdk] = drug_raw
                 else:
                      drug_data["is_duplicate"] = False
-                
+
                 results.append(drug_data)
+            elif drug_raw in timed_out:
+                 results.append({"input_name": drug_raw, "status": "Timeout"})
             else:
                  results.append({"input_name": drug_raw, "status": "Not Found"})
-                 
+
         return results
 
     async def identify_drug(self, drug_raw: str) -> dict:
+        keyword = self._keyword(drug_raw)
+
+        # 2. Smart DB Search
+        db_result, = await run_in_threadpool(self.search_service.search_drug_smart_many, [keyword], DB_DETAIL_COLUMNS)
+        drug_data = self._from_db(drug_raw, db_result)
+        if drug_data:
+            return drug_data
+
+        # 3. Web Search Fallback
+        return await self._from_web(drug_raw, keyword)
+
+    def _keyword(self, drug_raw: str) -> str:
         keyword = drug_raw.strip()
-        
+
         # 1. Normalization
         normalized = normalize_drug_name(keyword)
         if normalized:
              # print(f"Normalized: '{keyword}' -> '{normalized}'") # Optional logging
              keyword = normalized
-        
-        # 2. Smart DB Search
-        db_result = await self.search_service.search_drug_smart(keyword)
-        
+        return keyword
+
+    def _from_db(self, drug_raw: str, db_result: dict) -> dict:
         use_db = False
         if db_result:
             data = db_result.get('data', {})
             # DB Confidence Check: verified & has SDK
             if data.get('so_dang_ky') and data.get('is_verified') == 1:
                 use_db = True
-        
+
             if use_db:
                  info = db_result['data']
+                 # `note` không nằm trong cột projected của drug index -> đọc cùng lượt search (threadpool)
+                 details = db_result.get('details')
                  return {
                     "input_name": drug_raw,
                     "official_name": info.get('ten_thuoc'),
@@ -66,16 +155,29 @@ class DrugIdentificationService:
                     "active_ingredient": info.get('hoat_chat'),
                     "usage": info.get('chi_dinh', 'N/A'),
                     "classification": info.get('classification'),
-                    "note": info.get('note'),
+                    "note": (details or {}).get('note'),
                     "source": db_result.get('source'),
                     "confidence": db_result.get('confidence'),
                     "source_urls": [] # Database source
                 }
+        return None
 
-        # 3. Web Search Fallback
+    async def _from_web(self, drug_raw: str, keyword: str, priority: int = PRIORITY_INTERACTIVE) -> dict:
         # Only search if DB didn't yield a high confidence verified result
-        web_info = await scrape_drug_web(keyword)
-        
+        # Cache nằm trong DB (SQLite/Postgres) -> đọc/ghi trong threadpool, không chặn event loop
+        web_info = await run_in_threadpool(self.scrape_cache.get, keyword)
+        if web_info is None:
+            async def crawl():
+                candidates = []
+                info = await scrape_drug_web(keyword, candidates_out=candidates)
+                # not_found sau khi có site timeout/lỗi -> lỗi tạm thời, không cache negative
+                if not (is_not_found(info) and not (info or {}).get("complete", True)):
+                    await run_in_threadpool(self.scrape_cache.put, keyword, info, candidates)
+                return info
+
+            # Request khác đang scrape cùng keyword (đã normalize) -> chờ chung kết quả
+            web_info = await crawl_scheduler.submit(("drug", scrape_cache_key(keyword)), crawl, priority)
+
         if web_info:
             info = web_info
             return {
@@ -90,10 +192,10 @@ class DrugIdentificationService:
                 "confidence": info.get('confidence', 0.8),
                 "source_urls": info.get('source_urls', [])
             }
-        
-        # If DB had a partial result but we skipped it because it wasn't verified enough, 
+
+        # If DB had a partial result but we skipped it because it wasn't verified enough,
         # and Web failed, maybe we should return the partial DB result?
-        # Current logic in original code was: "elif db_result: pass" (doing nothing), 
+        # Current logic in original code was: "elif db_result: pass" (doing nothing),
         # so returning None is consistent with original behavior (status: Not Found).
-        
+
         return None
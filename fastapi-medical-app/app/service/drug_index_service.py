@@ -0,0 +1,1152 @@
+"""
+Drug Index Service - Shared, versioned in-memory drug index
+============================================================
+Một index duy nhất trong process (mỗi database) cho DrugMatcher,
+DrugSearchService và KBFuzzyMatchService, thay vì mỗi class tự load corpus,
+TF-IDF và danh sách tên cho RapidFuzz.
+
+- `DrugCorpus`: thuốc verified có SDK (tên, SDK, hoạt chất, TF-IDF, BM25,
+  index thành phần hoạt chất + hàm lượng).
+- `KBNameCorpus`: các `drug_name_norm` distinct trong knowledge_base, kèm bảng
+  dòng KB tốt nhất theo (drug_name_norm, disease_icd) và theo drug_name_norm.
+
+Mỗi lần build tăng `version`, để các cache phía sau biết dữ liệu đã thay đổi.
+Snapshot là bất biến: reader giữ một snapshot suốt một lượt match, refresh
+chỉ thay tham chiếu.
+
+TF-IDF/BM25 của `DrugCorpus` được lưu ra file (xem drug_index_store.py) theo
+fingerprint nội dung bảng drugs; lần khởi động sau chỉ mmap file, không fit lại.
+"""
+
+import copy
+import ctypes
+import gc
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from app.core.utils import normalize_sdk
+from app.database.core import DatabaseCore
+from app.service.composition_index import CompositionIndex
+from app.service.drug_catalogue import PROJECTED_FIELDS, DrugCatalogue, IntColumn, MaskedColumn, RowsView
+from app.service.fuzzy_blocking import FuzzyBlocker
+from app.service.result_cache import ResultCache
+from app.service.drug_index_store import (
+    INDEX_ENABLED,
+    corpus_fingerprint,
+    default_index_dir,
+    load_index,
+    prune_indexes,
+    save_index,
+)
+
+# Lazy imports để tránh lỗi khi chưa cài thư viện
+_sklearn_available = False
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse import vstack as sparse_vstack
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    _sklearn_available = True
+except ImportError:
+    pass
+
+
+TOKEN_PATTERN = r"(?u)\b\w+\b"
+
+# Change feed (bảng drug_changes) -> cập nhật index tăng dần
+POLL_INTERVAL = float(os.getenv("DRUG_INDEX_POLL_INTERVAL", "5"))      # giây giữa hai lần đọc change feed
+COMPACT_MIN = int(os.getenv("DRUG_INDEX_COMPACT_MIN", "500"))          # delta tối thiểu trước khi compaction
+COMPACT_RATIO = float(os.getenv("DRUG_INDEX_COMPACT_RATIO", "0.05"))   # ... hoặc tỉ lệ so với corpus
+CHANGES_KEEP = int(os.getenv("DRUG_CHANGES_KEEP", "10000"))            # số dòng drug_changes giữ lại
+
+try:
+    _libc = ctypes.CDLL("libc.so.6")  # malloc_trim chỉ có trên glibc
+except OSError:
+    _libc = None
+
+
+def _release_memory() -> None:
+    """
+    Sau full build: dòng DB tạm (list các dict) đã được giải phóng nhưng glibc
+    vẫn giữ heap -> trả lại cho OS để RSS mỗi worker phản ánh catalogue thật.
+    """
+    gc.collect()
+    if _libc is not None and hasattr(_libc, "malloc_trim"):
+        _libc.malloc_trim(0)
+
+
+def _okapi_idf(df, n_docs: int, epsilon: float) -> np.ndarray:
+    """
+    IDF của BM25Okapi với sàn epsilon * average_idf cho term xuất hiện ở > 1/2
+    số document. Cộng tuần tự theo term id như rank_bm25 để điểm giống hệt;
+    term không còn document nào (df=0) bị bỏ qua và có idf 0.
+    """
+    idf = [0.0] * len(df)
+    idf_sum = 0
+    count = 0
+    negative = []
+    for tid, freq in enumerate(df):
+        freq = int(freq)
+        if freq <= 0:
+            continue
+        value = math.log(n_docs - freq + 0.5) - math.log(freq + 0.5)
+        idf[tid] = value
+        idf_sum += value
+        count += 1
+        if value < 0:
+            negative.append(tid)
+    if count:
+        eps = epsilon * (idf_sum / count)
+        for tid in negative:
+            idf[tid] = eps
+    return np.asarray(idf, dtype=np.float64)
+
+
+class BM25Index:
+    """
+    BM25 Okapi với ma trận trọng số tính sẵn.
+
+    `matrix` là CSR (term x document) chứa sẵn
+    idf[t] * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl)), nên chấm điểm chỉ là một
+    phép nhân sparse `counts(query) @ matrix` cho một query hoặc cả batch.
+    Điểm bằng `rank_bm25.BM25Okapi` (cùng k1, b, epsilon, cùng idf) với sai
+    khác chỉ ở thứ tự cộng giữa các term.
+    Posting gốc của term t: docs[indptr[t]:indptr[t+1]], tf tương ứng.
+
+    Cập nhật tăng dần (`with_changes`): posting base giữ nguyên, document mới
+    nằm trong overlay, document bị xoá bị tombstone qua `live`; df, N, avgdl
+    và ma trận trọng số được tính lại trên các document còn sống.
+    """
+
+    def __init__(self, terms: List[str], idf, doc_len, indptr, docs, tf,
+                 avgdl: float, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25,
+                 weights=None):
+        self.terms = terms
+        self.term_ids = {t: i for i, t in enumerate(terms)}
+        self.idf = idf
+        self.doc_len = doc_len
+        self.indptr = indptr
+        self.docs = docs
+        self.tf = tf
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = len(doc_len)
+
+        self.n_base = len(doc_len)
+        self.live: Optional[np.ndarray] = None   # None = không có tombstone
+        self._added: List[List[str]] = []        # document thêm sau base (vị trí n_base + i)
+        self._overlay: Dict[int, Any] = {}       # term id -> (docs, tf) của document thêm
+        if weights is None:
+            weights = self._weights(idf, indptr, docs, tf)
+        self.matrix = csr_matrix((weights, docs, indptr), shape=(len(terms), self.corpus_size), copy=False)
+
+    def _weights(self, idf, indptr, docs, tf) -> np.ndarray:
+        """Trọng số BM25 cho từng posting (idf theo term, chuẩn hoá theo độ dài document)."""
+        len_norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len) / self.avgdl)
+        idf_per_posting = np.repeat(np.asarray(idf), np.diff(indptr))
+        return idf_per_posting * (tf * (self.k1 + 1) / (tf + len_norm[docs]))
+
+    @classmethod
+    def fit(cls, tokenized: List[List[str]], k1: float = 1.5, b: float = 0.75,
+            epsilon: float = 0.25) -> "BM25Index":
+        term_ids: Dict[str, int] = {}
+        df: List[int] = []
+        post_terms, post_docs, post_tf, doc_len = [], [], [], []
+        num_tokens = 0
+
+        for d, doc in enumerate(tokenized):
+            doc_len.append(len(doc))
+            num_tokens += len(doc)
+            freqs: Dict[str, int] = {}
+            for word in doc:
+                freqs[word] = freqs.get(word, 0) + 1
+            for word, freq in freqs.items():
+                tid = term_ids.get(word)
+                if tid is None:
+                    tid = term_ids[word] = len(df)
+                    df.append(0)
+                df[tid] += 1
+                post_terms.append(tid)
+                post_docs.append(d)
+                post_tf.append(freq)
+
+        n_docs = len(tokenized)
+        post_terms = np.asarray(post_terms, dtype=np.int64)
+        order = np.argsort(post_terms, kind="stable")
+        indptr = np.zeros(len(df) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(post_terms, minlength=len(df)), out=indptr[1:])
+
+        terms = [None] * len(df)
+        for word, tid in term_ids.items():
+            terms[tid] = word
+
+        return cls(
+            terms=terms,
+            idf=_okapi_idf(df, n_docs, epsilon),
+            doc_len=np.asarray(doc_len, dtype=np.int64),
+            indptr=indptr,
+            docs=np.asarray(post_docs, dtype=np.int32)[order],
+            tf=np.asarray(post_tf, dtype=np.int32)[order],
+            avgdl=num_tokens / n_docs, k1=k1, b=b, epsilon=epsilon,
+        )
+
+    @property
+    def has_changes(self) -> bool:
+        return self.live is not None or bool(self._added)
+
+    def with_changes(self, live: np.ndarray, added_docs: List[List[str]]) -> "BM25Index":
+        """
+        New index with `added_docs` appended (positions corpus_size...) and
+        documents where `live` is False tombstoned. Base arrays are shared.
+        """
+        new = copy.copy(self)
+        new._added = self._added + [list(doc) for doc in added_docs]
+        new.live = live
+
+        terms = list(self.terms)
+        term_ids = dict(self.term_ids)
+        overlay: Dict[int, Any] = {}
+        for i, doc in enumerate(new._added):
+            pos = self.n_base + i
+            freqs: Dict[str, int] = {}
+            for word in doc:
+                freqs[word] = freqs.get(word, 0) + 1
+            for word, freq in freqs.items():
+                tid = term_ids.get(word)
+                if tid is None:
+                    tid = term_ids[word] = len(terms)
+                    terms.append(word)
+                docs, tfs = overlay.setdefault(tid, ([], []))
+                docs.append(pos)
+                tfs.append(freq)
+        new.terms = terms
+        new.term_ids = term_ids
+        new._overlay = {
+            tid: (np.asarray(docs, dtype=np.int64), np.asarray(tfs, dtype=np.int64))
+            for tid, (docs, tfs) in overlay.items()
+        }
+
+        added_len = np.asarray([len(doc) for doc in new._added], dtype=np.int64)
+        new.doc_len = np.concatenate([np.asarray(self.doc_len[:self.n_base]), added_len])
+        new.corpus_size = len(new.doc_len)
+
+        # Posting còn sống: base + overlay, bỏ document đã xoá, sắp theo (term, doc)
+        n_base_terms = len(self.indptr) - 1
+        post_terms = np.concatenate(
+            [np.repeat(np.arange(n_base_terms), np.diff(self.indptr))]
+            + [np.full(len(d), tid, dtype=np.int64) for tid, (d, _) in new._overlay.items()]
+        )
+        post_docs = np.concatenate([np.asarray(self.docs, dtype=np.int64)] + [d for d, _ in new._overlay.values()])
+        post_tf = np.concatenate([np.asarray(self.tf, dtype=np.int64)] + [f for _, f in new._overlay.values()])
+        alive = live[post_docs]
+        post_terms, post_docs, post_tf = post_terms[alive], post_docs[alive], post_tf[alive]
+        order = np.lexsort((post_docs, post_terms))
+        post_terms, post_docs, post_tf = post_terms[order], post_docs[order], post_tf[order]
+
+        # df / N / avgdl chỉ tính trên document còn sống
+        df = np.bincount(post_terms, minlength=len(terms))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+        n_live = int(live.sum())
+        new.idf = _okapi_idf(df, n_live, self.epsilon)
+        new.avgdl = float(new.doc_len[live].sum() / n_live) if n_live else 1.0
+        new.matrix = csr_matrix(
+            (new._weights(new.idf, indptr, post_docs, post_tf), post_docs, indptr),
+            shape=(len(terms), new.corpus_size),
+        )
+        return new
+
+    def _query_matrix(self, queries: List[List[str]]):
+        """Term counts của các query (hàng = query), bỏ qua term ngoài vocabulary."""
+        rows, cols, vals = [], [], []
+        for r, query in enumerate(queries):
+            counts: Dict[int, int] = {}
+            for q in query:
+                tid = self.term_ids.get(q)
+                if tid is not None:
+                    counts[tid] = counts.get(tid, 0) + 1
+            for tid, count in counts.items():
+                rows.append(r)
+                cols.append(tid)
+                vals.append(float(count))
+        return csr_matrix((vals, (rows, cols)), shape=(len(queries), len(self.terms)))
+
+    def get_batch_scores(self, queries: List[List[str]]):
+        """Điểm BM25 của nhiều query: CSR (query x document), một phép nhân sparse."""
+        return (self._query_matrix(queries) @ self.matrix).tocsr()
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        return self.get_batch_scores([query]).toarray()[0]
+
+
+def project_row(row: Any) -> Dict[str, Any]:
+    """Projected fields of a `drugs` row (same shape as `DrugCorpus.record`)."""
+    row = dict(row)
+    return {field: row.get(field) for field in PROJECTED_FIELDS}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenizer BM25 dùng chung cho build index, delta, query đơn và batch.
+
+    Giữ tách theo khoảng trắng (không dùng regex của TF-IDF): token như
+    "vd-30311-18" phải giữ nguyên, tách ra "vd"/"18" làm BM25 khớp nhầm.
+    """
+    return text.lower().split()
+
+
+class ExactIndex:
+    """
+    Level-1 lookup không cần SQL: tên gốc / tên đã normalize / SDK -> dòng corpus.
+
+    Mỗi key giữ danh sách (id, position); trùng key thì id nhỏ nhất thắng
+    (giống thứ tự `SELECT ... WHERE ten_thuoc = ?` trả về trước đây).
+    """
+
+    def __init__(self, normalize: Callable[[str], str]):
+        self.normalize = normalize
+        self.by_name: Dict[str, List[Any]] = {}
+        self.by_norm: Dict[str, List[Any]] = {}
+        self.by_sdk: Dict[str, List[Any]] = {}
+
+    @staticmethod
+    def sdk_key(sdk: Optional[str]) -> str:
+        return normalize_sdk(sdk)
+
+    def _keys(self, name: Optional[str], sdk: Optional[str]):
+        if name:
+            yield self.by_name, name
+            norm = self.normalize(name)
+            if norm:
+                yield self.by_norm, norm
+        sdk = self.sdk_key(sdk)
+        if sdk:
+            yield self.by_sdk, sdk
+
+    def add(self, pos: int, drug_id: int, name: Optional[str], sdk: Optional[str]) -> None:
+        entry = (drug_id, pos)
+        for table, key in self._keys(name, sdk):
+            # Copy-on-write: list có thể đang được snapshot cũ dùng chung
+            table[key] = table.get(key, []) + [entry]
+
+    def remove(self, pos: int, name: Optional[str], sdk: Optional[str]) -> None:
+        for table, key in self._keys(name, sdk):
+            entries = [e for e in table.get(key, ()) if e[1] != pos]
+            if entries:
+                table[key] = entries
+            else:
+                table.pop(key, None)
+
+    def copy(self) -> "ExactIndex":
+        new = ExactIndex(self.normalize)
+        new.by_name = dict(self.by_name)
+        new.by_norm = dict(self.by_norm)
+        new.by_sdk = dict(self.by_sdk)
+        return new
+
+    @staticmethod
+    def _first(entries) -> Optional[int]:
+        return min(entries)[1] if entries else None
+
+    def lookup_name(self, name: str) -> Optional[int]:
+        return self._first(self.by_name.get(name))
+
+    def lookup_norm(self, normalized: str) -> Optional[int]:
+        return self._first(self.by_norm.get(normalized))
+
+    def lookup_sdk(self, sdk: str) -> Optional[int]:
+        return self._first(self.by_sdk.get(self.sdk_key(sdk)))
+
+
+class DrugCorpus:
+    """
+    Immutable snapshot of verified drugs used by the matching cascade.
+
+    Dữ liệu thuốc nằm trong `catalogue` (columnar, xem drug_catalogue.py);
+    `names`, `sdks`... là view theo cột, `rows` là sequence các `DrugRow`.
+    """
+
+    def __init__(self, version: int, rows: Union[List[Dict[str, Any]], DrugCatalogue],
+                 stored: Optional[Dict[str, Any]] = None):
+        self.version = version
+        self.loaded_at = time.time()
+        self.live: Optional[np.ndarray] = None  # None = không có tombstone
+        self._set_catalogue(rows if isinstance(rows, DrugCatalogue) else DrugCatalogue(rows))
+        self.positions = {drug_id: pos for pos, drug_id in enumerate(self.catalogue.ids.tolist())}  # chỉ id còn sống
+        self.delta_size = 0  # số dòng thêm/tombstone từ lần build đầy đủ gần nhất
+        self.change_seq = 0  # id drug_changes cuối cùng đã phản ánh trong snapshot
+        self._exact: Dict[Callable, ExactIndex] = {}  # normalizer -> ExactIndex (build lazy)
+        self._blocker: Optional[FuzzyBlocker] = None  # prefilter RapidFuzz (build lazy)
+        self._composition: Optional[CompositionIndex] = None  # hoạt chất + hàm lượng (build lazy)
+
+        self.vectorizer = None
+        self.tfidf_matrix = None
+        self.bm25_index: Optional[BM25Index] = None
+        self.index_path = stored["path"] if stored else None
+
+        if not len(self.catalogue):
+            return
+        if stored is not None:
+            self._load_stored(stored)
+            return
+
+        if _sklearn_available:
+            documents = self.corpus
+            self.vectorizer = TfidfVectorizer(token_pattern=TOKEN_PATTERN)
+            self.tfidf_matrix = self.vectorizer.fit_transform(documents)
+            self.bm25_index = BM25Index.fit([tokenize(doc) for doc in documents])
+
+    def _set_catalogue(self, catalogue: DrugCatalogue) -> None:
+        self.catalogue = catalogue
+        self.ids = IntColumn(catalogue.ids)
+        self.names = MaskedColumn(catalogue.names, self.live)  # tên bị xoá đọc là None
+        self.sdks = catalogue.sdks
+        self.ingredients = catalogue.ingredients
+        self.indications = catalogue.indications
+        self.classifications = catalogue.classifications
+        self.verified = catalogue.verified
+
+    @property
+    def rows(self) -> RowsView:
+        return RowsView(self.catalogue)
+
+    @property
+    def corpus(self) -> List[str]:
+        """Documents indexed by TF-IDF/BM25 (computed on demand)."""
+        return self.catalogue.documents()
+
+    def _load_stored(self, stored: Dict[str, Any]) -> None:
+        meta = stored["meta"]
+        if not _sklearn_available:
+            return
+        vocab = {term: col for col, term in enumerate(stored["tfidf_vocab"])}
+        self.vectorizer = TfidfVectorizer(token_pattern=TOKEN_PATTERN, vocabulary=vocab)
+        self.vectorizer.idf_ = np.array(stored["tfidf_idf"])
+        self.tfidf_matrix = csr_matrix(
+            (stored["tfidf_data"], stored["tfidf_indices"], stored["tfidf_indptr"]),
+            shape=tuple(meta["tfidf_shape"]),
+            copy=False,
+        )
+        bm25 = meta["bm25"]
+        self.bm25_index = BM25Index(
+            terms=stored["bm25_terms"],
+            idf=stored["bm25_idf"],
+            doc_len=stored["bm25_doc_len"],
+            indptr=stored["bm25_indptr"],
+            docs=stored["bm25_docs"],
+            tf=stored["bm25_tf"],
+            avgdl=bm25["avgdl"], k1=bm25["k1"], b=bm25["b"], epsilon=bm25.get("epsilon", 0.25),
+            weights=stored["bm25_weights"],
+        )
+
+    def with_changes(self, version: int, removed_ids: List[int], added_rows: List[Dict[str, Any]]) -> "DrugCorpus":
+        """
+        New snapshot with `removed_ids` tombstoned and `added_rows` appended.
+
+        Tên bị xoá thành None (RapidFuzz bỏ qua), hàng TF-IDF tương ứng về 0 và
+        điểm BM25 về 0, nên vị trí các dòng cũ không đổi. Dòng mới được vector hoá
+        bằng vocabulary/idf hiện tại; idf TF-IDF chỉ được tính lại khi compaction.
+        """
+        new = copy.copy(self)
+        new.version = version
+        new.loaded_at = time.time()
+
+        positions = dict(self.positions)
+        live = self.live.copy() if self.live is not None else np.ones(len(self.catalogue), dtype=bool)
+        removed = []
+        for drug_id in removed_ids:
+            pos = positions.pop(drug_id, None)
+            if pos is not None:
+                live[pos] = False
+                removed.append(pos)
+
+        start = len(self.catalogue)
+        added_docs = [r['search_text'] or r['ten_thuoc'] for r in added_rows]
+        for i, r in enumerate(added_rows):
+            positions[r['id']] = start + i
+        new.positions = positions
+        new.live = np.concatenate([live, np.ones(len(added_rows), dtype=bool)])
+        new._set_catalogue(self.catalogue.with_added(added_rows))
+        new.delta_size = self.delta_size + len(removed) + len(added_rows)
+
+        new._exact = {}
+        for normalize, index in self._exact.items():
+            index = index.copy()
+            for pos in removed:
+                index.remove(pos, self.catalogue.names[pos], self.catalogue.sdks[pos])
+            for i, r in enumerate(added_rows):
+                index.add(start + i, r['id'], r['ten_thuoc'], r['so_dang_ky'])
+            new._exact[normalize] = index
+        if self._blocker is not None:
+            # Tên mới luôn là ứng viên; tên bị xoá là None và bị RapidFuzz bỏ qua
+            new._blocker = self._blocker.with_added([r['ten_thuoc'] for r in added_rows])
+        if self._composition is not None:
+            index = self._composition.copy()
+            for pos in removed:
+                index.remove(pos, self.catalogue.ingredients[pos])
+            for i, r in enumerate(added_rows):
+                index.add(start + i, r['id'], r.get('hoat_chat'))
+            new._composition = index
+
+        if self.tfidf_matrix is not None:
+            matrix = self.tfidf_matrix
+            if removed:
+                matrix = matrix.copy()
+                matrix.data[np.repeat(~live, np.diff(matrix.indptr))] = 0.0
+                matrix.eliminate_zeros()
+            if added_rows:
+                matrix = sparse_vstack([matrix, self.vectorizer.transform(added_docs)], format="csr")
+            new.tfidf_matrix = matrix
+        if self.bm25_index is not None:
+            new.bm25_index = self.bm25_index.with_changes(new.live, [tokenize(doc) for doc in added_docs])
+        elif added_rows and not len(self.catalogue):
+            # Corpus rỗng lúc build: fit lần đầu thay vì delta
+            return DrugCorpus(version, list(added_rows))
+        return new
+
+    def exact_index(self, normalize: Callable[[str], str]) -> ExactIndex:
+        """Exact-match maps for this snapshot, keyed with `normalize` (built on first use)."""
+        index = self._exact.get(normalize)
+        if index is None:
+            index = ExactIndex(normalize)
+            catalogue = self.catalogue
+            for pos in sorted(self.positions.values()):
+                index.add(pos, int(catalogue.ids[pos]), catalogue.names[pos], catalogue.sdks[pos])
+            self._exact[normalize] = index
+        return index
+
+    def fuzzy_blocker(self) -> FuzzyBlocker:
+        """Candidate prefilter over `names` for RapidFuzz (built on first use)."""
+        if self._blocker is None:
+            self._blocker = FuzzyBlocker(self.names)
+        return self._blocker
+
+    def composition_index(self) -> CompositionIndex:
+        """(hoạt chất, hàm lượng, đơn vị) set -> drug, from `hoat_chat` (built on first use)."""
+        if self._composition is None:
+            index = CompositionIndex()
+            catalogue = self.catalogue
+            for pos in sorted(self.positions.values()):
+                index.add(pos, int(catalogue.ids[pos]), catalogue.ingredients[pos])
+            self._composition = index
+        return self._composition
+
+    def record(self, pos: int) -> Dict[str, Any]:
+        """PROJECTED_FIELDS of the drug at `pos`, built from the columns (no SQL)."""
+        return {
+            "id": self.ids[pos],
+            "ten_thuoc": self.names[pos],
+            "so_dang_ky": self.sdks[pos],
+            "hoat_chat": self.ingredients[pos],
+            "chi_dinh": self.indications[pos],
+            "is_verified": int(self.verified[pos]),
+            "classification": self.classifications[pos],
+        }
+
+    @property
+    def bm25_corpus(self) -> List[List[str]]:
+        """Tokenized documents as fed to BM25 (computed on demand)."""
+        return [tokenize(doc) for doc in self.corpus]
+
+    def __len__(self):
+        return len(self.positions)
+
+
+# Thứ tự "dòng KB tốt nhất": có TDV feedback > frequency > last_updated
+KB_RANK_ORDER = """
+    (CASE WHEN tdv_feedback IS NOT NULL AND tdv_feedback != '' AND tdv_feedback != 'None' AND tdv_feedback != 'null' THEN 1 ELSE 0 END) DESC,
+    frequency DESC,
+    last_updated DESC
+"""
+KB_ROW_FIELDS = ("treatment_type", "tdv_feedback", "frequency")
+
+
+class KBNameCorpus:
+    """
+    Immutable snapshot of distinct knowledge_base drug names.
+
+    `best_by_pair` / `best_by_drug`: dòng KB xếp hạng cao nhất (KB_RANK_ORDER)
+    cho mỗi (drug_name_norm, disease_icd) và mỗi drug_name_norm, lưu dạng
+    tuple KB_ROW_FIELDS. Consultation tra dict thay vì ORDER BY mỗi cặp.
+    """
+
+    def __init__(self, version: int, names: List[str], rows: Optional[List[tuple]] = None,
+                 fingerprint: Optional[tuple] = None):
+        self.version = version
+        self.loaded_at = time.time()
+        self.names = names
+        self.name_set = frozenset(names)
+        self.fingerprint = fingerprint
+        self.best_by_pair: Dict[tuple, tuple] = {}
+        self.best_by_drug: Dict[str, tuple] = {}
+        # rows: (drug_name_norm, disease_icd, *KB_ROW_FIELDS) đã theo KB_RANK_ORDER -> dòng đầu thắng
+        for norm, icd, *fields in rows or ():
+            fields = tuple(fields)
+            self.best_by_drug.setdefault(norm, fields)
+            if icd is not None:
+                self.best_by_pair.setdefault((norm, icd), fields)
+        self.vectorizer = None
+        self.tfidf_matrix = None
+        self._blocker: Optional[FuzzyBlocker] = None
+
+        if names and _sklearn_available:
+            self.vectorizer = TfidfVectorizer(
+                token_pattern=TOKEN_PATTERN,
+                ngram_range=(1, 2)  # Include bigrams for better matching
+            )
+            self.tfidf_matrix = self.vectorizer.fit_transform(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def has_rows(self) -> bool:
+        return bool(self.best_by_drug)
+
+    def best_row(self, drug_name_norm: str, disease_icd: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Best-ranked KB row for (drug, icd), or for the drug alone when `disease_icd` is None."""
+        if disease_icd is None:
+            fields = self.best_by_drug.get(drug_name_norm)
+        else:
+            fields = self.best_by_pair.get((drug_name_norm, disease_icd))
+        if fields is None:
+            return None
+        return {"drug_name_norm": drug_name_norm, **dict(zip(KB_ROW_FIELDS, fields))}
+
+    def fuzzy_blocker(self) -> FuzzyBlocker:
+        """Candidate prefilter over `names` for RapidFuzz (built on first use)."""
+        if self._blocker is None:
+            self._blocker = FuzzyBlocker(self.names)
+        return self._blocker
+
+
+class DrugIndexService:
+    """
+    Owner of the shared drug/KB corpora for one database.
+
+    Usage:
+        index = get_drug_index(db_core)
+        corpus = index.drugs()       # lazy build, then cached
+        index.refresh_drugs()        # full rebuild -> version + 1
+
+    Các write path (approve/save/delete) ghi vào bảng `drug_changes`; mỗi worker
+    đọc change feed (tối đa mỗi `POLL_INTERVAL` giây, hoặc ngay qua
+    `notify_drug_changes`) và áp delta lên snapshot hiện tại. Khi delta đủ lớn,
+    compaction build lại đầy đủ ở background.
+    """
+
+    def __init__(self, db_core: DatabaseCore = None, persist: Optional[bool] = None,
+                 poll_interval: float = POLL_INTERVAL):
+        if db_core is None:
+            self.db_core = DatabaseCore()
+        else:
+            self.db_core = db_core
+
+        # Index file chỉ dùng cho database thật (không cho test doubles)
+        if persist is None:
+            persist = INDEX_ENABLED and isinstance(self.db_core, DatabaseCore)
+        self.persist = persist
+        self.poll_interval = poll_interval
+        # Change feed chỉ đọc từ database thật (test doubles không có bảng drug_changes)
+        self._feed_enabled = isinstance(self.db_core, DatabaseCore)
+
+        self._lock = threading.RLock()
+        self._version = 0
+        self._drugs: Optional[DrugCorpus] = None
+        self._kb: Optional[KBNameCorpus] = None
+
+        self._change_seq = 0       # id drug_changes cuối cùng đã áp vào _drugs
+        self._last_poll = time.monotonic()
+        self._kb_last_poll = time.monotonic()
+        self._compacting = False
+        self._metrics = {"changes_applied": 0, "syncs": 0, "compactions": 0}
+        self._result_caches: Dict[str, ResultCache] = {}
+
+    @property
+    def version(self) -> int:
+        """Data version, bumped on every rebuild or delta of any corpus."""
+        return self._version
+
+    def _next_version(self) -> int:
+        self._version += 1
+        return self._version
+
+    # ------------------------------------------------------------------
+    # Drugs corpus
+    # ------------------------------------------------------------------
+    def drugs(self) -> DrugCorpus:
+        corpus = self._drugs
+        if corpus is None:
+            with self._lock:
+                if self._drugs is None:
+                    self._set_drugs(self._build_drugs(), full_build=True)
+                return self._drugs
+
+        if (self._feed_enabled and self.poll_interval >= 0
+                and time.monotonic() - self._last_poll >= self.poll_interval):
+            # Không chặn reader: nếu đang có thread khác sync/build thì dùng snapshot hiện tại
+            self.sync(blocking=False)
+            return self._drugs
+        return corpus
+
+    def result_cache(self, name: str) -> ResultCache:
+        """
+        Named result cache shared by all services on this database. Callers
+        key lookups with `drugs().version`, so every rebuild/delta invalidates it.
+        """
+        cache = self._result_caches.get(name)
+        if cache is None:
+            with self._lock:
+                cache = self._result_caches.setdefault(name, ResultCache())
+        return cache
+
+    def refresh_drugs(self) -> DrugCorpus:
+        """Force full reload of drugs from database."""
+        with self._lock:
+            self._set_drugs(self._build_drugs(), full_build=True)
+            return self._drugs
+
+    def _set_drugs(self, corpus: DrugCorpus, full_build: bool = False) -> None:
+        self._drugs = corpus
+        self._change_seq = corpus.change_seq
+        if full_build:
+            _release_memory()
+
+    def sync(self, blocking: bool = True) -> int:
+        """
+        Apply pending rows of the `drug_changes` feed to the current snapshot.
+        Returns the number of drugs updated (0 if nothing to do / lock busy).
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return 0
+        try:
+            self._last_poll = time.monotonic()
+            if self._drugs is None:
+                return 0
+            applied = self._apply_changes()
+        finally:
+            self._lock.release()
+        if applied and self._needs_compaction():
+            self._start_compaction()
+        return applied
+
+    def _apply_changes(self) -> int:
+        changes = self._fetch_changes(self._change_seq)
+        if not changes:
+            return 0
+
+        drug_ids = list(dict.fromkeys(drug_id for _, drug_id in changes if drug_id is not None))
+        rows = self._load_drug_rows(drug_ids) if drug_ids else []
+        # Upsert = tombstone dòng cũ + thêm dòng hiện tại (nếu vẫn verified)
+        corpus = self._drugs.with_changes(self._next_version(), drug_ids, rows)
+        corpus.change_seq = changes[-1][0]
+        self._set_drugs(corpus)
+        self._metrics["syncs"] += 1
+        self._metrics["changes_applied"] += len(drug_ids)
+        print(f"[DrugIndex] Applied {len(drug_ids)} drug changes "
+              f"(version {self._drugs.version}, delta {self._drugs.delta_size})")
+        return len(drug_ids)
+
+    def _fetch_changes(self, after_seq: int) -> List[Any]:
+        if not self._feed_enabled:
+            return []
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, drug_id FROM drug_changes WHERE id > ? ORDER BY id", (after_seq,))
+            return [
+                (row['id'], row['drug_id']) if isinstance(row, dict) else (row[0], row[1])
+                for row in cursor.fetchall()
+            ]
+        except Exception as e:
+            print(f"[DrugIndex] Change feed read error: {e}")
+            return []
+        finally:
+            conn.close()
+
+    def _latest_change_seq(self) -> int:
+        if not self._feed_enabled:
+            return 0
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT MAX(id) AS seq FROM drug_changes")
+            row = cursor.fetchone()
+            seq = row['seq'] if isinstance(row, dict) else (row[0] if row else None)
+            return int(seq or 0)
+        except Exception:
+            return 0
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+    def _needs_compaction(self) -> bool:
+        corpus = self._drugs
+        if corpus is None or not corpus.delta_size:
+            return False
+        return corpus.delta_size >= max(COMPACT_MIN, int(len(corpus) * COMPACT_RATIO))
+
+    def _start_compaction(self) -> None:
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, name="drug-index-compact", daemon=True).start()
+
+    def compact(self) -> DrugCorpus:
+        """
+        Full rebuild (refit TF-IDF/BM25, write index file) without blocking
+        readers, then re-apply changes that arrived during the rebuild.
+        """
+        with self._lock:
+            self._compacting = True
+        try:
+            corpus = self._build_drugs(assign_version=False)
+            with self._lock:
+                corpus.version = self._next_version()
+                self._set_drugs(corpus, full_build=True)
+                self._apply_changes()
+                self._metrics["compactions"] += 1
+                self._prune_changes()
+                return self._drugs
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def _prune_changes(self) -> None:
+        """Keep only the last CHANGES_KEEP rows of the change feed."""
+        if self._change_seq <= CHANGES_KEEP:
+            return
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM drug_changes WHERE id <= ?", (self._change_seq - CHANGES_KEEP,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[DrugIndex] Change feed prune error: {e}")
+        finally:
+            conn.close()
+
+    def _build_drugs(self, assign_version: bool = True) -> DrugCorpus:
+        # Đọc seq trước dữ liệu: thay đổi xảy ra trong lúc load sẽ được áp lại (idempotent)
+        seq = self._latest_change_seq()
+        rows = self._load_drug_rows()
+
+        stored = None
+        fingerprint = None
+        index_dir = None
+        if rows and self.persist:
+            index_dir = default_index_dir(self.db_core)
+            fingerprint = corpus_fingerprint(rows, TOKEN_PATTERN)
+            stored = load_index(fingerprint, index_dir, len(rows))
+
+        # Chuyển sang catalogue và bỏ list dict trước khi fit TF-IDF/BM25: object
+        # sống lâu của index không nằm xen giữa các dòng tạm (heap trả lại được cho OS)
+        catalogue = DrugCatalogue(rows)
+        del rows
+        corpus = DrugCorpus(self._next_version() if assign_version else 0, catalogue, stored=stored)
+        corpus.change_seq = seq
+        if stored is not None:
+            print(f"[DrugIndex] Loaded {len(corpus)} drugs (version {corpus.version}) "
+                  f"from index file {corpus.index_path}")
+            return corpus
+
+        print(f"[DrugIndex] Loaded {len(corpus)} drugs (version {corpus.version})")
+        if fingerprint:
+            # Lưu lại để lần khởi động sau (và các worker khác) chỉ cần mmap
+            try:
+                corpus.index_path = save_index(corpus, fingerprint, index_dir)
+                prune_indexes(index_dir, current=corpus.index_path)
+            except Exception as e:
+                print(f"[DrugIndex] Cannot save index file to {index_dir}: {e}")
+        return corpus
+
+    def _load_drug_rows(self, drug_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        rows = []
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            # Chỉ lấy thuốc đã verified có SDK. ORDER BY id: thứ tự dòng phải ổn định
+            # vì index file được map theo vị trí dòng.
+            sql = """
+                SELECT id, ten_thuoc, so_dang_ky, hoat_chat, search_text,
+                       chi_dinh, is_verified, classification
+                FROM drugs
+                WHERE is_verified=1 AND so_dang_ky IS NOT NULL AND so_dang_ky != ''
+            """
+            if drug_ids is None:
+                cursor.execute(sql + " ORDER BY id")
+                rows = [dict(row) for row in cursor.fetchall()]
+            else:
+                for i in range(0, len(drug_ids), 500):
+                    chunk = drug_ids[i:i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor.execute(sql + f" AND id IN ({placeholders}) ORDER BY id", tuple(chunk))
+                    rows.extend(dict(row) for row in cursor.fetchall())
+        except Exception as e:
+            print(f"[DrugIndex] Drug corpus load error: {e}")
+        finally:
+            conn.close()
+        return rows
+
+    def drug_details(self, drug_id: int, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Lazy accessor cho các cột không nằm trong PROJECTED_FIELDS (note,
+        cong_ty_san_xuat, tu_dong_nghia, audit...): đọc thẳng từ DB theo id.
+        `columns=None` -> toàn bộ dòng.
+        """
+        if columns is not None:
+            unknown = [c for c in columns if not c.isidentifier()]
+            if unknown:
+                raise ValueError(f"Invalid column names: {unknown}")
+        select = ", ".join(["id", *columns]) if columns else "*"
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {select} FROM drugs WHERE id = ?", (drug_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def drug_details_many(self, drug_ids: List[int], columns: Optional[List[str]] = None) -> Dict[int, Dict[str, Any]]:
+        """`drug_details` cho nhiều id trong một câu SQL -> {id: row}."""
+        ids = list(dict.fromkeys(i for i in drug_ids if i is not None))
+        if not ids:
+            return {}
+        if columns is not None:
+            unknown = [c for c in columns if not c.isidentifier()]
+            if unknown:
+                raise ValueError(f"Invalid column names: {unknown}")
+        select = ", ".join(["id", *columns]) if columns else "*"
+        placeholders = ", ".join("?" * len(ids))
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {select} FROM drugs WHERE id IN ({placeholders})", ids)
+            rows = [dict(row) for row in cursor.fetchall()]
+            return {row["id"]: row for row in rows}
+        finally:
+            conn.close()
+
+    def build_index_file(self) -> Optional[str]:
+        """
+        Rebuild the drugs corpus and make sure its index file exists on disk.
+        Used by scripts/build_drug_index.py before deploy. Returns the file path.
+        """
+        with self._lock:
+            corpus = self._build_drugs()
+            self._set_drugs(corpus, full_build=True)
+        return corpus.index_path
+
+    # ------------------------------------------------------------------
+    # Knowledge base names corpus
+    # ------------------------------------------------------------------
+    def kb_names(self) -> KBNameCorpus:
+        corpus = self._kb
+        if corpus is not None and len(corpus):
+            if (self._feed_enabled and self.poll_interval >= 0
+                    and time.monotonic() - self._kb_last_poll >= self.poll_interval):
+                self.sync_kb(blocking=False)
+                return self._kb
+            return corpus
+        with self._lock:
+            # Empty KB is not cached: the next call retries (data may have been ingested)
+            if self._kb is None or not len(self._kb):
+                self._kb = self._build_kb()
+            return self._kb
+
+    def refresh_kb(self) -> KBNameCorpus:
+        """Force reload knowledge_base names. Call after data ingest."""
+        with self._lock:
+            self._kb = self._build_kb()
+            return self._kb
+
+    def has_kb(self) -> bool:
+        """True khi đã có snapshot KB kèm bảng dòng tốt nhất (không build)."""
+        kb = self._kb
+        return kb is not None and kb.has_rows
+
+    def sync_kb(self, blocking: bool = True) -> bool:
+        """
+        Rebuild the KB snapshot if knowledge_base changed since it was built
+        (ETL khác worker, sync link, xoá...). Returns True if rebuilt.
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        try:
+            self._kb_last_poll = time.monotonic()
+            if self._kb is None or self._kb_fingerprint() == self._kb.fingerprint:
+                return False
+            self._kb = self._build_kb()
+            return True
+        finally:
+            self._lock.release()
+
+    def _kb_fingerprint(self) -> Optional[tuple]:
+        """Rẻ hơn build: đổi khi có insert/delete (count, max id) hoặc update (frequency, last_updated)."""
+        if not self._feed_enabled:
+            return None
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT COUNT(*) AS n, MAX(id) AS max_id, MAX(last_updated) AS updated,
+                       COALESCE(SUM(frequency), 0) AS freq
+                FROM knowledge_base
+            """)
+            row = cursor.fetchone()
+            return tuple(row[k] for k in ("n", "max_id", "updated", "freq")) if row else None
+        except Exception as e:
+            print(f"[DrugIndex] KB fingerprint error: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def _build_kb(self) -> KBNameCorpus:
+        names = []
+        rows = []
+        fingerprint = self._kb_fingerprint()
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT DISTINCT drug_name_norm
+                FROM knowledge_base
+                WHERE drug_name_norm IS NOT NULL
+                  AND drug_name_norm != ''
+                  AND drug_name_norm != '_icd_list_'
+            """)
+            for row in cursor.fetchall():
+                val = row['drug_name_norm'] if isinstance(row, dict) else row[0]
+                if val and val.strip():
+                    names.append(val)
+
+            # Một lần sort toàn bảng thay cho ORDER BY ... LIMIT 1 mỗi cặp drug x ICD
+            cursor.execute(f"""
+                SELECT drug_name_norm, disease_icd, {", ".join(KB_ROW_FIELDS)}
+                FROM knowledge_base
+                WHERE drug_name_norm IS NOT NULL
+                ORDER BY {KB_RANK_ORDER}
+            """)
+            fields = ("drug_name_norm", "disease_icd") + KB_ROW_FIELDS
+            for row in cursor.fetchall():
+                rows.append(tuple(row[f] for f in fields) if isinstance(row, dict) else tuple(row))
+        except Exception as e:
+            import traceback
+            print(f"[DrugIndex] KB corpus load error: {e}")
+            traceback.print_exc()
+        finally:
+            conn.close()
+
+        corpus = KBNameCorpus(self._next_version(), names, rows, fingerprint)
+        del rows
+        if names:
+            print(f"[DrugIndex] Loaded {len(names)} unique KB drug names, "
+                  f"{len(corpus.best_by_pair)} best (drug, ICD) rows (version {corpus.version}), "
+                  f"matrix shape: {corpus.tfidf_matrix.shape if corpus.tfidf_matrix is not None else None}")
+        else:
+            print("[DrugIndex] WARNING: No drug names found in knowledge_base!")
+        return corpus
+
+    def stats(self) -> Dict[str, Any]:
+        drugs, kb = self._drugs, self._kb
+        return {
+            "version": self._version,
+            "drugs_loaded": drugs is not None,
+            "drugs_count": len(drugs) if drugs else 0,
+            "drugs_version": drugs.version if drugs else None,
+            "kb_names_count": len(kb) if kb else 0,
+            "kb_version": kb.version if kb else None,
+            "kb_best_rows": len(kb.best_by_pair) if kb else 0,
+            "tfidf_enabled": bool(drugs and drugs.vectorizer is not None),
+            "bm25_enabled": bool(drugs and drugs.bm25_index is not None),
+            "index_file": drugs.index_path if drugs else None,
+            "delta_size": drugs.delta_size if drugs else 0,
+            "change_seq": self._change_seq,
+            "compacting": self._compacting,
+            **self._metrics,
+            "result_caches": {name: cache.stats() for name, cache in self._result_caches.items()},
+        }
+
+
+# ----------------------------------------------------------------------
+# Process-wide registry (one index per database)
+# ----------------------------------------------------------------------
+_INDEXES: Dict[str, DrugIndexService] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_drug_index(db_core: DatabaseCore = None) -> DrugIndexService:
+    """
+    Shared DrugIndexService for the database behind `db_core`.
+    Non-DatabaseCore objects (test doubles) get a private, unshared index.
+    """
+    if db_core is None:
+        db_core = DatabaseCore()
+    if not isinstance(db_core, DatabaseCore):
+        return DrugIndexService(db_core)
+
+    key = db_core.database_key()
+    index = _INDEXES.get(key)
+    if index is None:
+        with _INDEXES_LOCK:
+            index = _INDEXES.get(key)
+            if index is None:
+                index = DrugIndexService(db_core)
+                _INDEXES[key] = index
+    return index
+
+
+# ----------------------------------------------------------------------
+# Change feed (write paths)
+# ----------------------------------------------------------------------
+def record_drug_change(cursor, drug_id: int, op: str) -> None:
+    """
+    Append a change to `drug_changes`. Call inside the writer's transaction,
+    before commit, so the feed and the drugs table never disagree.
+    op: 'insert' | 'update' | 'delete' (chỉ để audit, index luôn đọc lại trạng thái hiện tại).
+    """
+    cursor.execute("INSERT INTO drug_changes (drug_id, op) VALUES (?, ?)", (drug_id, op))
+
+
+def notify_drug_changes(db_core: DatabaseCore = None) -> None:
+    """
+    Apply the change feed now in this process (read-your-writes). Other
+    workers pick the change up on their next poll. Never builds an index.
+    """
+    if db_core is None or not isinstance(db_core, DatabaseCore):
+        return
+    index = _INDEXES.get(db_core.database_key())
+    if index is None:
+        return
+    try:
+        index.sync()
+    except Exception as e:
+        print(f"[DrugIndex] Change sync error: {e}")
+
+
+def notify_kb_changes(db_core: DatabaseCore = None) -> None:
+    """
+    knowledge_base vừa được ghi trong process này: rebuild KB snapshot ngay
+    nếu đã load (read-your-writes). Worker khác thấy thay đổi ở lần poll sau.
+    """
+    if db_core is None or not isinstance(db_core, DatabaseCore):
+        return
+    index = _INDEXES.get(db_core.database_key())
+    if index is None or index._kb is None:
+        return
+    try:
+        index.sync_kb()
+    except Exception as e:
+        print(f"[DrugIndex] KB sync error: {e}")
@@ -0,0 +1,192 @@
+"""
+Drug Index Store - Persisted TF-IDF/BM25 index files
+=====================================================
+Lưu index của `DrugCorpus` (vocabulary + CSR arrays TF-IDF, thống kê BM25)
+ra đĩa, để mỗi worker mở bằng `np.load(mmap_mode='r')` thay vì fit lại
+trên toàn bộ bảng drugs lúc khởi động. Các worker cùng máy dùng chung page
+cache của file thay vì mỗi process giữ một bản ma trận riêng.
+
+Layout:  <index_dir>/drugs-<fingerprint>/
+    meta.json                   format, fingerprint, shape, tham số BM25
+    tfidf_vocab.txt             term theo thứ tự cột (một term mỗi dòng)
+    tfidf_idf.npy, tfidf_{data,indices,indptr}.npy
+    bm25_terms.txt              term BM25 theo term id
+    bm25_idf.npy, bm25_doc_len.npy, bm25_{indptr,docs,tf}.npy  (posting lists)
+    bm25_weights.npy            trọng số BM25 tính sẵn theo posting (data của CSR)
+
+Mỗi mảng là một file .npy riêng vì `.npz` không mmap được. Tên thư mục chứa
+fingerprint nội dung corpus, nên khi bảng drugs thay đổi, file cũ tự bị bỏ qua.
+
+Build trước khi deploy:  python scripts/build_drug_index.py
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+INDEX_FORMAT = 2  # 2: thêm bm25_weights.npy (ma trận trọng số BM25 tính sẵn)
+INDEX_ENABLED = os.getenv("DRUG_INDEX_PERSIST", "true").lower() in ("1", "true", "yes")
+INDEX_DIR = os.getenv("DRUG_INDEX_DIR")  # mặc định: thư mục drug_index/ cạnh file SQLite
+INDEX_KEEP = int(os.getenv("DRUG_INDEX_KEEP", "2"))  # số bản index giữ lại khi dọn
+
+_ARRAYS = (
+    "tfidf_idf", "tfidf_data", "tfidf_indices", "tfidf_indptr",
+    "bm25_idf", "bm25_doc_len", "bm25_indptr", "bm25_docs", "bm25_tf", "bm25_weights",
+)
+_PREFIX = "drugs-"
+
+
+def default_index_dir(db_core) -> str:
+    """Index directory for a DatabaseCore: DRUG_INDEX_DIR, else next to the SQLite file."""
+    if INDEX_DIR:
+        return INDEX_DIR
+    if getattr(db_core, "db_type", None) != "postgres" and getattr(db_core, "db_path", None):
+        return os.path.join(os.path.dirname(os.path.abspath(db_core.db_path)), "drug_index")
+    return os.path.join("app", "database", "drug_index")
+
+
+def corpus_fingerprint(rows: List[Dict[str, Any]], token_pattern: str) -> str:
+    """sha1 over the corpus rows (in order) and the tokenizer settings."""
+    h = hashlib.sha1(f"format={INDEX_FORMAT}|token_pattern={token_pattern}\n".encode("utf-8"))
+    for r in rows:
+        line = "\x1f".join(
+            "" if r.get(k) is None else str(r.get(k))
+            for k in ("id", "ten_thuoc", "so_dang_ky", "hoat_chat", "search_text")
+        )
+        h.update(line.encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def index_path(index_dir: str, fingerprint: str) -> str:
+    return os.path.join(index_dir, f"{_PREFIX}{fingerprint}")
+
+
+def _write_terms(path: str, terms: List[str]) -> None:
+    # Token của cả hai tokenizer không chứa whitespace nên tách dòng là an toàn
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(terms))
+
+
+def _read_terms(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = f.read()
+    return data.split("\n") if data else []
+
+
+def save_index(corpus, fingerprint: str, index_dir: str) -> Optional[str]:
+    """
+    Serialize the fitted TF-IDF/BM25 structures of `corpus` to
+    `<index_dir>/drugs-<fingerprint>/`. Writes to a temp dir then renames, so
+    readers never see a half-written index. Returns the index path.
+    """
+    if corpus.vectorizer is None or corpus.bm25_index is None or corpus.delta_size:
+        # Snapshot có delta chưa compaction: chỉ lưu bản build đầy đủ
+        return None
+
+    target = index_path(index_dir, fingerprint)
+    if os.path.isdir(target):
+        return target
+
+    os.makedirs(index_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=index_dir)
+    try:
+        vocab = corpus.vectorizer.vocabulary_
+        terms = [None] * len(vocab)
+        for term, col in vocab.items():
+            terms[col] = term
+        _write_terms(os.path.join(tmp, "tfidf_vocab.txt"), terms)
+
+        matrix = corpus.tfidf_matrix
+        bm25 = corpus.bm25_index
+        _write_terms(os.path.join(tmp, "bm25_terms.txt"), bm25.terms)
+        arrays = {
+            "tfidf_idf": np.asarray(corpus.vectorizer.idf_),
+            "tfidf_data": matrix.data,
+            "tfidf_indices": matrix.indices,
+            "tfidf_indptr": matrix.indptr,
+            "bm25_idf": bm25.idf,
+            "bm25_doc_len": bm25.doc_len,
+            "bm25_indptr": bm25.indptr,
+            "bm25_docs": bm25.docs,
+            "bm25_tf": bm25.tf,
+            "bm25_weights": bm25.matrix.data,
+        }
+        for name in _ARRAYS:
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arrays[name]))
+
+        meta = {
+            "format": INDEX_FORMAT,
+            "fingerprint": fingerprint,
+            "n_docs": len(corpus),
+            "tfidf_shape": list(matrix.shape),
+            "bm25": {"k1": bm25.k1, "b": bm25.b, "epsilon": bm25.epsilon, "avgdl": bm25.avgdl},
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # Worker khác vừa ghi xong cùng fingerprint
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(target):
+                raise
+        return target
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_index(fingerprint: str, index_dir: str, n_docs: int) -> Optional[Dict[str, Any]]:
+    """
+    Memory-map the index built for `fingerprint`. Returns None when missing
+    or built for different data/format (caller then refits).
+    """
+    path = index_path(index_dir, fingerprint)
+    meta_file = os.path.join(path, "meta.json")
+    if not os.path.isfile(meta_file):
+        return None
+    try:
+        with open(meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("format") != INDEX_FORMAT
+                or meta.get("fingerprint") != fingerprint
+                or meta.get("n_docs") != n_docs):
+            return None
+
+        stored = {"meta": meta, "path": path}
+        for name in _ARRAYS:
+            stored[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        stored["tfidf_vocab"] = _read_terms(os.path.join(path, "tfidf_vocab.txt"))
+        stored["bm25_terms"] = _read_terms(os.path.join(path, "bm25_terms.txt"))
+        return stored
+    except Exception as e:
+        print(f"[DrugIndex] Cannot load index file {path}: {e}")
+        return None
+
+
+def prune_indexes(index_dir: str, keep: int = INDEX_KEEP, current: Optional[str] = None) -> int:
+    """Remove all but the `keep` newest index dirs (never `current`). Returns number removed."""
+    if not os.path.isdir(index_dir):
+        return 0
+    dirs = [
+        os.path.join(index_dir, d) for d in os.listdir(index_dir)
+        if d.startswith(_PREFIX) and os.path.isdir(os.path.join(index_dir, d))
+    ]
+    dirs.sort(key=os.path.getmtime, reverse=True)
+    removed = 0
+    for d in dirs[max(keep, 1):]:
+        if current and os.path.abspath(d) == os.path.abspath(current):
+            continue
+        # Worker đang mmap file cũ vẫn đọc được sau khi unlink (POSIX)
+        shutil.rmtree(d, ignore_errors=True)
+        removed += 1
+    return removed
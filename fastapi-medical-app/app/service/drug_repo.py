@@ -1,5 +1,6 @@
 import sqlite3
 from app.database.core import DatabaseCore
+from app.service.drug_index_service import notify_drug_changes, notify_kb_changes, record_drug_change
 
 class DrugRepository:
     def __init__(self, db_core: DatabaseCore = None):
@@ -71,18 +72,21 @@ class DrugRepository:
         conn = self.db_core.get_connection()
         cursor = conn.cursor()
         try:
+            cursor.execute("SELECT id FROM drugs WHERE so_dang_ky = ?", (sdk,))
+            # Dict or Tuple check
+            row_ids = [row['id'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+
             # Also delete from FTS if exists (SQLite Only)
             if self.db_core.db_type == 'sqlite':
-                cursor.execute("SELECT id FROM drugs WHERE so_dang_ky = ?", (sdk,))
-                row = cursor.fetchone()
-                if row:
-                    # Dict or Tuple check
-                    row_id = row['id'] if isinstance(row, dict) else row[0]
+                for row_id in row_ids:
                     cursor.execute("DELETE FROM drugs_fts WHERE rowid = ?", (row_id,))
             
             cursor.execute("DELETE FROM drugs WHERE so_dang_ky = ?", (sdk,))
             affected = cursor.rowcount
+            for row_id in row_ids:
+                record_drug_change(cursor, row_id, 'delete')
             conn.commit()
+            notify_drug_changes(self.db_core)
             return affected > 0
         except Exception as e:
             conn.rollback()
@@ -103,7 +107,10 @@ class DrugRepository:
             # Delete from main table
             cursor.execute("DELETE FROM drugs WHERE id = ?", (row_id,))
             affected = cursor.rowcount
+            if affected > 0:
+                record_drug_change(cursor, row_id, 'delete')
             conn.commit()
+            notify_drug_changes(self.db_core)
             return affected > 0
         except Exception as e:
             conn.rollback()
@@ -183,6 +190,7 @@ class DrugRepository:
             cursor.execute("DELETE FROM knowledge_base WHERE disease_icd = ?", (icd_code,))
             affected = cursor.rowcount
             conn.commit()
+            notify_kb_changes(self.db_core)
             return affected > 0
         except Exception as e:
             conn.rollback()
@@ -1,10 +1,15 @@
-import sqlite3
 import re
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from app.database.core import DatabaseCore
 from app.core.utils import normalize_text, normalize_for_matching
+from app.service.drug_index_service import get_drug_index, project_row
+from app.service.fuzzy_blocking import extract_one
+from app.service.result_cache import MISS
+
+# search_drug_smart_many: số tên mỗi câu `IN (...)` (giới hạn biến SQLite) / mỗi phép cosine
+EXACT_BATCH_SIZE = 500
+VECTOR_BATCH_SIZE = 64
 
 class DrugSearchService:
     def __init__(self, db_core: DatabaseCore = None):
@@ -13,34 +18,34 @@ class DrugSearchService:
         else:
             self.db_core = db_core
             
-        self.vectorizer = None
-        self.tfidf_matrix = None
-        self.drug_cache = [] 
-        self.fuzzy_names = []
+        # Shared with DrugMatcher / other DrugSearchService instances on the same DB
+        self.index = get_drug_index(self.db_core)
+        self.result_cache = self.index.result_cache("drug_search")
 
     def _load_vector_cache(self):
-        """Load data for vector search if not loaded or stale"""
-        if self.vectorizer and self.tfidf_matrix is not None:
-             return
+        """Return the shared drug index snapshot (built lazily on first use)."""
+        return self.index.drugs()
 
-        conn = self.db_core.get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        try:
-            # Load verified drugs with SDK
-            cursor.execute("SELECT id, ten_thuoc, so_dang_ky, search_text FROM drugs WHERE is_verified=1 AND so_dang_ky IS NOT NULL AND so_dang_ky != ''")
-            rows = cursor.fetchall()
-            self.drug_cache = [dict(row) for row in rows]
-            
-            if self.drug_cache:
-                corpus = [d['search_text'] or d['ten_thuoc'] for d in self.drug_cache]
-                self.vectorizer = TfidfVectorizer(token_pattern=r"(?u)\b\w+\b")
-                self.tfidf_matrix = self.vectorizer.fit_transform(corpus)
-                self.fuzzy_names = [d['ten_thuoc'] for d in self.drug_cache]
-        except Exception as e:
-            print(f"Vector Cache Load Error: {e}")
-        finally:
-            conn.close()
+    # Read-only views kept for backward compatibility
+    @property
+    def drug_cache(self):
+        return self.index.drugs().rows
+
+    @property
+    def fuzzy_names(self):
+        return self.index.drugs().names
+
+    @property
+    def vectorizer(self):
+        return self.index.drugs().vectorizer
+
+    @property
+    def tfidf_matrix(self):
+        return self.index.drugs().tfidf_matrix
+
+    def drug_details(self, drug_id, columns=None):
+        """Cột ngoài PROJECTED_FIELDS của kết quả search (đọc DB theo id)."""
+        return self.index.drug_details(drug_id, columns)
 
     def search_drug_smart_sync(self, query_name: str):
         """
@@ -49,12 +54,45 @@ class DrugSearchService:
         2. Partial/Fuzzy SQL Match (95%)
         3. Vector/Semantic Match (90%)
         Returns: { data: dict, confidence: float, source: str } or None
+
+        Kết quả (kể cả None) được cache theo tên normalized + tên gốc và
+        version của drug index.
         """
+        key = (normalize_for_matching(query_name), query_name.strip())
+        version = self.index.drugs().version
+        cached = self.result_cache.get(key, version)
+        if cached is not MISS:
+            return cached
+        result = self._search_drug_smart_uncached(query_name)
+        self.result_cache.put(key, version, result, negative=result is None)
+        return result
+
+    def _search_drug_smart_uncached(self, query_name: str):
+        raw_query, db_normalized_query, search_variants = self._search_variants(query_name)
+
         conn = self.db_core.get_connection()
         # conn.row_factory = sqlite3.Row # Moved to core abstraction
         cursor = conn.cursor()
-        
-        # 1. Prepare variants
+        try:
+            # 1-2. EXACT / PARTIAL theo từng variant
+            result = self._sql_match(cursor, raw_query, search_variants)
+        finally:
+            conn.close()
+        if result:
+            return result
+
+        # 2.5. FUZZY MATCH (RapidFuzz) - Optimized to load cache only when needed
+        corpus = self._load_vector_cache()
+        result = self._fuzzy_match(corpus, raw_query)
+        if result:
+            return result
+
+        # 3. VECTOR SEARCH
+        return self._vector_match_many(corpus, [db_normalized_query])[0]
+
+    @staticmethod
+    def _search_variants(query_name: str):
+        """(raw, normalized, variants) - variant thử lần lượt ở tầng exact/partial."""
         raw_query = query_name.strip()
         db_normalized_query = normalize_for_matching(query_name)
         
@@ -67,63 +105,144 @@ class DrugSearchService:
             parts = db_normalized_query.rsplit(' ', 1)
             if len(parts) > 1 and re.search(r'\d', parts[1]):
                  search_variants.append(parts[0])
+        return raw_query, db_normalized_query, search_variants
 
-        try:
-            for variant in search_variants:
-                # 1. EXACT MATCH
+    def _sql_match(self, cursor, raw_query: str, search_variants: list, exact_rows: dict = None):
+        """
+        1. EXACT rồi 2. PARTIAL cho từng variant (theo thứ tự).
+        `exact_rows`: {ten_thuoc: row} đã đọc sẵn cho cả batch (`_exact_rows`).
+        """
+        for variant in search_variants:
+            # 1. EXACT MATCH
+            if exact_rows is None:
                 cursor.execute("SELECT * FROM drugs WHERE ten_thuoc = ? AND is_verified=1 AND so_dang_ky IS NOT NULL", (variant,))
                 row = cursor.fetchone()
-                if row:
-                    return {"data": dict(row), "confidence": 1.0, "source": f"Database (Exact{' Fallback' if variant != raw_query else ''})"}
+            else:
+                row = exact_rows.get(variant)
+            if row:
+                return {"data": project_row(row), "confidence": 1.0, "source": f"Database (Exact{' Fallback' if variant != raw_query else ''})"}
 
-                # 2. PARTIAL MATCH
-                match_op = "ILIKE" if self.db_core.db_type == 'postgres' else "LIKE"
-                cursor.execute(f"SELECT * FROM drugs WHERE ten_thuoc {match_op} ? AND is_verified=1 AND so_dang_ky IS NOT NULL", (f"%{variant}%",))
-                row = cursor.fetchone()
-                if row:
-                     return {"data": dict(row), "confidence": 0.95, "source": f"Database (Partial{' Fallback' if variant != raw_query else ''})"}
-
-            # 2.5. FUZZY MATCH (RapidFuzz) - Optimized to load cache only when needed
-            self._load_vector_cache()
-            try:
-                from rapidfuzz import process, fuzz
-                if self.drug_cache:
-                     fuzzy_res = process.extractOne(raw_query, self.fuzzy_names, scorer=fuzz.token_sort_ratio)
-                     if fuzzy_res:
-                         match, score, idx = fuzzy_res
-                         if score >= 85.0:
-                             match_data = self.drug_cache[idx]
-                             cursor.execute("SELECT * FROM drugs WHERE id = ?", (match_data['id'],))
-                             full_row = cursor.fetchone()
-                             if full_row:
-                                 return {"data": dict(full_row), "confidence": 0.88, "source": f"Database (Fuzzy {score:.1f})"}
-            except Exception as e:
-                pass
-
-            # 3. VECTOR SEARCH
-            if self.vectorizer and self.tfidf_matrix is not None:
-                query_vec = self.vectorizer.transform([db_normalized_query])
-                cosine_sim = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-                
-                if cosine_sim.size > 0:
-                    best_idx = np.argmax(cosine_sim)
-                    best_score = cosine_sim[best_idx]
-                    
-                    if best_score > 0.75:
-                        match_data = self.drug_cache[best_idx]
-                        cursor.execute("SELECT * FROM drugs WHERE id = ?", (match_data['id'],))
-                        full_row = cursor.fetchone()
-                        if full_row:
-                             return {"data": dict(full_row), "confidence": 0.90, "source": f"Database (Vector {best_score:.2f})"}
+            # 2. PARTIAL MATCH (trigram index, ranked)
+            self.db_core.substring_search(
+                cursor, "drugs", "ten_thuoc", variant,
+                where="is_verified=1 AND so_dang_ky IS NOT NULL"
+            )
+            row = cursor.fetchone()
+            if row:
+                 return {"data": project_row(row), "confidence": 0.95, "source": f"Database (Partial{' Fallback' if variant != raw_query else ''})"}
+        return None
 
-            return None
-        finally:
-            conn.close()
+    @staticmethod
+    def _exact_rows(cursor, names: list) -> dict:
+        """Tầng exact cho cả batch: {ten_thuoc: dòng id nhỏ nhất} bằng `IN (...)` theo lô."""
+        rows = {}
+        names = list(dict.fromkeys(n for n in names if n))
+        for c in range(0, len(names), EXACT_BATCH_SIZE):
+            chunk = names[c:c + EXACT_BATCH_SIZE]
+            cursor.execute(
+                f"SELECT * FROM drugs WHERE ten_thuoc IN ({', '.join('?' * len(chunk))}) "
+                "AND is_verified=1 AND so_dang_ky IS NOT NULL ORDER BY id",
+                chunk,
+            )
+            for row in cursor.fetchall():
+                rows.setdefault(dict(row)['ten_thuoc'], row)
+        return rows
+
+    @staticmethod
+    def _fuzzy_match(corpus, raw_query: str):
+        try:
+            if len(corpus):
+                 fuzzy_res = extract_one(raw_query, corpus.names, corpus.fuzzy_blocker(), 85.0)
+                 if fuzzy_res:
+                     match, score, idx = fuzzy_res
+                     if score >= 85.0:
+                         return {"data": corpus.record(idx), "confidence": 0.88, "source": f"Database (Fuzzy {score:.1f})"}
+        except Exception as e:
+            pass
+        return None
+
+    @staticmethod
+    def _vector_match_many(corpus, normalized_queries: list) -> list:
+        """Tầng vector cho nhiều query: một phép cosine_similarity mỗi lô (cùng kết quả từng query)."""
+        results = [None] * len(normalized_queries)
+        if not (corpus.vectorizer and corpus.tfidf_matrix is not None):
+            return results
+        for c in range(0, len(normalized_queries), VECTOR_BATCH_SIZE):
+            query_vec = corpus.vectorizer.transform(normalized_queries[c:c + VECTOR_BATCH_SIZE])
+            cosine_sim = cosine_similarity(query_vec, corpus.tfidf_matrix)
+            if cosine_sim.shape[1] == 0:
+                continue
+            for r, row in enumerate(cosine_sim):
+                best_idx = np.argmax(row)
+                best_score = row[best_idx]
+                if best_score > 0.75:
+                    results[c + r] = {"data": corpus.record(int(best_idx)), "confidence": 0.90, "source": f"Database (Vector {best_score:.2f})"}
+        return results
 
     async def search_drug_smart(self, query_name: str):
         """Async wrapper for smart search"""
         return self.search_drug_smart_sync(query_name)
 
+    def search_drug_smart_many(self, query_names: list, detail_columns: list = None) -> list:
+        """
+        `search_drug_smart_sync` cho cả list (cùng thứ tự, cùng kết quả từng tên);
+        gọi qua run_in_threadpool từ code async.
+
+        Cùng cascade exact -> partial -> fuzzy -> vector, chỉ gom lookup: tên trùng
+        (sau khi strip) search một lần, exact một câu `IN (...)`, một connection cho
+        tầng SQL, vector một phép cosine_similarity cho cả lô. Dùng chung result cache.
+        `detail_columns` (vd ['note']): cột ngoài PROJECTED_FIELDS, đọc một lần cho
+        mọi kết quả -> `result['details']`.
+        """
+        unique = list(dict.fromkeys(name.strip() for name in query_names))
+        version = self.index.drugs().version
+        results = {}
+        pending = []
+        for name in unique:
+            cached = self.result_cache.get((normalize_for_matching(name), name), version)
+            if cached is not MISS:
+                results[name] = cached
+            else:
+                pending.append(name)
+        for name, result in zip(pending, self._search_many_uncached(pending)):
+            self.result_cache.put((normalize_for_matching(name), name), version, result, negative=result is None)
+            results[name] = result
+
+        if detail_columns:
+            ids = [r["data"].get("id") for r in results.values() if r and r.get("data")]
+            details = self.index.drug_details_many(ids, detail_columns)
+            for name, result in results.items():
+                if result and result.get("data"):
+                    # Copy: kết quả có thể là object trong result cache
+                    results[name] = dict(result, details=details.get(result["data"].get("id")))
+        return [results[name.strip()] for name in query_names]
+
+    def _search_many_uncached(self, query_names: list) -> list:
+        if not query_names:
+            return []
+        prepared = [self._search_variants(name) for name in query_names]
+        results = [None] * len(prepared)
+
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            exact_rows = self._exact_rows(cursor, [v for _, _, variants in prepared for v in variants])
+            for i, (raw_query, _, variants) in enumerate(prepared):
+                results[i] = self._sql_match(cursor, raw_query, variants, exact_rows)
+        finally:
+            conn.close()
+
+        corpus = self._load_vector_cache()
+        for i, (raw_query, _, _) in enumerate(prepared):
+            if results[i] is None:
+                results[i] = self._fuzzy_match(corpus, raw_query)
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        vector = self._vector_match_many(corpus, [prepared[i][1] for i in pending])
+        for i, result in zip(pending, vector):
+            results[i] = result
+        return results
+
     def search(self, query):
         """Legacy Search: FTS (SQLite) or Text Search (Postgres)"""
         if not query: return None
@@ -0,0 +1,196 @@
+"""
+Fuzzy Blocking - Candidate prefilter trước khi chạy RapidFuzz
+=============================================================
+`process.extractOne(..., scorer=fuzz.token_sort_ratio)` trên toàn bộ tên thuốc
+tốn thời gian tuyến tính theo kích thước catalogue. `FuzzyBlocker` thu hẹp danh
+sách xuống các tên *có thể* đạt `score_cutoff`, rồi RapidFuzz chấm chính xác
+trên tập nhỏ đó - kết quả giống hệt quét toàn bộ.
+
+token_sort_ratio(s1, s2) = 100 * 2 * LCS / (a + b) trên chuỗi đã sort token
+(a, b: độ dài; LCS: longest common subsequence). Đạt cutoff c cần
+LCS >= c/200 * (a + b). Ba điều kiện cần (không bỏ sót) suy ra từ đó:
+
+1. Độ dài:   LCS <= min(a, b)              -> cửa sổ độ dài b.
+2. q-gram:   số q-gram chung (multiset) >= (a-q+1) - q*(a-LCS) - (q-1)*(b-LCS)
+             (mỗi ký tự bị xoá làm hỏng <= q gram, mỗi chỗ chèn <= q-1 gram)
+             -> inverted index q-gram, ngưỡng riêng cho từng độ dài b.
+3. Ký tự:    LCS <= số ký tự chung (multiset)   -> lọc cuối, vector hoá numpy.
+
+Độ dài b mà ngưỡng q-gram <= 0 (query ngắn, cutoff thấp) được lấy nguyên
+bucket theo độ dài. Tên thêm sau khi build (delta) luôn là ứng viên.
+"""
+
+import copy
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy.sparse import csr_matrix
+except ImportError:  # pragma: no cover - scipy đi kèm scikit-learn
+    csr_matrix = None
+
+Q = 2
+_SLACK = 1e-6  # nới ngưỡng một chút để không loại nhầm vì làm tròn float của RapidFuzz
+
+
+def sort_tokens(text: str) -> str:
+    """Chuỗi mà token_sort_ratio thực sự so sánh: token sort + nối bằng một khoảng trắng."""
+    return " ".join(sorted(text.split()))
+
+
+def _gram_keys(text: str, q: int) -> List[Tuple[str, int]]:
+    """q-gram đánh số lần xuất hiện: ("abc", 0), ("abc", 1)... -> giao = giao multiset."""
+    seen: Dict[str, int] = {}
+    keys = []
+    for i in range(len(text) - q + 1):
+        gram = text[i:i + q]
+        k = seen.get(gram, 0)
+        seen[gram] = k + 1
+        keys.append((gram, k))
+    return keys
+
+
+class FuzzyBlocker:
+    """Inverted q-gram / length / character index over a list of names."""
+
+    def __init__(self, names: Sequence[Optional[str]], q: int = Q):
+        self.q = q
+        self.n_base = len(names)
+        self.size = len(names)
+        processed = [sort_tokens(n) if n else None for n in names]
+
+        lengths = np.full(len(names), -1, dtype=np.int64)  # -1 = không có tên
+        postings: Dict[Tuple[str, int], List[int]] = {}
+        chars: Dict[str, int] = {}
+        rows, cols, vals = [], [], []
+        for i, text in enumerate(processed):
+            if text is None:
+                continue
+            lengths[i] = len(text)
+            for key in _gram_keys(text, q):
+                postings.setdefault(key, []).append(i)
+            counts: Dict[str, int] = {}
+            for ch in text:
+                counts[ch] = counts.get(ch, 0) + 1
+            for ch, cnt in counts.items():
+                col = chars.setdefault(ch, len(chars))
+                rows.append(i)
+                cols.append(col)
+                vals.append(cnt)
+
+        self.lengths = lengths
+        self.postings = {key: np.asarray(ids, dtype=np.int32) for key, ids in postings.items()}
+        self.chars = chars
+        # CSC: lấy cột theo ký tự của query rồi mới lấy hàng ứng viên
+        self.char_counts = csr_matrix(
+            (np.asarray(vals, dtype=np.int32), (rows, cols)), shape=(len(names), max(len(chars), 1))
+        ).tocsc()
+        # Bucket theo độ dài: by_length[len_start[b]:len_start[b+1]] = id có độ dài b
+        valid = np.flatnonzero(lengths >= 0)
+        self.by_length = valid[np.argsort(lengths[valid], kind="stable")].astype(np.int32)
+        max_len = int(lengths.max()) if len(valid) else 0
+        self.len_start = np.zeros(max_len + 2, dtype=np.int64)
+        np.cumsum(np.bincount(lengths[valid], minlength=max_len + 1), out=self.len_start[1:])
+        self._added: List[Optional[str]] = []
+
+    def with_added(self, names: Sequence[Optional[str]]) -> "FuzzyBlocker":
+        """New blocker where `names` (positions size...) are always candidates."""
+        new = copy.copy(self)
+        new._added = self._added + list(names)
+        new.size = self.size + len(names)
+        return new
+
+    def candidates(self, query: str, score_cutoff: float) -> np.ndarray:
+        """
+        Sorted positions whose token_sort_ratio with `query` can be >= `score_cutoff`.
+        Mọi tên thực sự đạt cutoff đều có mặt (có thể kèm vài tên không đạt).
+        """
+        overlay = np.arange(self.n_base, self.size, dtype=np.int64)
+        text = sort_tokens(query)
+        a = len(text)
+        r = max(score_cutoff / 100.0 - _SLACK, 0.0)
+        if r <= 0 or a == 0:
+            return np.arange(self.size, dtype=np.int64)
+
+        max_len = len(self.len_start) - 2
+        b = np.arange(max_len + 1)
+        lcs_min = np.ceil(r * (a + b) / 2.0 - _SLACK)
+        ok_len = np.minimum(a, b) >= lcs_min
+        if not ok_len.any():
+            return overlay
+        q = self.q
+        gram_min = (a - q + 1) - q * (a - lcs_min) - (q - 1) * (b - lcs_min)
+        gram_min[~ok_len] = np.inf
+
+        # (a) độ dài không đòi hỏi q-gram chung: lấy cả bucket
+        parts = [
+            self.by_length[self.len_start[bl]:self.len_start[bl + 1]]
+            for bl in np.flatnonzero(ok_len & (gram_min <= 0))
+        ]
+        # (b) còn lại: đếm q-gram chung qua inverted index
+        keys = _gram_keys(text, q)
+        lists = [self.postings[k] for k in keys if k in self.postings]
+        if lists:
+            hits = np.concatenate(lists)
+            if len(hits) * 8 < self.n_base:
+                ids, shared = np.unique(hits, return_counts=True)
+            else:
+                # Posting dài (gram phổ biến): đếm bằng bincount nhanh hơn sort
+                counts = np.bincount(hits, minlength=self.n_base)
+                ids = np.flatnonzero(counts)
+                shared = counts[ids]
+            need = gram_min[self.lengths[ids]]
+            parts.append(ids[(need > 0) & (shared >= need)])
+        cand = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+        # (c) số ký tự chung >= LCS tối thiểu
+        if len(cand):
+            q_chars: Dict[str, int] = {}
+            for ch in text:
+                q_chars[ch] = q_chars.get(ch, 0) + 1
+            cols = [self.chars[ch] for ch in q_chars if ch in self.chars]
+            if cols:
+                have = self.char_counts[:, cols][cand].toarray()
+                want = np.asarray([q_chars[ch] for ch in q_chars if ch in self.chars])
+                common = np.minimum(have, want).sum(axis=1)
+            else:
+                common = np.zeros(len(cand))
+            cand = cand[common >= lcs_min[self.lengths[cand]]]
+
+        return np.concatenate([cand.astype(np.int64), overlay])
+
+
+def extract_one(query: str, choices: Sequence[Optional[str]], blocker: FuzzyBlocker,
+                score_cutoff: float):
+    """
+    Same result as `process.extractOne(query, choices, scorer=fuzz.token_sort_ratio,
+    score_cutoff=score_cutoff)`, scoring only the blocker candidates.
+    """
+    from rapidfuzz import fuzz, process
+
+    idx = blocker.candidates(query, score_cutoff)
+    if not len(idx):
+        return None
+    result = process.extractOne(
+        query, [choices[i] for i in idx], scorer=fuzz.token_sort_ratio, score_cutoff=score_cutoff
+    )
+    if result is None:
+        return None
+    name, score, j = result
+    return name, score, int(idx[j])
+
+
+def extract(query: str, choices: Sequence[Optional[str]], blocker: FuzzyBlocker,
+            score_cutoff: float, limit: int):
+    """Blocked `process.extract(..., scorer=fuzz.token_sort_ratio, limit=limit)`."""
+    from rapidfuzz import fuzz, process
+
+    idx = blocker.candidates(query, score_cutoff)
+    if not len(idx):
+        return []
+    found = process.extract(
+        query, [choices[i] for i in idx], scorer=fuzz.token_sort_ratio,
+        limit=limit, score_cutoff=score_cutoff
+    )
+    return [(name, score, int(idx[j])) for name, score, j in found]
@@ -1,12 +1,18 @@
 """
 KB Fuzzy Match Service - Fuzzy matching for knowledge_base drug names.
-Uses TF-IDF + RapidFuzz similar to DrugSearchService, but on knowledge_base data.
+Uses TF-IDF + RapidFuzz similar to DrugSearchService, but on knowledge_base data
+(corpus held by the shared DrugIndexService).
 """
+from typing import Dict, List
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from app.database.core import DatabaseCore
-from app.core.utils import normalize_for_matching
+from app.core.utils import normalize_for_matching, normalize_many
+from app.service.drug_index_service import get_drug_index
+from app.service.fuzzy_blocking import extract_one
+
+# Số query TF-IDF mỗi lần nhân ma trận (giới hạn bộ nhớ query x corpus)
+TFIDF_BATCH_ROWS = 64
 
 class KBFuzzyMatchService:
     """
@@ -20,80 +26,34 @@ class KBFuzzyMatchService:
         else:
             self.db_core = db_core
             
-        # Vector cache
-        self.vectorizer = None
-        self.tfidf_matrix = None
-        self.drug_names = []  # distinct drug_name_norm values
-        self.cache_loaded = False
+        # Shared KB names corpus (TF-IDF) - see drug_index_service
+        self.index = get_drug_index(self.db_core)
     
     def refresh_cache(self):
         """Force reload cache from database. Call after data ingest."""
         print("[KBFuzzyMatch] Refreshing cache...")
-        self.cache_loaded = False
-        self.drug_names = []
-        self.vectorizer = None
-        self.tfidf_matrix = None
-        self._load_cache()
+        self.index.refresh_kb()
     
     def _load_cache(self):
-        """Load all distinct drug_name_norm from knowledge_base for vector matching"""
-        if self.cache_loaded:
-            return
-        
-        conn = self.db_core.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # Get all distinct drug names from knowledge_base
-            cursor.execute("""
-                SELECT DISTINCT drug_name_norm 
-                FROM knowledge_base 
-                WHERE drug_name_norm IS NOT NULL 
-                  AND drug_name_norm != ''
-                  AND drug_name_norm != '_icd_list_'
-            """)
-            rows = cursor.fetchall()
-            print(f"[KBFuzzyMatch] Query returned {len(rows)} rows")
-            
-            # Handle row access (Dict vs Tuple)
-            # If Dict (PG RealDictCursor or SQLite dict_factory via core) -> row['drug_name_norm']
-            # If Tuple (raw) -> row[0]
-            # Since Core standardizes on dict-like usually, but let's be safe.
-            
-            # Actually core returns dicts by default for sqlite (dict_factory) and PG (RealDictCursor).
-            # So row['drug_name_norm'] is safe.
-            # But wait, if someone didn't use dict_factory...
-            # DatabaseCore: 
-            # SQLite -> dict_factory
-            # Postgres -> RealDictCursor
-            # So always dict access.
-            
-            self.drug_names = []
-            for row in rows:
-                val = row['drug_name_norm'] if isinstance(row, dict) else row[0]
-                if val and val.strip():
-                    self.drug_names.append(val)
-
-            print(f"[KBFuzzyMatch] Filtered to {len(self.drug_names)} drug names")
-            
-            if self.drug_names:
-                # Build TF-IDF matrix
-                self.vectorizer = TfidfVectorizer(
-                    token_pattern=r"(?u)\b\w+\b",
-                    ngram_range=(1, 2)  # Include bigrams for better matching
-                )
-                self.tfidf_matrix = self.vectorizer.fit_transform(self.drug_names)
-                self.cache_loaded = True
-                print(f"[KBFuzzyMatch] Loaded {len(self.drug_names)} unique drug names from KB, matrix shape: {self.tfidf_matrix.shape}")
-            else:
-                print("[KBFuzzyMatch] WARNING: No drug names found in knowledge_base!")
-                
-        except Exception as e:
-            import traceback
-            print(f"[KBFuzzyMatch] Cache Load Error: {e}")
-            traceback.print_exc()
-        finally:
-            conn.close()
+        """Return the shared snapshot of distinct drug_name_norm from knowledge_base."""
+        return self.index.kb_names()
+    
+    # Read-only views kept for backward compatibility
+    @property
+    def drug_names(self):
+        return self.index.kb_names().names
+    
+    @property
+    def vectorizer(self):
+        return self.index.kb_names().vectorizer
+    
+    @property
+    def tfidf_matrix(self):
+        return self.index.kb_names().tfidf_matrix
+    
+    @property
+    def cache_loaded(self):
+        return self.index.stats()["kb_names_count"] > 0
     
     def find_best_match(self, input_name: str, min_score: float = 0.5) -> dict | None:
         """
@@ -101,7 +61,7 @@ class KBFuzzyMatchService:
         
         Strategy:
         1. Exact match (score = 1.0)
-        2. LIKE partial match (score = 0.95)
+        2. Partial match via trigram index (score = 0.95)
         3. RapidFuzz match (score = fuzzy_score * 0.01)
         4. TF-IDF vector match (score = cosine_sim)
         
@@ -112,88 +72,172 @@ class KBFuzzyMatchService:
         
         normalized_input = normalize_for_matching(input_name)
         
+        # 1. EXACT MATCH - tra trong snapshot KB nếu đã load (không cần query)
+        loaded = self.index.has_kb()
+        if loaded and normalized_input in self._load_cache().best_by_drug:
+            return self._exact(normalized_input)
+        
         conn = self.db_core.get_connection()
         cursor = conn.cursor()
         
         try:
-            # 1. EXACT MATCH
-            cursor.execute("""
+            if not loaded:
+                cursor.execute("""
                 SELECT DISTINCT drug_name_norm FROM knowledge_base 
                 WHERE drug_name_norm = ?
                 LIMIT 1
             """, (normalized_input,))
-            row = cursor.fetchone()
-            if row:
-                name = row['drug_name_norm'] if isinstance(row, dict) else row[0]
-                return {"drug_name_norm": name, "score": 1.0, "method": "exact"}
-            
-            # 2. LIKE PARTIAL MATCH (contains)
-            cursor.execute("""
-                SELECT DISTINCT drug_name_norm FROM knowledge_base 
-                WHERE drug_name_norm LIKE ?
-                LIMIT 1
-            """, (f"%{normalized_input}%",))
-            row = cursor.fetchone()
-            if row:
-                name = row['drug_name_norm'] if isinstance(row, dict) else row[0]
-                return {"drug_name_norm": name, "score": 0.95, "method": "partial"}
-            
-            # 3. RAPIDFUZZ MATCH
-            self._load_cache()
+                row = cursor.fetchone()
+                if row:
+                    name = row['drug_name_norm'] if isinstance(row, dict) else row[0]
+                    return self._exact(name)
             
-            try:
-                from rapidfuzz import process, fuzz
-                if self.drug_names:
-                    result = process.extractOne(
-                        normalized_input, 
-                        self.drug_names, 
-                        scorer=fuzz.token_sort_ratio,
-                        score_cutoff=70  # Minimum 70% similarity
-                    )
-                    if result:
-                        match_name, score, idx = result
-                        fuzzy_score = score / 100.0  # Normalize to 0-1
-                        if fuzzy_score >= min_score:
-                            return {"drug_name_norm": match_name, "score": fuzzy_score, "method": f"fuzzy({score:.0f}%)"}
-            except ImportError:
-                print("[KBFuzzyMatch] rapidfuzz not installed, skipping fuzzy match")
-            except Exception as e:
-                print(f"[KBFuzzyMatch] RapidFuzz error: {e}")
+            # 2-3. PARTIAL + RAPIDFUZZ
+            match = self._partial_or_fuzzy(cursor, normalized_input, min_score)
+            if match:
+                return match
             
             # 4. TF-IDF VECTOR MATCH
-            if self.vectorizer and self.tfidf_matrix is not None:
-                try:
-                    query_vec = self.vectorizer.transform([normalized_input])
-                    cosine_sim = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-                    
-                    if cosine_sim.size > 0:
-                        best_idx = np.argmax(cosine_sim)
-                        best_score = cosine_sim[best_idx]
-                        
-                        if best_score >= min_score:
-                            return {
-                                "drug_name_norm": self.drug_names[best_idx],
-                                "score": float(best_score),
-                                "method": f"tfidf({best_score:.2f})"
-                            }
-                except Exception as e:
-                    print(f"[KBFuzzyMatch] TF-IDF error: {e}")
-            
-            return None
+            return self._tfidf_matches([normalized_input], min_score)[0]
             
         finally:
             conn.close()
     
-    def find_best_match_with_icd(self, input_name: str, disease_icd: str) -> dict | None:
+    def find_best_matches(self, input_names: List[str], min_score: float = 0.5) -> Dict[str, dict | None]:
+        """
+        `find_best_match` cho cả list tên (cùng kết quả), dùng cho consultation batch.
+        
+        Tên trùng chỉ resolve một lần; chuẩn hóa bằng normalize_many, exact tra
+        snapshot KB, các tên còn lại dùng chung một connection và TF-IDF chạy
+        một lần (ma trận query x corpus) cho mọi tên chưa khớp.
+        
+        Returns: {input_name: match | None}
+        """
+        names = [name for name in dict.fromkeys(input_names) if name]
+        if not self.index.has_kb():
+            return {name: self.find_best_match(name, min_score) for name in names}
+        
+        kb_corpus = self._load_cache()
+        results = {}
+        pending = {}
+        for name, normalized in zip(names, normalize_many(names)):
+            if normalized in kb_corpus.best_by_drug:
+                results[name] = self._exact(normalized)
+            else:
+                pending[name] = normalized
+        if not pending:
+            return results
+        
+        conn = self.db_core.get_connection()
+        cursor = conn.cursor()
+        try:
+            for name, normalized in pending.items():
+                results[name] = self._partial_or_fuzzy(cursor, normalized, min_score)
+        finally:
+            conn.close()
+        
+        remaining = [name for name in pending if results[name] is None]
+        for name, match in zip(remaining, self._tfidf_matches([pending[n] for n in remaining], min_score)):
+            results[name] = match
+        return results
+    
+    @staticmethod
+    def _exact(name: str) -> dict:
+        return {"drug_name_norm": name, "score": 1.0, "method": "exact"}
+    
+    def _partial_or_fuzzy(self, cursor, normalized_input: str, min_score: float) -> dict | None:
+        """Steps 2-3 of find_best_match: trigram substring, then RapidFuzz."""
+        # 2. PARTIAL MATCH (contains) - trigram index, shortest name first
+        self.db_core.substring_search(
+            cursor, "knowledge_base", "drug_name_norm", normalized_input, distinct=True
+        )
+        row = cursor.fetchone()
+        if row:
+            name = row['drug_name_norm'] if isinstance(row, dict) else row[0]
+            return {"drug_name_norm": name, "score": 0.95, "method": "partial"}
+        
+        # 3. RAPIDFUZZ MATCH
+        kb_corpus = self._load_cache()
+        
+        try:
+            if kb_corpus.names:
+                # Chỉ chấm các tên có thể đạt cutoff (kết quả giống extractOne toàn bộ)
+                result = extract_one(
+                    normalized_input,
+                    kb_corpus.names,
+                    kb_corpus.fuzzy_blocker(),
+                    score_cutoff=70  # Minimum 70% similarity
+                )
+                if result:
+                    match_name, score, idx = result
+                    fuzzy_score = score / 100.0  # Normalize to 0-1
+                    if fuzzy_score >= min_score:
+                        return {"drug_name_norm": match_name, "score": fuzzy_score, "method": f"fuzzy({score:.0f}%)"}
+        except ImportError:
+            print("[KBFuzzyMatch] rapidfuzz not installed, skipping fuzzy match")
+        except Exception as e:
+            print(f"[KBFuzzyMatch] RapidFuzz error: {e}")
+        return None
+    
+    def _tfidf_matches(self, normalized_inputs: List[str], min_score: float) -> List[dict | None]:
+        """Step 4 of find_best_match for several inputs: one transform, cosine in chunks."""
+        results = [None] * len(normalized_inputs)
+        kb_corpus = self._load_cache()
+        if not normalized_inputs or not kb_corpus.vectorizer or kb_corpus.tfidf_matrix is None:
+            return results
+        try:
+            query_vecs = kb_corpus.vectorizer.transform(normalized_inputs)
+            for start in range(0, len(normalized_inputs), TFIDF_BATCH_ROWS):
+                cosine_sim = cosine_similarity(query_vecs[start:start + TFIDF_BATCH_ROWS], kb_corpus.tfidf_matrix)
+                if cosine_sim.shape[1] == 0:
+                    break
+                for offset, best_idx in enumerate(np.argmax(cosine_sim, axis=1)):
+                    best_score = cosine_sim[offset, best_idx]
+                    if best_score >= min_score:
+                        results[start + offset] = {
+                            "drug_name_norm": kb_corpus.names[best_idx],
+                            "score": float(best_score),
+                            "method": f"tfidf({best_score:.2f})"
+                        }
+        except Exception as e:
+            print(f"[KBFuzzyMatch] TF-IDF error: {e}")
+        return results
+    
+    def find_best_match_with_icd(self, input_name: str, disease_icd: str, match: dict = None) -> dict | None:
         """
         Find best match AND verify it has data for the specific ICD code.
         Returns KB row data if found.
+        
+        Dòng KB tốt nhất (TDV > frequency > last_updated) lấy từ bảng xếp hạng
+        sẵn trong snapshot KB; chỉ query DB khi snapshot rỗng.
+        `match`: kết quả find_best_match(es) đã có cho `input_name` (bỏ qua bước resolve tên).
         """
-        match = self.find_best_match(input_name)
+        if match is None:
+            match = self.find_best_match(input_name)
         
         if not match:
             return None
         
+        kb_corpus = self._load_cache()
+        if kb_corpus.has_rows:
+            row = kb_corpus.best_row(match['drug_name_norm'], disease_icd)
+            method = match['method']
+            if row is None:
+                # FALLBACK: Generic Drug Match (Ignore ICD)
+                row = kb_corpus.best_row(match['drug_name_norm'])
+                disease_icd, method = "GENERIC", f"{method} (Generic)"
+            if row is None:
+                return None
+            return {
+                "drug_name_norm": row['drug_name_norm'],
+                "disease_icd": disease_icd,
+                "treatment_type": row['treatment_type'],
+                "tdv_feedback": row['tdv_feedback'],
+                "frequency": row['frequency'],
+                "match_score": match['score'],
+                "match_method": method
+            }
+        
         # Query knowledge_base with the matched drug name + ICD
         conn = self.db_core.get_connection()
         # conn.row_factory = sqlite3.Row # DatabaseCore handles this
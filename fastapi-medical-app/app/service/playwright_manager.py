@@ -1,7 +1,9 @@
 import asyncio
 import os
 import sys
-from playwright.async_api import async_playwright, Page, BrowserContext, Browser
+from playwright.async_api import Page
+from app.service.crawler.browser_pool import browser_pool
+from app.service.crawler.scheduler import crawl_scheduler
 
 # Force ProactorEventLoop for Windows
 if sys.platform == 'win32':
@@ -15,72 +17,54 @@ class PlaywrightManager:
     """
     Playwright DOM Manager for Web Scraping.
     Singleton pattern. Based on the working solution in browser_mcp_agent.
+    Browser/context mượn từ browser_pool (app/service/crawler/browser_pool.py)
+    dùng chung với crawler, không launch Chromium riêng.
     """
+    CONTEXT_OPTIONS = {
+        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "viewport": {"width": 1920, "height": 1080},
+        "java_script_enabled": True,
+        "ignore_https_errors": True,
+    }
+
     def __init__(self, headless: bool = True):
-        self.playwright = None
-        self.browser: Browser = None
-        self.context: BrowserContext = None
-        self.page: Page = None
         self.headless = headless
-        self._lock = asyncio.Lock()
 
     async def initialize(self):
-        async with self._lock:
-            if not self.playwright:
-                self.playwright = await async_playwright().start()
-                
-                # Robust args for Docker and Bot Detection
-                args = [
-                    '--disable-blink-features=AutomationControlled',
-                    '--start-maximized',
-                    '--disable-infobars',
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-accelerated-2d-canvas',
-                    '--disable-gpu',
-                    '--window-position=0,0',
-                ]
-                
-                self.browser = await self.playwright.chromium.launch(
-                    headless=self.headless,
-                    args=args,
-                )
-                
-                self.context = await self.browser.new_context(
-                    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    viewport={"width": 1920, "height": 1080},
-                    java_script_enabled=True,
-                    ignore_https_errors=True
-                )
-                
-                self.page = await self.context.new_page()
+        """Warm-up: mượn và trả một page để pool launch browser trước."""
+        async with browser_pool.page(**self.CONTEXT_OPTIONS):
+            pass
 
     async def get_dom_content(self, url: str) -> dict:
         """
         Navigates to URL and returns DOM content.
         Handles popups, timeouts, and dynamic loading.
         """
-        if not self.playwright:
-            await self.initialize()
+        try:
+            async with browser_pool.page(**self.CONTEXT_OPTIONS) as page:
+                return await self._read_dom(page, url)
+        except Exception as e:
+            return {"status": "error", "url": url, "error": str(e)}
 
+    async def _read_dom(self, page: Page, url: str) -> dict:
         try:
             # 1. Access URL
             try:
-                await self.page.goto(url, timeout=60000, wait_until='domcontentloaded')
+                async with crawl_scheduler.domain_slot(url):
+                    await page.goto(url, timeout=60000, wait_until='domcontentloaded')
             except Exception as e:
                 print(f"Warning: navigation timeout/error for {url}: {e}")
             
             # 2. Wait for content to settle
-            await self.page.wait_for_timeout(2000)
+            await page.wait_for_timeout(2000)
 
             # 3. Handle Popups
             popup_selectors = ['button[aria-label="Close"]', '.close-button', '.modal-close', '#close-modal']
             for selector in popup_selectors:
                 try:
-                    if await self.page.is_visible(selector):
-                        await self.page.click(selector, timeout=1000)
-                        await self.page.wait_for_timeout(500)
+                    if await page.is_visible(selector):
+                        await page.click(selector, timeout=1000)
+                        await page.wait_for_timeout(500)
                 except:
                     pass
 
@@ -88,19 +72,19 @@ class PlaywrightManager:
             content = ""
             for tag in ['main', 'article', 'body']:
                 try:
-                    if await self.page.locator(tag).first.count() > 0:
-                        content = await self.page.inner_text(tag)
+                    if await page.locator(tag).first.count() > 0:
+                        content = await page.inner_text(tag)
                         break
                 except:
                     pass
             
             if not content:
-                content = await self.page.inner_text("body")
+                content = await page.inner_text("body")
 
-            title = await self.page.title()
+            title = await page.title()
             
             # 5. Extract Valid Links
-            links = await self.page.evaluate("""() => {
+            links = await page.evaluate("""() => {
                 return Array.from(document.querySelectorAll('a')).map(a => ({
                     text: a.innerText.trim(),
                     href: a.href
@@ -124,12 +108,12 @@ class PlaywrightManager:
             }
 
     async def cleanup(self):
-        if self.context:
-            await self.context.close()
-        if self.browser:
-            await self.browser.close()
-        if self.playwright:
-            await self.playwright.stop()
+        """
+        Page/context chỉ mượn trong `async with browser_pool.page(...)` và đã trả
+        sau mỗi lần dùng -> manager không giữ gì để dọn. Không đóng browser_pool:
+        pool dùng chung toàn process, đóng ở shutdown hook (app/main.py).
+        """
+        return None
 
 # Singleton
 playwright_manager = PlaywrightManager(headless=True)
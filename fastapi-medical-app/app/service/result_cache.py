@@ -0,0 +1,113 @@
+"""
+Result Cache - LRU/TTL memoization cho kết quả match theo data version
+======================================================================
+Claims gửi lặp lại cùng vài nghìn tên thuốc; cache này đứng trước cascade
+(DrugMatcher.match, DrugSearchService.search_drug_smart_sync) để không chạy
+lại SQL / fuzzy / vector cho tên đã gặp.
+
+- Bounded LRU (`maxsize`), mỗi entry hết hạn sau `ttl` giây.
+- Kết quả "không tìm thấy" có TTL riêng ngắn hơn (`negative_ttl`): thuốc mới
+  có thể được thêm vào DB bất cứ lúc nào.
+- Gắn với `version` của drug index: version đổi -> xoá toàn bộ cache.
+- Giá trị được deep copy khi ghi và khi đọc, caller sửa kết quả không ảnh
+  hưởng cache.
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+CACHE_SIZE = int(os.getenv("MATCH_CACHE_SIZE", "20000"))                   # 0 = tắt cache
+CACHE_TTL = float(os.getenv("MATCH_CACHE_TTL", "3600"))                    # giây, kết quả tìm thấy
+CACHE_NEGATIVE_TTL = float(os.getenv("MATCH_CACHE_NEGATIVE_TTL", "300"))   # giây, kết quả không tìm thấy
+
+MISS = object()  # sentinel: None là một giá trị hợp lệ (negative result)
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache, invalidated when the data version changes."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 negative_ttl: float = CACHE_NEGATIVE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires, negative, value)
+        self._version = None
+        self._counters = {
+            "hits": 0, "negative_hits": 0, "misses": 0,
+            "expired": 0, "evictions": 0, "invalidations": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def _check_version(self, version: int) -> None:
+        # Gọi khi đang giữ lock
+        if version != self._version:
+            if self._entries:
+                self._entries.clear()
+                self._counters["invalidations"] += 1
+            self._version = version
+
+    def get(self, key: Hashable, version: int) -> Any:
+        """Cached value for `key` at `version`, or `MISS`."""
+        if not self.enabled:
+            return MISS
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return MISS
+            expires, negative, value = entry
+            if self._clock() >= expires:
+                del self._entries[key]
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self._counters["negative_hits" if negative else "hits"] += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: Hashable, version: int, value: Any, negative: bool = False) -> None:
+        """Store `value`; dropped if computed against a version that is no longer current."""
+        if not self.enabled:
+            return
+        ttl = self.negative_ttl if negative else self.ttl
+        if ttl <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            if self._version is None:
+                self._version = version
+            if version != self._version:
+                return
+            self._entries[key] = (self._clock() + ttl, negative, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["negative_hits"] + self._counters["misses"]
+            hits = self._counters["hits"] + self._counters["negative_hits"]
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "version": self._version,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,300 @@
+"""
+Scrape Cache Service - Cache kết quả web scrape (scrape_drug_web_advanced) trong DB
+===================================================================================
+Mỗi lần tên thuốc miss DB, crawler mở Chromium và quét ThuocBietDuoc + các site
+khác (tới 25s/site). Bảng `web_scrape_cache` lưu kết quả đã merge, các candidate
+đã parse, source URLs và thời điểm scrape, key = keyword đã `normalize_for_search`
+(cùng chuỗi crawler dùng để search), nên cùng tên scrape lại trong TTL không
+chạm tới browser.
+
+- Kết quả tìm thấy sống SCRAPE_CACHE_TTL_HOURS (mặc định 7 ngày).
+- "not_found" (negative) sống SCRAPE_CACHE_NEGATIVE_TTL_HOURS (mặc định 6 giờ).
+- Invalidate qua DELETE /api/v1/admin/scrape-cache.
+
+`SearchUrlCacheService` (bảng `search_url_cache`) cache keyword -> URL trang chi tiết
+mà GoogleSearchService tìm được: SEARCH_URL_CACHE_TTL_HOURS (mặc định 30 ngày),
+không tìm thấy SEARCH_URL_CACHE_NEGATIVE_TTL_HOURS (mặc định 6 giờ).
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.utils import normalize_for_search
+from app.database.core import DatabaseCore
+
+SCRAPE_CACHE_ENABLED = os.getenv("SCRAPE_CACHE_ENABLED", "1") != "0"
+SCRAPE_CACHE_TTL_HOURS = float(os.getenv("SCRAPE_CACHE_TTL_HOURS", "168"))
+SCRAPE_CACHE_NEGATIVE_TTL_HOURS = float(os.getenv("SCRAPE_CACHE_NEGATIVE_TTL_HOURS", "6"))
+SEARCH_URL_CACHE_TTL_HOURS = float(os.getenv("SEARCH_URL_CACHE_TTL_HOURS", "720"))
+SEARCH_URL_CACHE_NEGATIVE_TTL_HOURS = float(os.getenv("SEARCH_URL_CACHE_NEGATIVE_TTL_HOURS", "6"))
+
+# Field nặng của candidate thô (toàn bộ text trang) - không lưu
+_CANDIDATE_SKIP_FIELDS = ("Content", "_extracted_data")
+
+
+def scrape_cache_key(keyword: str) -> str:
+    """Key cache: keyword như crawler search (normalize_for_search), lowercase."""
+    keyword = (keyword or "").strip()
+    return (normalize_for_search(keyword) or keyword).lower()
+
+
+def is_not_found(result: Optional[Dict[str, Any]]) -> bool:
+    return not result or result.get("status") == "not_found"
+
+
+class ScrapeCacheService:
+    def __init__(self, db_core: DatabaseCore = None, ttl_seconds: float = None,
+                 negative_ttl_seconds: float = None):
+        self.db_core = db_core
+        self.ttl_seconds = SCRAPE_CACHE_TTL_HOURS * 3600 if ttl_seconds is None else ttl_seconds
+        self.negative_ttl_seconds = (
+            SCRAPE_CACHE_NEGATIVE_TTL_HOURS * 3600 if negative_ttl_seconds is None else negative_ttl_seconds
+        )
+
+    @property
+    def enabled(self) -> bool:
+        # Chỉ dùng với DB thật (test double / mock -> luôn miss, không ghi)
+        return SCRAPE_CACHE_ENABLED and isinstance(self.db_core, DatabaseCore)
+
+    def get(self, keyword: str) -> Optional[Dict[str, Any]]:
+        """Kết quả scrape còn hạn cho `keyword` (kể cả not_found), None nếu miss."""
+        if not self.enabled:
+            return None
+        key = scrape_cache_key(keyword)
+        if not key:
+            return None
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT result, expires_at FROM web_scrape_cache WHERE keyword_norm = ?", (key,)
+                )
+                row = cursor.fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[ScrapeCache] Read error: {e}")
+            return None
+        if not row or row["expires_at"] is None or row["expires_at"] <= time.time():
+            return None
+        print(f"[ScrapeCache] HIT '{key}'")
+        return json.loads(row["result"])
+
+    def put(self, keyword: str, result: Optional[Dict[str, Any]],
+            candidates: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """Lưu kết quả scrape (found hoặc not_found) với TTL tương ứng."""
+        if not self.enabled or result is None:
+            return False
+        key = scrape_cache_key(keyword)
+        if not key:
+            return False
+        negative = is_not_found(result)
+        ttl = self.negative_ttl_seconds if negative else self.ttl_seconds
+        if ttl <= 0:
+            return False
+        now = time.time()
+        compact = [
+            {k: v for k, v in item.items() if k not in _CANDIDATE_SKIP_FIELDS}
+            for item in candidates or () if isinstance(item, dict)
+        ]
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO web_scrape_cache
+                        (keyword_norm, keyword, status, result, candidates, source_urls, scraped_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (keyword_norm) DO UPDATE SET
+                        keyword = excluded.keyword, status = excluded.status, result = excluded.result,
+                        candidates = excluded.candidates, source_urls = excluded.source_urls,
+                        scraped_at = excluded.scraped_at, expires_at = excluded.expires_at
+                """, (
+                    key, keyword, "not_found" if negative else "found",
+                    json.dumps(result, ensure_ascii=False, default=str),
+                    json.dumps(compact, ensure_ascii=False, default=str),
+                    json.dumps(result.get("source_urls") or [], ensure_ascii=False, default=str),
+                    now, now + ttl,
+                ))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[ScrapeCache] Write error: {e}")
+            return False
+        return True
+
+    def invalidate(self, keyword: str = None, expired_only: bool = False) -> int:
+        """
+        Xoá entry của `keyword` (đã normalize), hoặc toàn bộ cache nếu không truyền.
+        expired_only=True: chỉ xoá entry đã hết hạn. Trả về số dòng đã xoá.
+        Lỗi DB được log rồi raise lại (DELETE /admin/scrape-cache trả 500).
+        """
+        if not isinstance(self.db_core, DatabaseCore):
+            return 0
+        conditions, params = [], []
+        if keyword:
+            conditions.append("keyword_norm = ?")
+            params.append(scrape_cache_key(keyword))
+        if expired_only:
+            conditions.append("expires_at <= ?")
+            params.append(time.time())
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"DELETE FROM web_scrape_cache{where}", tuple(params))
+                deleted = cursor.rowcount
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            # Không nuốt lỗi như get/put: admin cần biết xoá thất bại (route trả 500)
+            print(f"[ScrapeCache] Invalidate error: {e}")
+            raise
+        print(f"[ScrapeCache] Invalidated {deleted} entries (keyword={keyword!r}, expired_only={expired_only})")
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        if not isinstance(self.db_core, DatabaseCore):
+            return {"enabled": False, "entries": 0}
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT status, COUNT(*) AS n, SUM(CASE WHEN expires_at <= ? THEN 1 ELSE 0 END) AS expired
+                    FROM web_scrape_cache GROUP BY status
+                """, (time.time(),))
+                rows = cursor.fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[ScrapeCache] Stats error: {e}")
+            raise
+        by_status = {row["status"]: row["n"] for row in rows}
+        return {
+            "enabled": self.enabled,
+            "entries": sum(by_status.values()),
+            "found": by_status.get("found", 0),
+            "not_found": by_status.get("not_found", 0),
+            "expired": sum(row["expired"] or 0 for row in rows),
+            "ttl_hours": self.ttl_seconds / 3600,
+            "negative_ttl_hours": self.negative_ttl_seconds / 3600,
+        }
+
+
+class SearchUrlCacheService:
+    """Cache bền keyword -> URL trang chi tiết (search engine), theo domain."""
+
+    def __init__(self, db_core: DatabaseCore = None, ttl_seconds: float = None,
+                 negative_ttl_seconds: float = None):
+        if db_core is None:
+            db_core = DatabaseCore()
+        self.db_core = db_core
+        self.ttl_seconds = SEARCH_URL_CACHE_TTL_HOURS * 3600 if ttl_seconds is None else ttl_seconds
+        self.negative_ttl_seconds = (
+            SEARCH_URL_CACHE_NEGATIVE_TTL_HOURS * 3600 if negative_ttl_seconds is None else negative_ttl_seconds
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return SCRAPE_CACHE_ENABLED and isinstance(self.db_core, DatabaseCore)
+
+    def get(self, domain: str, keyword: str) -> Optional[Dict[str, Any]]:
+        """{"url": ...} còn hạn (url=None: đã search nhưng không thấy), None nếu miss."""
+        key = scrape_cache_key(keyword)
+        if not self.enabled or not key:
+            return None
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT url, expires_at FROM search_url_cache WHERE cache_key = ?", (f"{domain}|{key}",))
+                row = cursor.fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[SearchUrlCache] Read error: {e}")
+            return None
+        if not row or row["expires_at"] is None or row["expires_at"] <= time.time():
+            return None
+        return {"url": row["url"]}
+
+    def put(self, domain: str, keyword: str, url: Optional[str]) -> bool:
+        key = scrape_cache_key(keyword)
+        if not self.enabled or not key:
+            return False
+        ttl = self.ttl_seconds if url else self.negative_ttl_seconds
+        if ttl <= 0:
+            return False
+        now = time.time()
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO search_url_cache (cache_key, domain, keyword_norm, keyword, url, searched_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (cache_key) DO UPDATE SET
+                        keyword = excluded.keyword, url = excluded.url,
+                        searched_at = excluded.searched_at, expires_at = excluded.expires_at
+                """, (f"{domain}|{key}", domain, key, keyword, url, now, now + ttl))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[SearchUrlCache] Write error: {e}")
+            return False
+        return True
+
+    def invalidate(self, keyword: str = None, expired_only: bool = False) -> int:
+        """Như ScrapeCacheService.invalidate, cho mọi domain."""
+        if not isinstance(self.db_core, DatabaseCore):
+            return 0
+        conditions, params = [], []
+        if keyword:
+            conditions.append("keyword_norm = ?")
+            params.append(scrape_cache_key(keyword))
+        if expired_only:
+            conditions.append("expires_at <= ?")
+            params.append(time.time())
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"DELETE FROM search_url_cache{where}", tuple(params))
+                deleted = cursor.rowcount
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[SearchUrlCache] Invalidate error: {e}")
+            raise
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        if not isinstance(self.db_core, DatabaseCore):
+            return {"entries": 0}
+        try:
+            conn = self.db_core.get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT COUNT(*) AS n,
+                           SUM(CASE WHEN url IS NULL THEN 1 ELSE 0 END) AS not_found,
+                           SUM(CASE WHEN expires_at <= ? THEN 1 ELSE 0 END) AS expired
+                    FROM search_url_cache
+                """, (time.time(),))
+                row = cursor.fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[SearchUrlCache] Stats error: {e}")
+            raise
+        return {"entries": row["n"] or 0, "not_found": row["not_found"] or 0, "expired": row["expired"] or 0}
@@ -1,7 +1,8 @@
 import asyncio
 import logging
 import re
-from playwright.async_api import async_playwright
+from app.service.crawler.browser_pool import browser_pool
+from app.service.crawler.core_drug import goto
 
 # --- 1. SETUP LOGGER ---
 logger = logging.getLogger("DrugScraper")
@@ -55,23 +56,17 @@ async def scrape_multisource_fallback(keyword, max_results=3):
     
     results = []
     
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(
-            headless=True,
-            args=["--disable-blink-features=AutomationControlled", "--no-sandbox"]
-        )
-        
-        context = await browser.new_context(
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
-        
+    # Browser/context dùng chung từ pool (app/service/crawler/browser_pool.py)
+    async with browser_pool.context(
+        user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    ) as context:
         page = await context.new_page()
         if HAS_STEALTH:
             await stealth_async(page)
         
         try:
             logger.info(f"Đang tìm kiếm Bing: {search_query}")
-            await page.goto(f"https://www.bing.com/search?q={search_query}&mkt=vi-VN&setLang=vi", timeout=30000)
+            await goto(page, f"https://www.bing.com/search?q={search_query}&mkt=vi-VN&setLang=vi", timeout=30000, wait_until="load")
             
             try:
                 # Chờ selector, nếu fail thì thử selector backup
@@ -105,7 +100,7 @@ async def scrape_multisource_fallback(keyword, max_results=3):
                     
                     logger.info(f"Đang cào: {link}")
                     try:
-                        await detail_page.goto(link, timeout=15000, wait_until="domcontentloaded")
+                        await goto(detail_page, link, timeout=15000)
                     except:
                         logger.warning(f"Timeout khi load {link}, bỏ qua.")
                         await detail_page.close()
@@ -160,8 +155,6 @@ async def scrape_multisource_fallback(keyword, max_results=3):
 
         except Exception as e:
             logger.error(f"Lỗi Browser: {e}")
-        finally:
-            await browser.close()
             
     return results
 
@@ -183,7 +176,7 @@ async def scrape_detail_page(context, url):
     try:
         # Block media
         await page.route("**/*.{png,jpg,jpeg,gif,webp,svg,css,woff,woff2,mp4,ttf,otf}", lambda route: route.abort())
-        await page.goto(url, timeout=30000, wait_until="domcontentloaded")
+        await goto(page, url, timeout=30000)
         
         # 1. Tên thuốc (H1)
         try:
@@ -230,15 +223,13 @@ async def scrape_thuocbietduoc_direct(keyword):
     logger.info(f"--- Direct Search ThuocBietDuoc: '{keyword}' ---")
     results = []
     
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True, args=["--no-sandbox"])
-        context = await browser.new_context()
+    async with browser_pool.context() as context:
         page = await context.new_page()
         if HAS_STEALTH: await stealth_async(page)
         
         try:
             # 1. Vào trang chủ
-            await page.goto("https://thuocbietduoc.com.vn/", timeout=30000)
+            await goto(page, "https://thuocbietduoc.com.vn/", timeout=30000, wait_until="load")
             
             # 2. Search
             # Selector ID "search-input" is not unique (Mobile/Desktop/Main).
@@ -282,8 +273,6 @@ async def scrape_thuocbietduoc_direct(keyword):
 
         except Exception as e:
             logger.error(f"Lỗi Direct Search: {e}")
-        finally:
-            await browser.close()
             
     return results
 
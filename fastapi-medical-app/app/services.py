@@ -13,6 +13,7 @@ from dotenv import load_dotenv
 # NEW MODULES IMPORTS
 from app.database.core import DatabaseCore
 from app.service.drug_repo import DrugRepository
+from app.service.drug_index_service import notify_kb_changes
 from app.service.drug_search_service import DrugSearchService
 from app.service.drug_approval_service import DrugApprovalService
 from app.service.ai_consult_service import analyze_treatment_group
@@ -255,6 +256,7 @@ class DrugDbEngine:
                 
                 conn.commit()
                 conn.close()
+                notify_kb_changes(self.db_core)
                 return {"status": "created", "message": f"Link and KB Sync created: {sdk} <-> {icd_code}", "id": new_id}
                 
         except Exception as e:
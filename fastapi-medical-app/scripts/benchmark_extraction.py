@@ -0,0 +1,92 @@
+"""
+Benchmark trích xuất của crawler trên fixture corpus (không cần mạng / Chromium).
+
+- Mỗi site config (crawler/config.py) có trang chi tiết trong corpus: pages/sec của
+  extract_drug_details_html và latency trung bình theo field (+ _parse, _content),
+  kèm tỉ lệ trang trích được field đó.
+- parse_drug_info (chạy trên mọi candidate): us/candidate tổng và theo từng regex.
+
+Usage:
+    python scripts/benchmark_extraction.py [--corpus unittest/fixtures/html] [--repeat 200]
+Ghi thêm trang vào corpus: scripts/record_crawl_fixtures.py
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.utils import SDK_PATTERN  # noqa: E402
+from app.service.crawler.config import get_drug_web_config  # noqa: E402
+from app.service.crawler.extractors import extract_drug_details_html  # noqa: E402
+from app.service.crawler.replay import FixtureCorpus  # noqa: E402
+from app.service.crawler.utils import CONG_TY_PATTERN, HOAT_CHAT_PATTERN, SDK_PATTERNS, parse_drug_info  # noqa: E402
+
+logger = logging.getLogger("benchmark_extraction")
+
+
+def bench_site(site, pages, repeat):
+    timings = defaultdict(float)
+    found = defaultdict(int)
+    contents = []
+    start = time.perf_counter()
+    for i in range(repeat):
+        for html in pages:
+            content, fields = extract_drug_details_html(html, site, site["site_name"], logger, timings=timings)
+            if i == 0:
+                contents.append(content)
+                for field, value in fields.items():
+                    found[field] += bool(value)
+    elapsed = time.perf_counter() - start
+    runs = repeat * len(pages)
+    print(f"\n[{site['site_name']}] {len(pages)} pages x {repeat}: {runs / elapsed:8.1f} pages/s "
+          f"({elapsed / runs * 1000:.2f} ms/page)")
+    for field, total in sorted(timings.items(), key=lambda kv: -kv[1]):
+        hit = "" if field.startswith("_") else f"  found {found[field]}/{len(pages)}"
+        print(f"  {field:20s} {total / runs * 1e6:9.1f} us/page{hit}")
+    return contents
+
+
+def bench_parse_drug_info(contents, repeat):
+    patterns = [(f"SDK_PATTERNS[{i}]", p) for i, p in enumerate(SDK_PATTERNS)]
+    patterns += [("SDK_PATTERN (fallback)", SDK_PATTERN), ("HOAT_CHAT_PATTERN", HOAT_CHAT_PATTERN),
+                 ("CONG_TY_PATTERN", CONG_TY_PATTERN)]
+    runs = repeat * len(contents)
+    print(f"\n[parse_drug_info] {len(contents)} candidates x {repeat}")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in contents:
+            parse_drug_info(content)
+    print(f"  {'total':24s} {(time.perf_counter() - start) / runs * 1e6:9.1f} us/candidate")
+    for label, pattern in patterns:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content in contents:
+                pattern.search(content)
+        print(f"  {label:24s} {(time.perf_counter() - start) / runs * 1e6:9.1f} us/candidate")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default="unittest/fixtures/html")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = FixtureCorpus(args.corpus)
+    print(f"Corpus {args.corpus}: {len(corpus.pages)} pages")
+    contents = []
+    for site in get_drug_web_config():
+        pages = [corpus.get(entry["url"]) for entry in corpus.entries(site["site_name"], kind="detail")]
+        if not pages:
+            print(f"\n[{site['site_name']}] no detail pages in corpus - skipped")
+            continue
+        contents += bench_site(site, pages, args.repeat)
+    if contents:
+        bench_parse_drug_info(contents, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark: normalize_for_matching cũ (NFKD + list comprehension + re.sub mỗi lần gọi)
+so với app/core/normalizer.py (translate table, regex compile sẵn, LRU cache, normalize_many).
+
+Usage:
+    python scripts/benchmark_normalizer.py [path/to/medical.db] [--repeat 5]
+Không có DB: dùng danh sách tên thuốc mẫu nhân bản.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.normalizer import _normalize, cache_info, normalize_for_matching, normalize_many  # noqa: E402
+
+SAMPLE = [
+    "Paracetamol 500mg", "Hapacol 250 (Paracetamol 250mg) - Gói 1,5g", "Amoxicillin 500mg + Clavulanic 125mg",
+    "Kẽm (dưới dạng Kẽm gluconat) 10mg/5ml", "Thuốc nhỏ mắt Tobrex 0,3% [chai 5ml]", "Vitamin C 0500mg",
+    "Mỗi gói chứa: Cefixim (dưới dạng Cefixim trihydrat) 100 mg", "Efferalgan 500mg viên sủi", "SĐK: VD-12345-12",
+]
+
+
+def legacy_normalize_for_matching(text: str) -> str:
+    """Bản cũ (trước khi gộp về app/core/normalizer.py), giữ để so sánh."""
+    if not text:
+        return ""
+    text = text.lower()
+    text = unicodedata.normalize('NFKD', text)
+    text = "".join([c for c in text if not unicodedata.combining(c)])
+    text = text.replace('đ', 'd')
+    text = text.replace("/", " ")
+    text = re.sub(r'[\(\)\[\]]', ' ', text)
+    text = re.sub(r'[^a-z0-9\s\-\+\%\.]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    def strip_leading_zeros(match):
+        num = match.group(1).lstrip('0') or '0'
+        suffix = match.group(2) or ''
+        return num + suffix
+
+    return re.sub(r'\b0+(\d+)(ml|mg|mcg|g|iu|ui|l|%)?\b', strip_leading_zeros, text, flags=re.IGNORECASE)
+
+
+def load_texts(db_path):
+    if db_path and os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        texts = [r[0] for r in conn.execute("SELECT ten_thuoc FROM drugs WHERE ten_thuoc IS NOT NULL")]
+        texts += [r[0] for r in conn.execute("SELECT hoat_chat FROM drugs WHERE hoat_chat IS NOT NULL")]
+        conn.close()
+        return texts
+    return [f"{name} {i}" for i in range(1000) for name in SAMPLE]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("db", nargs="?", default="app/database/medical.db")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    texts = load_texts(args.db)
+    expected = [legacy_normalize_for_matching(t) for t in texts]
+    assert [normalize_for_matching(t) for t in texts] == expected, "normalize_for_matching khác bản cũ"
+    assert normalize_many(texts) == expected, "normalize_many khác bản cũ"
+
+    cases = [
+        ("legacy (per call)", lambda: [legacy_normalize_for_matching(t) for t in texts]),
+        ("new, uncached", lambda: [_normalize(t) for t in texts]),
+        ("new, normalize_many", lambda: normalize_many(texts)),
+        ("new, LRU warm", lambda: [normalize_for_matching(t) for t in texts]),
+    ]
+    print(f"{len(texts)} texts, best of {args.repeat}")
+    baseline = None
+    for label, fn in cases:
+        elapsed = timed(fn, args.repeat)
+        baseline = baseline or elapsed
+        print(f"  {label:22s} {elapsed * 1000:9.1f} ms  {elapsed / len(texts) * 1e6:6.2f} us/text  x{baseline / elapsed:5.1f}")
+    print(f"  cache: {cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
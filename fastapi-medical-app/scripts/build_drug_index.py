@@ -0,0 +1,55 @@
+"""
+Build the persisted drug index (TF-IDF + BM25) for the current `drugs` table.
+
+Chạy trước khi deploy / sau khi import dữ liệu, để các worker chỉ cần
+mmap file index lúc khởi động thay vì fit lại trên toàn bộ corpus.
+
+Usage:
+    python scripts/build_drug_index.py                 # DB theo DB_TYPE / DB_PATH
+    python scripts/build_drug_index.py --db app/database/medical.db --out /data/drug_index
+"""
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build persisted drug TF-IDF/BM25 index")
+    parser.add_argument("--db", help="SQLite database path (default: DB_PATH / app/database/medical.db)")
+    parser.add_argument("--out", help="Index directory (default: DRUG_INDEX_DIR or drug_index/ next to the DB)")
+    parser.add_argument("--keep", type=int, default=None, help="Number of index versions to keep")
+    args = parser.parse_args()
+
+    if args.out:
+        os.environ["DRUG_INDEX_DIR"] = args.out
+
+    # Import sau khi set env để DRUG_INDEX_DIR có hiệu lực
+    from app.database.core import DatabaseCore
+    from app.service import drug_index_store
+    from app.service.drug_index_service import DrugIndexService
+
+    db_core = DatabaseCore(args.db) if args.db else DatabaseCore()
+    index = DrugIndexService(db_core, persist=True)
+
+    start = time.time()
+    path = index.build_index_file()
+    corpus = index.drugs()
+    if not path:
+        print(f"[Build Index] Nothing written ({len(corpus)} verified drugs).")
+        return 1
+
+    index_dir = os.path.dirname(path)
+    keep = args.keep if args.keep is not None else drug_index_store.INDEX_KEEP
+    removed = drug_index_store.prune_indexes(index_dir, keep=keep, current=path)
+
+    print(f"[Build Index] {len(corpus)} drugs -> {path}")
+    print(f"[Build Index] Done in {time.time() - start:.2f}s (removed {removed} old index versions)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Ghi trang thuốc thật vào fixture corpus (app/service/crawler/replay.py) để replay offline
+và benchmark (scripts/benchmark_extraction.py). Thay cho dump tay kiểu
+scripts/2026_01_07_dump_html.py.
+
+Usage:
+    python scripts/record_crawl_fixtures.py --site ThuocBietDuoc URL [URL ...]
+    python scripts/record_crawl_fixtures.py --site TrungTamThuoc --browser URL      # trang render bằng JS
+    python scripts/record_crawl_fixtures.py --site ThuocBietDuoc --kind search URL
+    python scripts/record_crawl_fixtures.py --search "hapacol 250" URL               # kết quả search engine
+
+Replay: CRAWL_REPLAY_DIR=<corpus> uvicorn app.main:app ...
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.service.crawler.browser_pool import browser_pool  # noqa: E402
+from app.service.crawler.http_fetch import HttpFetcher  # noqa: E402
+from app.service.crawler.replay import FixtureCorpus  # noqa: E402
+
+
+async def fetch_with_browser(url):
+    async with browser_pool.page(ignore_https_errors=True, locale="vi-VN") as page:
+        await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+        return await page.content()
+
+
+async def record(args):
+    corpus = FixtureCorpus(args.corpus)
+    if args.search:
+        corpus.search[args.search.strip().lower()] = list(args.urls)
+        print(f"search '{args.search}' -> {len(args.urls)} URLs")
+    else:
+        fetcher = HttpFetcher()
+        try:
+            for url in args.urls:
+                html = await fetch_with_browser(url) if args.browser else await fetcher.get_html(url)
+                if not html:
+                    print(f"FAILED  {url}")
+                    continue
+                file_name = corpus.add(url, html, args.site, kind=args.kind)
+                print(f"saved   {url} -> {file_name} ({len(html)} chars)")
+        finally:
+            await fetcher.close()
+            await browser_pool.close()
+    corpus.save()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--corpus", default="unittest/fixtures/html")
+    parser.add_argument("--site", default="ThuocBietDuoc", help="site_name trong crawler/config.py")
+    parser.add_argument("--kind", default="detail", choices=["detail", "search"])
+    parser.add_argument("--browser", action="store_true", help="lấy DOM sau khi render bằng Chromium")
+    parser.add_argument("--search", help="ghi các URL làm kết quả search engine cho keyword này")
+    args = parser.parse_args()
+    asyncio.run(record(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Unit Tests for the shared crawler browser pool (app/service/crawler/browser_pool.py).
+Playwright được thay bằng fake để không cần Chromium.
+"""
+import asyncio
+
+import pytest
+
+from app.service.crawler import core_drug
+from app.service.crawler.browser_pool import BrowserPool
+from app.service.crawler.replay import FixtureCorpus, set_active_corpus
+from app.service.crawler.stealth_config import create_stealth_context
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+        self.context.pages.remove(self)
+
+
+class FakeContext:
+    def __init__(self, options):
+        self.options = options
+        self.pages = []
+        self.closed = False
+        self._on_page = []
+        self.init_scripts = []
+        self.routes = []
+
+    async def add_init_script(self, script):
+        self.init_scripts.append(script)
+
+    async def route(self, pattern, handler):
+        self.routes.append((pattern, handler))
+
+    def on(self, event, callback):
+        if event == "page":
+            self._on_page.append(callback)
+
+    async def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        for callback in self._on_page:
+            callback(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+        self._on_disconnect = []
+
+    def on(self, event, callback):
+        if event == "disconnected":
+            self._on_disconnect.append(callback)
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **options):
+        context = FakeContext(options)
+        self.contexts.append(context)
+        return context
+
+    def crash(self):
+        self.connected = False
+        for callback in self._on_disconnect:
+            callback(self)
+
+    async def close(self):
+        self.connected = False
+
+
+class FakePlaywright:
+    def __init__(self):
+        self.browsers = []
+        self.chromium = self
+
+    async def start(self):
+        return self
+
+    async def launch(self, headless=True, args=None):
+        browser = FakeBrowser()
+        self.browsers.append(browser)
+        return browser
+
+    async def stop(self):
+        pass
+
+
+def make_pool(**kwargs):
+    fake = FakePlaywright()
+    return BrowserPool(playwright_factory=lambda: fake, **kwargs), fake
+
+
+@pytest.mark.asyncio
+async def test_browser_and_context_are_reused_between_leases():
+    pool, fake = make_pool(size=2)
+    async with pool.page(locale="vi-VN") as first:
+        pass
+    async with pool.page(locale="vi-VN") as second:
+        assert second.context is first.context
+    assert first.closed and second.closed
+    assert len(fake.browsers) == 1 and pool.launches == 1
+
+    async with pool.page(locale="en-US") as other:  # option khác -> context khác, cùng browser
+        assert other.context is not first.context
+    assert len(fake.browsers) == 1
+
+
+@pytest.mark.asyncio
+async def test_context_is_recycled_after_page_budget_or_error():
+    pool, fake = make_pool(size=1, page_budget=2)
+    contexts = []
+    for _ in range(3):
+        async with pool.page() as page:
+            contexts.append(page.context)
+    assert contexts[0] is contexts[1] and contexts[2] is not contexts[0]
+    assert contexts[0].closed
+
+    with pytest.raises(RuntimeError):
+        async with pool.context() as context:
+            raise RuntimeError("navigation failed")
+    assert context.closed
+
+
+@pytest.mark.asyncio
+async def test_setup_runs_once_per_context_and_factory_options_are_not_part_of_key():
+    pool, fake = make_pool(size=1, page_budget=2)
+    agents = iter(["UA-1", "UA-2"])
+    setups = []
+
+    async def setup(context):
+        setups.append(context)
+
+    def options_factory():
+        return {"user_agent": next(agents)}
+
+    contexts = []
+    for _ in range(3):
+        async with pool.page(setup=setup, options_factory=options_factory, profile="test", locale="vi-VN") as page:
+            contexts.append(page.context)
+    assert contexts[0] is contexts[1] and contexts[2] is not contexts[0]
+    assert setups == [contexts[0], contexts[2]]
+    assert [c.options for c in (contexts[0], contexts[2])] == [
+        {"locale": "vi-VN", "user_agent": "UA-1"}, {"locale": "vi-VN", "user_agent": "UA-2"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_contexts_are_never_shared_across_setup_profiles():
+    pool, fake = make_pool(size=1)
+
+    def make_setup(tag):
+        async def setup(context):
+            await context.add_init_script(tag)
+        return setup
+
+    seen = {}
+    for _ in range(2):
+        for tag in ("drug", "icd"):
+            # closure mới mỗi vòng: key theo profile, không theo id(setup)
+            async with pool.page(setup=make_setup(tag), profile=tag) as page:
+                seen.setdefault(tag, []).append(page.context)
+    assert seen["drug"][0] is seen["drug"][1] and seen["icd"][0] is seen["icd"][1]
+    assert seen["drug"][0] is not seen["icd"][0]
+    assert (seen["drug"][0].init_scripts, seen["icd"][0].init_scripts) == (["drug"], ["icd"])
+
+    with pytest.raises(ValueError):
+        async with pool.page(setup=make_setup("x")):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_drug_scrapes_borrow_pooled_contexts(monkeypatch):
+    pool, fake = make_pool(size=1)
+    monkeypatch.setattr(core_drug, "browser_pool", pool)
+    seen = []
+    for _ in range(2):
+        async with core_drug.drug_context() as context:
+            await context.new_page()
+            seen.append(context)
+    assert seen[0] is seen[1] and not seen[0].closed
+    assert seen[0].init_scripts == [core_drug.STEALTH_INIT_SCRIPT]  # stealth script một lần / context
+    assert seen[0].options["locale"] == "vi-VN" and "user_agent" in seen[0].options
+
+
+@pytest.mark.asyncio
+async def test_playwright_manager_cleanup_leaves_shared_pool_open(monkeypatch):
+    from app.service import playwright_manager as manager_module
+
+    pool, fake = make_pool(size=1)
+    monkeypatch.setattr(manager_module, "browser_pool", pool)
+    manager = manager_module.PlaywrightManager()
+    await manager.initialize()
+    await manager.cleanup()
+    browser = fake.browsers[0]
+    assert browser.connected
+    async with pool.browser() as again:  # crawler vẫn dùng được browser ấm
+        assert again is browser
+
+
+@pytest.mark.asyncio
+async def test_replay_corpus_is_installed_on_every_new_context(tmp_path):
+    pool, fake = make_pool(size=1)
+    async with pool.page() as live:
+        pass
+    corpus = FixtureCorpus(str(tmp_path))
+    set_active_corpus(corpus)
+    try:
+        async with pool.page() as replayed:
+            # context tạo trước khi bật replay không được dùng lại
+            assert replayed.context is not live.context
+        assert live.context.routes == []
+        assert replayed.context.routes == [("**/*", corpus.route_handler)]
+
+        async with pool.browser() as browser:
+            stealth = await create_stealth_context(browser)  # fallback multi-engine
+        assert stealth.routes == [("**/*", corpus.route_handler)]
+    finally:
+        set_active_corpus(None)
+
+
+@pytest.mark.asyncio
+async def test_crashed_browser_is_replaced():
+    pool, fake = make_pool(size=1)
+    async with pool.browser() as browser:
+        pass
+    browser.crash()
+    async with pool.browser() as replacement:
+        assert replacement is not browser
+    assert pool.launches == 2
+    await pool.close()
+    assert not replacement.connected
+
+
+@pytest.mark.asyncio
+async def test_concurrent_leases_are_bounded():
+    pool, fake = make_pool(size=2, max_leases=1)
+    in_flight, peak = 0, 0
+
+    async def crawl():
+        nonlocal in_flight, peak
+        async with pool.browser():
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+
+    await asyncio.gather(*(crawl() for _ in range(6)))
+    assert peak == 2
+    assert pool.launches == 2
@@ -0,0 +1,104 @@
+"""
+Unit Tests for the active-ingredient + strength index (app/service/composition_index.py).
+"""
+import pytest
+
+from app.database.core import DatabaseCore
+from app.database.pool import close_all_pools
+from app.service.composition_index import CompositionIndex, parse_composition
+from app.service.drug_index_service import get_drug_index
+
+
+@pytest.mark.parametrize("left, right", [
+    ("Amoxicillin 500mg + Clavulanic 125mg",
+     "Amoxicillin (dưới dạng Amoxicillin trihydrat) 500mg; Acid clavulanic (dưới dạng Kali clavulanat) 125mg"),
+    ("Tramadol 37,5mg + Paracetamol 325mg", "Paracetamol 325mg; Tramadol hydroclorid 37.5 mg"),
+    ("Metronidazole 0.5g", "Metronidazol 500mg"),
+    ("Paracetamol 120 mg/5 ml", "Mỗi 5ml chứa: Paracetamol 120mg"),
+    ("Racecadotril 30mg/gói", "Mỗi gói 1g chứa: Racecadotril 30mg"),
+])
+def test_equivalent_compositions_share_a_key(left, right):
+    assert parse_composition(left) is not None
+    assert parse_composition(left) == parse_composition(right)
+
+
+@pytest.mark.parametrize("left, right", [
+    ("Amoxicillin 500mg", "Amoxicillin 250mg"),
+    ("Kẽm 10mg/5ml", "Kẽm 10mg/10ml"),
+    ("Natri clorid 0,9%", "Kali clorid 0,9%"),
+    ("Amoxicillin 500mg + Clavulanic 125mg", "Amoxicillin 500mg"),
+])
+def test_different_compositions_differ(left, right):
+    assert parse_composition(left) != parse_composition(right)
+
+
+@pytest.mark.parametrize("text", [None, "", "Paracetamol", "Paracetamol 500mg Stada", "Eucalyptol, menthol 10mg"])
+def test_component_without_strength_is_not_indexed(text):
+    assert parse_composition(text) is None
+
+
+def test_index_prefers_verbatim_ingredients_then_smallest_id():
+    ingredients = ["Amoxicillin 500mg", "Amoxicillin (dưới dạng trihydrat) 500 mg", "Amoxicillin 500mg"]
+    index = CompositionIndex()
+    for pos, drug_id in enumerate([30, 10, 20]):
+        index.add(pos, drug_id, ingredients[pos])
+
+    assert index.lookup("amoxicillin 500 mg") == 1
+    assert index.lookup("Amoxicillin 500mg", ingredients) == 2
+    assert index.lookup_all("Amoxicillin 0.5g") == [1, 2, 0]
+
+    grown = index.copy()
+    grown.remove(1, ingredients[1])
+    assert grown.lookup("Amoxicillin 500mg") == 2
+    assert index.lookup("Amoxicillin 500mg") == 1  # bản gốc không đổi
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "composition_test.db")
+    core = DatabaseCore(path)
+    conn = core.get_connection()
+    cursor = conn.cursor()
+    for ten, hc, sdk in [
+        ("Augmentin 625mg", "Amoxicillin (dưới dạng Amoxicillin trihydrat) 500mg; Acid clavulanic 125mg", "VN-10001-01"),
+        ("Amoxicillin 500mg", "Amoxicillin 500mg", "VD-10002-02"),
+    ]:
+        cursor.execute(
+            "INSERT INTO drugs (ten_thuoc, hoat_chat, so_dang_ky, search_text, is_verified) VALUES (?, ?, ?, ?, 1)",
+            (ten, hc, sdk, ten.lower()),
+        )
+    conn.commit()
+    conn.close()
+    yield path
+    close_all_pools()
+
+
+def test_matcher_resolves_composition_between_exact_and_partial(db_path):
+    from app.mapping_drugs.matcher import DrugMatcher
+
+    matcher = DrugMatcher(DatabaseCore(db_path))
+    res = matcher.match("Amoxicillin 500mg + Clavulanic 125mg")
+    assert (res["method"], res["data"]["ten_thuoc"]) == ("COMPOSITION_MATCH", "Augmentin 625mg")
+    assert res["confidence"] == matcher.COMPOSITION_CONFIDENCE
+    assert matcher.match("Amoxicillin 500mg")["method"] == "EXACT_MATCH"  # exact vẫn đứng trước
+
+    batch = matcher.match_batch(["Amoxicillin 500mg + Clavulanic 125mg", "clavulanic 125 mg; amoxicillin 0.5g"])
+    assert [r["data"]["ten_thuoc"] for r in batch] == ["Augmentin 625mg", "Augmentin 625mg"]
+    top = matcher.candidates("Amoxicillin 500mg + Clavulanic 125mg", k=3)[0]
+    assert top["scores"]["composition"] == 1.0
+
+
+def test_composition_index_follows_deltas(db_path):
+    from app.service.drug_approval_service import DrugApprovalService
+
+    core = DatabaseCore(db_path)
+    index = get_drug_index(core)
+    before = index.drugs().composition_index()
+    assert before.lookup("Cefuroxim 250mg") is None
+
+    DrugApprovalService(core).save_verified_drug({
+        "ten_thuoc": "Zinnat 250mg", "so_dang_ky": "VN-10003-03", "hoat_chat": "Cefuroxim (dưới dạng Cefuroxim axetil) 250mg",
+    })
+    corpus = index.drugs()
+    assert corpus.names[corpus.composition_index().lookup("Cefuroxime 250 mg")] == "Zinnat 250mg"
+    assert before.lookup("Cefuroxim 250mg") is None
@@ -0,0 +1,116 @@
+"""
+Unit Tests for the offline crawler replay harness (app/service/crawler/replay.py)
+trên fixture corpus unittest/fixtures/html (manifest.json).
+"""
+import os
+
+import pytest
+
+pytest.importorskip("lxml.cssselect")
+
+from app.database.core import DatabaseCore
+from app.database.pool import close_all_pools
+from app.service.crawler import core_drug, http_fetch
+from app.service.crawler.config import get_drug_web_config
+from app.service.crawler.extractors import extract_drug_details_html
+from app.service.crawler.google_search import GoogleSearchService, google_backend
+from app.service.crawler.http_fetch import HttpFetcher
+from app.service.crawler.replay import FixtureCorpus, normalize_url, set_active_corpus
+from app.service.crawler.utils import logger
+from app.service.scrape_cache_service import SearchUrlCacheService
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+SITES = {site["site_name"]: site for site in get_drug_web_config()}
+HAPACOL_URL = "https://www.thuocbietduoc.com.vn/thuoc-48012/hapacol-250.aspx"
+
+
+@pytest.fixture
+def corpus():
+    return FixtureCorpus(CORPUS_DIR)
+
+
+@pytest.fixture
+def replay(corpus, monkeypatch):
+    """Bật replay cho toàn crawler; browser path chỉ ghi lại URL bị escalate."""
+    escalated = []
+
+    async def fake_browser(browser, site_config, keyword, direct_url=None):
+        escalated.append(direct_url)
+        return []
+
+    set_active_corpus(corpus)
+    monkeypatch.setattr(http_fetch, "http_fetcher", HttpFetcher())
+    monkeypatch.setattr(core_drug, "scrape_single_site_drug_browser", fake_browser)
+    yield escalated
+    set_active_corpus(None)
+
+
+def test_urls_match_after_normalization(corpus):
+    assert normalize_url("http://thuocbietduoc.com.vn/thuoc-48012/hapacol-250.aspx/") == normalize_url(HAPACOL_URL)
+    assert corpus.get("https://thuocbietduoc.com.vn/thuoc/drgsearch.aspx?key=hapacol%20250") is not None
+    assert corpus.get("https://thuocbietduoc.com.vn/thuoc-1/khac.aspx") is None
+    assert all(corpus.get(entry["url"]) for entry in corpus.entries())
+
+
+@pytest.mark.parametrize("site_name", ["ThuocBietDuoc", "TrungTamThuoc", "NhaThuocLongChau"])
+def test_every_recorded_detail_page_still_extracts(corpus, site_name):
+    timings = {}
+    complete = 0
+    for entry in corpus.entries(site_name, kind="detail"):
+        _, fields = extract_drug_details_html(corpus.get(entry["url"]), SITES[site_name], site_name, logger, timings=timings)
+        if fields.get("so_dang_ky") and fields.get("hoat_chat"):
+            assert fields["so_dang_ky"] == "VD-20570-14"
+            assert fields["hoat_chat"].startswith("Paracetamol")
+            complete += 1
+    assert complete == 1
+    assert {"_parse", "_content", "so_dang_ky", "hoat_chat"} <= set(timings)
+
+
+@pytest.mark.asyncio
+async def test_replay_serves_fast_tier_and_search_backend(corpus, replay, tmp_path):
+    results = await core_drug.scrape_single_site_drug(None, SITES["ThuocBietDuoc"], "hapacol 250")
+    assert [r["Link"] for r in results] == [HAPACOL_URL]
+    assert replay == ["https://www.thuocbietduoc.com.vn/thuoc-51234/hapacol-250-flu.aspx"]
+    assert corpus.misses == []
+
+    url_cache = SearchUrlCacheService(DatabaseCore(str(tmp_path / "replay.db")))
+    try:
+        assert await GoogleSearchService(url_cache=url_cache).find_drug_url_async("Hapacol 250") == HAPACOL_URL
+    finally:
+        close_all_pools()
+
+
+def test_search_backend_follows_replay_toggled_after_service_creation(corpus):
+    service = GoogleSearchService(url_cache=object())
+    assert service.backend is google_backend
+    set_active_corpus(corpus)
+    try:
+        assert service._search("Hapacol 250", 5) == HAPACOL_URL
+        assert service.backend is service.backend  # stub của corpus được giữ lại
+    finally:
+        set_active_corpus(None)
+    assert service.backend is google_backend
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type="document"):
+        self.request = type("Request", (), {"url": url, "resource_type": resource_type})()
+        self.calls = []
+
+    async def fulfill(self, **kwargs):
+        self.calls.append(("fulfill", kwargs.get("status")))
+
+    async def abort(self):
+        self.calls.append(("abort", None))
+
+
+@pytest.mark.asyncio
+async def test_route_handler_never_goes_to_network(corpus):
+    routes = [
+        FakeRoute(HAPACOL_URL),
+        FakeRoute("https://thuocbietduoc.com.vn/khong-co.aspx"),
+        FakeRoute("https://cdn.example.com/app.js", resource_type="script"),
+    ]
+    for route in routes:
+        await corpus.route_handler(route)
+    assert [route.calls for route in routes] == [[("fulfill", 200)], [("fulfill", 404)], [("abort", None)]]
@@ -0,0 +1,131 @@
+"""
+Unit Tests for the crawl scheduler (app/service/crawler/scheduler.py).
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.service.crawler.scheduler import CrawlScheduler, domain_of
+
+
+@pytest.mark.asyncio
+async def test_identical_keys_share_one_crawl():
+    scheduler = CrawlScheduler(max_concurrent=4)
+    calls = []
+
+    async def crawl(name):
+        calls.append(name)
+        await asyncio.sleep(0.05)
+        return {"ten_thuoc": name}
+
+    results = await asyncio.gather(
+        *(scheduler.submit(("drug", "hapacol"), lambda: crawl("hapacol")) for _ in range(5)),
+        scheduler.submit(("drug", "panadol"), lambda: crawl("panadol")),
+    )
+    assert calls == ["hapacol", "panadol"]
+    assert results[0] is results[4] and results[5] == {"ten_thuoc": "panadol"}
+    assert scheduler.stats()["coalesced"] == 4 and scheduler.stats()["inflight_keys"] == 0
+
+    # Crawl đã xong -> lần submit sau chạy lại
+    await scheduler.submit(("drug", "hapacol"), lambda: crawl("hapacol"))
+    assert calls.count("hapacol") == 2
+
+
+@pytest.mark.asyncio
+async def test_queue_runs_higher_priority_first():
+    scheduler = CrawlScheduler(max_concurrent=1)
+    gate = asyncio.Event()
+    order = []
+
+    async def crawl(name):
+        if name == "blocker":
+            await gate.wait()
+        order.append(name)
+
+    blocker = asyncio.ensure_future(scheduler.submit("blocker", lambda: crawl("blocker")))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.ensure_future(scheduler.submit(name, lambda n=name: crawl(n), priority))
+        for name, priority in (("batch-1", 10), ("batch-2", 10), ("interactive", 0))
+    ]
+    await asyncio.sleep(0.01)
+    assert scheduler.stats()["running"] == 1 and scheduler.stats()["queued"] == 3
+    gate.set()
+    await asyncio.gather(blocker, *queued)
+    assert order == ["blocker", "interactive", "batch-1", "batch-2"]
+
+
+@pytest.mark.asyncio
+async def test_crawl_is_cancelled_only_when_every_caller_gives_up():
+    scheduler = CrawlScheduler()
+    state = {"finished": 0, "cancelled": 0}
+
+    async def crawl():
+        try:
+            await asyncio.sleep(0.1)
+            state["finished"] += 1
+            return "ok"
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+
+    impatient = asyncio.ensure_future(scheduler.submit("k", crawl))
+    patient = asyncio.ensure_future(scheduler.submit("k", crawl))
+    await asyncio.sleep(0.01)
+    impatient.cancel()
+    assert await patient == "ok" and state == {"finished": 1, "cancelled": 0}
+
+    lone = asyncio.ensure_future(scheduler.submit("k", crawl))
+    await asyncio.sleep(0.01)
+    lone.cancel()
+    await asyncio.gather(lone, return_exceptions=True)
+    assert state["cancelled"] == 1 and scheduler.stats()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_domain_concurrency_and_token_bucket():
+    scheduler = CrawlScheduler(
+        domain_concurrency=1, domain_rate=0,
+        domain_limits={"www.trungtamthuoc.com": {"concurrency": 3, "rate": 20, "burst": 1}},
+    )
+    peak = {"thuocbietduoc.com.vn": 0, "trungtamthuoc.com": 0}
+
+    async def fetch(url):
+        async with scheduler.domain_slot(url):
+            domain = domain_of(url)
+            peak[domain] = max(peak[domain], scheduler.stats()["domains"][domain]["active"])
+            await asyncio.sleep(0.02)
+
+    await asyncio.gather(*(fetch(f"https://www.thuocbietduoc.com.vn/thuoc-{i}.aspx") for i in range(4)))
+    assert peak["thuocbietduoc.com.vn"] == 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(fetch(f"https://trungtamthuoc.com/p{i}") for i in range(4)))
+    assert time.monotonic() - started >= 0.14  # burst 1, 20 req/s -> 3 lượt chờ ~50ms
+    assert scheduler.stats()["domains"]["trungtamthuoc.com"]["requests"] == 4
+
+
+@pytest.mark.asyncio
+async def test_search_engine_navigations_go_through_domain_slots(monkeypatch):
+    from app.service.crawler import core_drug, search_engines
+
+    scheduler = CrawlScheduler(max_concurrent=4)
+    monkeypatch.setattr(core_drug, "crawl_scheduler", scheduler)
+
+    async def no_pause(*args):
+        pass
+
+    monkeypatch.setattr(search_engines, "human_pause", no_pause)
+
+    class FakePage:
+        async def goto(self, url, **kwargs):
+            assert scheduler.stats()["domains"][domain_of(url)]["active"] == 1
+            return None
+
+        async def query_selector_all(self, selector):
+            return []
+
+    assert await search_engines.search_duckduckgo(FakePage(), "hapacol 250") == []
+    assert scheduler.stats()["domains"][domain_of("https://html.duckduckgo.com/")]["requests"] == 1
+
@@ -0,0 +1,164 @@
+"""
+Unit Tests for DatabaseCore connection pooling (app/database/pool.py).
+"""
+import os
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.database.core import DatabaseCore, SqliteConnectionWrapper
+from app.database.pool import ConnectionPool, PoolTimeoutError, close_all_pools
+
+
+class _FakeConn:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _make_pool(max_size=2, timeout=0.2, **kwargs):
+    return ConnectionPool(
+        name="fake",
+        connect=lambda: (_FakeConn(), None),
+        ping=lambda raw: None,
+        reset=lambda raw: None,
+        min_size=0,
+        max_size=max_size,
+        timeout=timeout,
+        **kwargs,
+    )
+
+
+class TestConnectionPool:
+    def test_reuses_returned_connection(self):
+        pool = _make_pool()
+        entry = pool.acquire()
+        raw = entry.raw
+        pool.release(entry)
+
+        assert pool.acquire().raw is raw
+        stats = pool.stats()
+        assert stats["created"] == 1
+        assert stats["checkouts"] == 2
+
+    def test_bounded_and_times_out(self):
+        pool = _make_pool(max_size=1, timeout=0.1)
+        pool.acquire()
+        with pytest.raises(PoolTimeoutError):
+            pool.acquire()
+        assert pool.stats()["timeouts"] == 1
+
+    def test_waiter_gets_released_connection(self):
+        pool = _make_pool(max_size=1, timeout=2)
+        entry = pool.acquire()
+        got = []
+
+        t = threading.Thread(target=lambda: got.append(pool.acquire()))
+        t.start()
+        pool.release(entry)
+        t.join(2)
+
+        assert got and got[0].raw is entry.raw
+        assert pool.stats()["waits"] == 1
+
+    def test_failed_health_check_discards(self):
+        def bad_ping(raw):
+            raise RuntimeError("server closed the connection")
+
+        pool = _make_pool(ping_interval=0)
+        pool._ping = bad_ping
+        entry = pool.acquire()
+        pool.release(entry)
+
+        fresh = pool.acquire()
+        assert fresh.raw is not entry.raw
+        assert entry.raw.closed
+        assert pool.stats()["health_check_failures"] == 1
+
+
+class TestDatabaseCorePooling:
+    @pytest.fixture
+    def core(self, tmp_path):
+        close_all_pools()
+        yield DatabaseCore(str(tmp_path / "pool_test.db"))
+        close_all_pools()
+
+    def test_get_connection_is_pooled(self, core):
+        conn = core.get_connection()
+        assert isinstance(conn, SqliteConnectionWrapper)
+        raw = conn.conn
+        conn.close()
+
+        conn2 = core.get_connection()
+        assert conn2.conn is raw
+        conn2.close()
+
+    def test_use_after_close_raises(self, core):
+        import sqlite3
+        conn = core.get_connection()
+        conn.close()
+        conn2 = core.get_connection()
+        assert conn.conn is None
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.commit()
+        conn.close()  # idempotent
+        assert conn2.execute("SELECT 1").fetchone()
+        conn2.close()
+
+    def test_postgres_wrapper_use_after_close_raises(self):
+        import psycopg2
+
+        class FakePool:
+            def __init__(self):
+                self.released = []
+
+            def release(self, entry):
+                self.released.append(entry)
+
+        pool = FakePool()
+        raw = MagicMock()
+        conn = DatabaseCore.PostgresConnectionWrapper(raw, pool=pool, entry="entry")
+        conn.close()
+        assert pool.released == ["entry"] and conn.conn is None
+        for use in (conn.cursor, conn.commit, conn.rollback, lambda: conn.autocommit):
+            with pytest.raises(psycopg2.InterfaceError):
+                use()
+        conn.close()  # idempotent
+        assert pool.released == ["entry"]
+        raw.commit.assert_not_called()
+
+    def test_release_resets_row_factory_and_rolls_back(self, core):
+        import sqlite3
+        conn = core.get_connection()
+        conn.row_factory = sqlite3.Row
+        conn.cursor().execute("INSERT INTO drugs (ten_thuoc) VALUES ('TEST_POOL_UNCOMMITTED')")
+        conn.close()
+
+        conn = core.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) AS n FROM drugs WHERE ten_thuoc = 'TEST_POOL_UNCOMMITTED'")
+        assert cursor.fetchone() == {"n": 0}
+        conn.close()
+
+    def test_replaced_db_file_reconnects(self, core):
+        conn = core.get_connection()
+        raw = conn.conn
+        conn.close()
+
+        os.replace(core.db_path, core.db_path + ".bak")
+        DatabaseCore(core.db_path)  # recreate schema on a new file
+
+        conn = core.get_connection()
+        assert conn.conn is not raw
+        conn.close()
+
+    def test_pool_stats_exposed(self, core):
+        core.get_connection().close()
+        stats = core.pool_stats()
+        assert stats["checkouts"] >= 1
+        assert stats["in_use"] == 0
@@ -0,0 +1,74 @@
+"""
+Unit Tests for the columnar drug catalogue (app/service/drug_catalogue.py).
+"""
+import numpy as np
+import pytest
+
+from app.service.drug_catalogue import CodedColumn, DrugCatalogue, DrugRow, MaskedColumn, StringPool
+
+ROWS = [
+    {"id": 3, "ten_thuoc": "Paracetamol 500mg", "so_dang_ky": "VD-1", "hoat_chat": "Paracetamol",
+     "chi_dinh": "Giảm đau, hạ sốt", "is_verified": 1, "classification": "OTC", "search_text": "paracetamol"},
+    {"id": 7, "ten_thuoc": "Berodual 200 liều", "so_dang_ky": "VN-2", "hoat_chat": None,
+     "chi_dinh": "", "is_verified": 1, "classification": None, "search_text": None},
+    {"id": 9, "ten_thuoc": "Amoxicillin", "so_dang_ky": "VD-3", "hoat_chat": "Amoxicillin",
+     "chi_dinh": None, "is_verified": 1, "classification": "OTC", "search_text": "amoxicillin"},
+]
+
+
+def test_string_pool_round_trip_and_overlay():
+    values = ["Giảm đau", None, "", "ắ ơ ư 10mg/5ml"]
+    pool = StringPool(values)
+    assert list(pool) == values
+    assert [pool[i] for i in range(len(pool))] == values
+    assert pool[-1] == values[-1] and pool[1:3] == values[1:3]
+
+    grown = pool.extended(["Thuốc mới", None])
+    assert list(grown) == values + ["Thuốc mới", None]
+    assert grown._blob is pool._blob  # blob dùng chung, dòng mới trong overlay
+    assert len(pool) == 4
+
+
+def test_coded_column():
+    col = CodedColumn(["OTC", None, "ETC", "OTC"])
+    assert list(col) == ["OTC", None, "ETC", "OTC"]
+    assert col.codes.dtype == np.int16 and col.categories == ["OTC", "ETC"]
+    grown = col.extended(["Kê đơn", "OTC"])
+    assert list(grown)[-2:] == ["Kê đơn", "OTC"]
+    assert col.categories == ["OTC", "ETC"]
+
+
+def test_catalogue_rows_are_slotted_views():
+    catalogue = DrugCatalogue(ROWS)
+    assert catalogue.ids.dtype == np.int64
+    row = catalogue.row(1)
+    assert isinstance(row, DrugRow) and not hasattr(row, "__dict__")
+    assert row["ten_thuoc"] == "Berodual 200 liều" and row["id"] == 7
+    assert row.get("hoat_chat", "x") is None and row.get("note", "x") == "x"
+    with pytest.raises(KeyError):
+        row["note"]
+    assert catalogue.row(0).to_dict()["chi_dinh"] == "Giảm đau, hạ sốt"
+    assert catalogue.documents() == ["paracetamol", "Berodual 200 liều", "amoxicillin"]
+
+    grown = catalogue.with_added([dict(ROWS[0], id=11, ten_thuoc="Paracetamol 650mg")])
+    assert len(catalogue) == 3 and len(grown) == 4
+    assert grown.row(3).to_dict() == dict(catalogue.row(0).to_dict(), id=11, ten_thuoc="Paracetamol 650mg")
+
+
+def test_masked_column_hides_tombstones():
+    names = MaskedColumn(StringPool(["a", "b", "c"]), np.array([True, False, True]))
+    assert list(names) == ["a", None, "c"] and names[1] is None
+
+
+def test_corpus_exposes_catalogue_columns():
+    from app.service.drug_index_service import DrugCorpus
+
+    corpus = DrugCorpus(1, [dict(r) for r in ROWS])
+    assert isinstance(corpus.ids[0], int) and list(corpus.ids) == [3, 7, 9]
+    assert corpus.rows[2]["ten_thuoc"] == "Amoxicillin" and len(corpus.rows) == 3
+    assert corpus.record(0) == {k: ROWS[0][k] for k in corpus.record(0)}
+
+    updated = corpus.with_changes(2, [7], [dict(ROWS[1], ten_thuoc="Berodual N")])
+    assert list(updated.names) == ["Paracetamol 500mg", None, "Amoxicillin", "Berodual N"]
+    assert corpus.names[1] == "Berodual 200 liều"  # snapshot cũ không đổi
+    assert updated.record(updated.positions[7])["ten_thuoc"] == "Berodual N"
@@ -0,0 +1,99 @@
+"""
+Unit Tests for DrugIdentificationService.process_batch (DB pass + concurrent web fallback).
+"""
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.service import drug_identification_service
+from app.service.crawler.scheduler import CrawlScheduler
+from app.service.drug_identification_service import DrugIdentificationService
+
+DB_HITS = {
+    "paracetamol 500mg": {"id": 1, "ten_thuoc": "Paracetamol 500mg", "so_dang_ky": "VD-1", "is_verified": 1},
+    "panadol": {"id": 2, "ten_thuoc": "Panadol", "so_dang_ky": "VD-1", "is_verified": 1},
+}
+
+
+@pytest.fixture
+def search_service():
+    service = MagicMock()
+    service.search_drug_smart_many.side_effect = lambda names, detail_columns=None: [
+        {"data": DB_HITS[n.lower()], "confidence": 1.0, "source": "Database (Exact)", "details": {"note": None}}
+        if n.lower() in DB_HITS else None
+        for n in names
+    ]
+    return service
+
+
+@pytest.fixture
+def web(monkeypatch):
+    state = {"running": 0, "peak": 0, "calls": []}
+
+    async def fake_scrape(keyword, **kwargs):
+        state["calls"].append(keyword)
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        try:
+            await asyncio.sleep(5 if "slow" in keyword.lower() else 0.05)
+        finally:
+            state["running"] -= 1
+        return {"ten_thuoc": keyword.title(), "so_dang_ky": f"WEB-{keyword}"}
+
+    monkeypatch.setattr(drug_identification_service, "scrape_drug_web", fake_scrape)
+    return state
+
+
+@pytest.mark.asyncio
+async def test_db_hits_skip_web_and_sdk_duplicates_follow_input_order(search_service, web):
+    service = DrugIdentificationService(search_service, web_concurrency=2, deadline_seconds=0)
+    results = await service.process_batch(["Panadol", "Paracetamol 500mg", "Alpha", "Beta", "Gamma", "Panadol"])
+
+    assert [r["input_name"] for r in results] == ["Panadol", "Paracetamol 500mg", "Alpha", "Beta", "Gamma"]
+    assert (results[0]["is_duplicate"], results[1]["is_duplicate"]) == (False, True)
+    assert results[1]["duplicate_of"] == "Panadol"
+    assert sorted(web["calls"]) == ["Alpha", "Beta", "Gamma"]
+    assert web["peak"] == 2
+    search_service.search_drug_smart_many.assert_called_once()
+    search_service.drug_details.assert_not_called()  # note đọc cùng lượt search, không chặn event loop
+
+
+@pytest.mark.asyncio
+async def test_deadline_returns_partial_results(search_service, web):
+    service = DrugIdentificationService(search_service, web_concurrency=4, deadline_seconds=0.5)
+    results = await service.process_batch(["Paracetamol 500mg", "Alpha", "Slow drug"])
+
+    assert [r.get("status") for r in results] == [None, None, "Timeout"]
+    assert results[1]["official_name"] == "Alpha"
+    assert web["running"] == 0  # task quá hạn đã bị huỷ
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_for_same_drug_share_one_scrape(search_service, monkeypatch):
+    scheduler = CrawlScheduler()
+    both_submitted = asyncio.Event()
+    calls = []
+
+    async def fake_scrape(keyword, **kwargs):
+        calls.append(keyword)
+        await both_submitted.wait()  # giữ scrape tới khi request thứ hai đã submit cùng key
+        return {"ten_thuoc": keyword.title(), "so_dang_ky": f"WEB-{keyword}"}
+
+    async def release_when_both_submitted():
+        while scheduler.stats()["submitted"] < 2:
+            await asyncio.sleep(0)
+        both_submitted.set()
+
+    monkeypatch.setattr(drug_identification_service, "crawl_scheduler", scheduler)
+    monkeypatch.setattr(drug_identification_service, "scrape_drug_web", fake_scrape)
+    service = DrugIdentificationService(search_service, deadline_seconds=0)
+    (first, second), _ = await asyncio.wait_for(asyncio.gather(
+        asyncio.gather(service.process_batch(["Alpha"]), service.process_batch(["alpha"])),
+        release_when_both_submitted(),
+    ), timeout=5)
+
+    assert calls == ["Alpha"]
+    assert scheduler.stats()["coalesced"] == 1
+    assert first[0]["sdk"] == second[0]["sdk"] == "WEB-Alpha"
+    assert second[0]["input_name"] == "alpha"
@@ -0,0 +1,467 @@
+"""
+Unit Tests for the shared drug index (app/service/drug_index_service.py).
+"""
+import os
+
+import numpy as np
+import pytest
+
+from app.database.core import DatabaseCore
+from app.database.pool import close_all_pools
+from app.service.drug_index_service import BM25Index, DrugIndexService, get_drug_index
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "index_test.db")
+    core = DatabaseCore(path)
+    conn = core.get_connection()
+    cursor = conn.cursor()
+    drugs = [
+        ("Paracetamol 500mg", "Paracetamol", "VD-11111-11", "paracetamol 500mg paracetamol"),
+        ("Amoxicillin 500mg", "Amoxicillin", "VD-22222-22", "amoxicillin 500mg amoxicillin"),
+        ("Berodual 200 lieu", "Fenoterol, Ipratropium", "VN-33333-33", "berodual 200 lieu fenoterol ipratropium"),
+        ("Unverified Drug", "X", "VD-44444-44", "unverified drug"),
+    ]
+    for i, (ten, hc, sdk, st) in enumerate(drugs):
+        cursor.execute(
+            "INSERT INTO drugs (ten_thuoc, hoat_chat, so_dang_ky, search_text, is_verified) VALUES (?, ?, ?, ?, ?)",
+            (ten, hc, sdk, st, 0 if ten == "Unverified Drug" else 1),
+        )
+    cursor.execute(
+        "INSERT INTO knowledge_base (drug_name, drug_name_norm, disease_icd, treatment_type) VALUES (?, ?, ?, ?)",
+        ("Paracetamol 500mg", "paracetamol 500mg", "r51", "main drug"),
+    )
+    conn.commit()
+    conn.close()
+    yield path
+    close_all_pools()
+
+
+def test_index_is_shared_per_database(db_path):
+    assert get_drug_index(DatabaseCore(db_path)) is get_drug_index(DatabaseCore(db_path))
+
+
+def test_drug_corpus_contains_verified_drugs_only(db_path):
+    corpus = get_drug_index(DatabaseCore(db_path)).drugs()
+    assert sorted(corpus.names) == ["Amoxicillin 500mg", "Berodual 200 lieu", "Paracetamol 500mg"]
+    assert len(corpus.sdks) == len(corpus.ingredients) == len(corpus) == 3
+    assert corpus.tfidf_matrix.shape[0] == 3
+
+
+def test_refresh_bumps_version(db_path):
+    index = get_drug_index(DatabaseCore(db_path))
+    v1 = index.drugs().version
+    v2 = index.refresh_drugs().version
+    assert v2 > v1
+    assert index.version == v2
+
+
+def test_matchers_share_the_same_snapshot(db_path):
+    from app.mapping_drugs.matcher import DrugMatcher
+    from app.service.drug_search_service import DrugSearchService
+    from app.service.kb_fuzzy_match_service import KBFuzzyMatchService
+
+    core = DatabaseCore(db_path)
+    matcher = DrugMatcher(core)
+    search = DrugSearchService(DatabaseCore(db_path))
+    kb = KBFuzzyMatchService(core)
+
+    assert matcher.index is search.index is kb.index
+    assert search._load_vector_cache() is matcher.index.drugs()
+    assert kb.drug_names == ["paracetamol 500mg"]
+
+
+def test_index_file_is_written_then_memory_mapped(db_path):
+    built = DrugIndexService(DatabaseCore(db_path)).drugs()
+    assert built.index_path and os.path.isdir(built.index_path)
+
+    loaded = DrugIndexService(DatabaseCore(db_path)).drugs()
+    assert loaded.index_path == built.index_path
+    assert isinstance(loaded.bm25_index.docs, np.memmap)
+    assert (loaded.tfidf_matrix != built.tfidf_matrix).nnz == 0
+
+    query = ["paracetamol 500mg"]
+    assert (loaded.vectorizer.transform(query) != built.vectorizer.transform(query)).nnz == 0
+    tokens = query[0].split()
+    assert np.array_equal(loaded.bm25_index.get_scores(tokens), built.bm25_index.get_scores(tokens))
+
+
+def test_index_file_is_keyed_on_table_contents(db_path):
+    core = DatabaseCore(db_path)
+    first = DrugIndexService(core).drugs().index_path
+
+    conn = core.get_connection()
+    conn.cursor().execute("UPDATE drugs SET search_text = 'amoxicillin 250mg' WHERE so_dang_ky = 'VD-22222-22'")
+    conn.commit()
+    conn.close()
+
+    second = DrugIndexService(core).drugs()
+    assert second.index_path != first
+    assert "250mg" in second.vectorizer.vocabulary_
+
+
+def test_bm25_index_matches_rank_bm25():
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    docs = [d.split() for d in [
+        "paracetamol 500mg paracetamol", "amoxicillin 500mg", "berodual 200 lieu fenoterol",
+        "paracetamol codein", "vitamin c 500mg", "500mg",
+    ]]
+    ref = rank_bm25.BM25Okapi(docs)
+    ours = BM25Index.fit(docs)
+    for query in (["paracetamol"], ["500mg", "500mg"], ["berodual", "unknown"], []):
+        assert np.array_equal(ours.get_scores(query), ref.get_scores(query))
+    multi = ["paracetamol", "500mg", "codein", "paracetamol"]
+    np.testing.assert_allclose(ours.get_scores(multi), ref.get_scores(multi), rtol=1e-12)
+
+
+def test_bm25_batch_scores_match_single_query(db_path):
+    from app.service.drug_index_service import tokenize
+
+    corpus = DrugIndexService(DatabaseCore(db_path), persist=False).drugs()
+    assert tokenize("Berodual VN-33333-33") == ["berodual", "vn-33333-33"]
+    assert corpus.bm25_index.matrix.shape == (len(corpus.bm25_index.terms), len(corpus.rows))
+
+    queries = [tokenize(q) for q in ["paracetamol 500mg", "amoxicillin, 500mg", "khong co", "ipratropium"]]
+    batch = corpus.bm25_index.get_batch_scores(queries).toarray()
+    for row, query in zip(batch, queries):
+        assert np.array_equal(row, corpus.bm25_index.get_scores(query))
+
+
+class TestIncrementalUpdates:
+    def test_saved_drug_is_matchable_without_refresh(self, db_path):
+        from app.service.drug_approval_service import DrugApprovalService
+
+        core = DatabaseCore(db_path)
+        index = get_drug_index(core)
+        v1 = index.drugs().version
+
+        res = DrugApprovalService(core).save_verified_drug({
+            "ten_thuoc": "Ceftriaxone 1g", "so_dang_ky": "VD-55555-55", "hoat_chat": "Ceftriaxone",
+        })
+        assert res["status"] == "success"
+
+        corpus = index.drugs()
+        assert corpus.version > v1
+        assert "Ceftriaxone 1g" in corpus.names
+        assert corpus.tfidf_matrix.shape[0] == len(corpus.rows)
+        scores = corpus.bm25_index.get_scores(["ceftriaxone"])
+        assert corpus.rows[int(np.argmax(scores))]["ten_thuoc"] == "Ceftriaxone 1g"
+
+    def test_deleted_drug_is_tombstoned(self, db_path):
+        from app.service.drug_repo import DrugRepository
+
+        core = DatabaseCore(db_path)
+        index = get_drug_index(core)
+        pos = index.drugs().names.index("Amoxicillin 500mg")
+        drug_id = index.drugs().ids[pos]
+
+        assert DrugRepository(core).delete_drug_by_id(drug_id)
+
+        corpus = index.drugs()
+        assert "Amoxicillin 500mg" not in corpus.names
+        assert drug_id not in corpus.positions
+        assert len(corpus) == 2
+        assert corpus.tfidf_matrix[pos].nnz == 0
+        assert corpus.bm25_index.get_scores(["amoxicillin"])[pos] == 0.0
+
+    def test_other_worker_picks_up_changes_from_feed(self, db_path):
+        from app.service.drug_repo import DrugRepository
+
+        core = DatabaseCore(db_path)
+        worker = DrugIndexService(DatabaseCore(db_path), poll_interval=0)  # separate process' index
+        assert len(worker.drugs()) == 3
+
+        assert DrugRepository(core).delete_drug("VN-33333-33")
+        assert "Berodual 200 lieu" not in worker.drugs().names
+
+    def test_delta_bm25_matches_full_rebuild(self, db_path):
+        from app.service.drug_approval_service import DrugApprovalService
+        from app.service.drug_repo import DrugRepository
+
+        core = DatabaseCore(db_path)
+        index = get_drug_index(core)
+        index.drugs()
+        DrugApprovalService(core).save_verified_drug({"ten_thuoc": "Paracetamol 650mg", "so_dang_ky": "VD-66666-66"})
+        DrugRepository(core).delete_drug("VD-22222-22")
+
+        delta = index.drugs()
+        full = DrugIndexService(core, persist=False).drugs()
+        query = ["paracetamol", "500mg"]
+        delta_scores = dict(zip(delta.ids, delta.bm25_index.get_scores(query)))
+        full_scores = dict(zip(full.ids, full.bm25_index.get_scores(query)))
+        for drug_id, score in full_scores.items():
+            assert delta_scores[drug_id] == pytest.approx(score)
+
+    def test_compaction_folds_delta_into_full_build(self, db_path):
+        from app.service.drug_approval_service import DrugApprovalService
+
+        core = DatabaseCore(db_path)
+        index = get_drug_index(core)
+        index.drugs()
+        DrugApprovalService(core).save_verified_drug({"ten_thuoc": "Ceftriaxone 1g", "so_dang_ky": "VD-55555-55"})
+        assert index.drugs().delta_size == 1
+
+        compacted = index.compact()
+        assert compacted.delta_size == 0
+        assert compacted.live is None
+        assert "ceftriaxone" in compacted.vectorizer.vocabulary_
+
+
+class TestExactIndex:
+    def test_matcher_level1_hits_name_normalized_and_sdk(self, db_path):
+        from app.mapping_drugs.matcher import DrugMatcher
+
+        matcher = DrugMatcher(DatabaseCore(db_path))
+        res = matcher.match("Paracetamol 500mg")
+        assert (res["method"], res["data"]["so_dang_ky"]) == ("EXACT_MATCH", "VD-11111-11")
+        res = matcher.match("Paracetamol (0500mg)")
+        assert (res["method"], res["data"]["ten_thuoc"]) == ("EXACT_MATCH (normalized)", "Paracetamol 500mg")
+        res = matcher.match(" vn-33333-33 ")
+        assert (res["method"], res["data"]["ten_thuoc"]) == ("EXACT_MATCH (sdk)", "Berodual 200 lieu")
+        assert matcher.match("Unverified Drug")["method"] != "EXACT_MATCH"
+
+    def test_registration_number_in_line_short_circuits(self, db_path):
+        from app.core.utils import extract_sdks
+        from app.mapping_drugs.matcher import DrugMatcher
+
+        assert extract_sdks("Combivent SĐK: vn – 33333-33, VD-11111-11") == ["VN-33333-33", "VD-11111-11"]
+        assert extract_sdks("Vitamin B-12 500mg") == []
+
+        matcher = DrugMatcher(DatabaseCore(db_path))
+        res = matcher.match("Thuốc xịt Berodual (SĐK VN-33333-33)")
+        assert (res["method"], res["data"]["ten_thuoc"]) == ("EXACT_MATCH (sdk)", "Berodual 200 lieu")
+        batch = matcher.match_batch(["Paracetamol 500mg VD-22222-22"])
+        assert (batch[0]["method"], batch[0]["data"]["ten_thuoc"]) == ("EXACT_MATCH (sdk)", "Amoxicillin 500mg")
+
+    def test_sdk_lookups_use_db_index(self, db_path):
+        conn = DatabaseCore(db_path).get_connection()
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM drugs WHERE so_dang_ky = ?", ("VD-11111-11",)).fetchall()
+        conn.close()
+        assert "idx_drugs_so_dang_ky" in " ".join(row["detail"] for row in plan)
+
+    def test_exact_index_follows_deltas(self, db_path):
+        from app.mapping_drugs.normalizer import normalize_for_matching
+        from app.service.drug_approval_service import DrugApprovalService
+        from app.service.drug_repo import DrugRepository
+
+        core = DatabaseCore(db_path)
+        index = get_drug_index(core)
+        before = index.drugs()
+        exact = before.exact_index(normalize_for_matching)
+        assert before.exact_index(normalize_for_matching) is exact
+        assert exact.lookup_name("Ceftriaxone 1g") is None
+
+        DrugApprovalService(core).save_verified_drug({"ten_thuoc": "Ceftriaxone 1g", "so_dang_ky": "VD-55555-55"})
+        DrugRepository(core).delete_drug("VD-22222-22")
+
+        corpus = index.drugs()
+        exact = corpus.exact_index(normalize_for_matching)
+        assert corpus.names[exact.lookup_norm("ceftriaxone 1g")] == "Ceftriaxone 1g"
+        assert corpus.names[exact.lookup_sdk("VD-55555-55")] == "Ceftriaxone 1g"
+        assert exact.lookup_name("Amoxicillin 500mg") is None
+        assert exact.lookup_sdk("VD-22222-22") is None
+        # Snapshot cũ không bị sửa
+        assert before.exact_index(normalize_for_matching).lookup_name("Amoxicillin 500mg") is not None
+
+
+class TestKnowledgeBaseTable:
+    KB_ROWS = [
+        # drug_name_norm, disease_icd, treatment_type, tdv_feedback, frequency, last_updated
+        ("amoxicillin 500mg", "j01", "ai", None, 9, "2024-01-03"),
+        ("amoxicillin 500mg", "j01", "tdv", "main drug", 1, "2024-01-01"),
+        ("amoxicillin 500mg", "j01", "tdv-old", "secondary", 1, "2023-01-01"),
+        ("amoxicillin 500mg", "j02", "ai", "null", 5, "2024-01-01"),
+        ("amoxicillin 500mg", "j02", "ai-new", "", 5, "2024-02-01"),
+    ]
+
+    def _add_rows(self, db_path):
+        conn = DatabaseCore(db_path).get_connection()
+        cursor = conn.cursor()
+        for row in self.KB_ROWS:
+            cursor.execute(
+                "INSERT INTO knowledge_base (drug_name_norm, disease_icd, treatment_type, tdv_feedback, frequency, last_updated)"
+                " VALUES (?, ?, ?, ?, ?, ?)", row,
+            )
+        conn.commit()
+        conn.close()
+
+    def test_best_rows_follow_sql_ranking(self, db_path):
+        from app.service.drug_index_service import KB_RANK_ORDER
+
+        self._add_rows(db_path)
+        core = DatabaseCore(db_path)
+        kb = get_drug_index(core).kb_names()
+        conn = core.get_connection()
+        cursor = conn.cursor()
+        for norm, icd in [("amoxicillin 500mg", "j01"), ("amoxicillin 500mg", "j02"), ("paracetamol 500mg", "r51")]:
+            cursor.execute(
+                f"SELECT drug_name_norm, treatment_type, tdv_feedback, frequency FROM knowledge_base"
+                f" WHERE drug_name_norm = ? AND disease_icd = ? ORDER BY {KB_RANK_ORDER} LIMIT 1", (norm, icd),
+            )
+            assert kb.best_row(norm, icd) == cursor.fetchone()
+        conn.close()
+        assert kb.best_row("amoxicillin 500mg")["treatment_type"] == "tdv"
+        assert kb.best_row("amoxicillin 500mg", "x99") is None
+
+    def test_consult_lookup_uses_table_and_follows_writes(self, db_path):
+        from app.service.disease_service import DiseaseService
+        from app.service.kb_fuzzy_match_service import KBFuzzyMatchService
+
+        self._add_rows(db_path)
+        core = DatabaseCore(db_path)
+        matcher = KBFuzzyMatchService(core)
+        hit = matcher.find_best_match_with_icd("Amoxicillin 500mg", "j01")
+        assert (hit["treatment_type"], hit["match_method"]) == ("tdv", "exact")
+        generic = matcher.find_best_match_with_icd("Amoxicillin 500mg", "k29")
+        assert (generic["disease_icd"], generic["match_method"]) == ("GENERIC", "exact (Generic)")
+
+        conn = core.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM knowledge_base WHERE treatment_type = 'tdv'")
+        row_id = cursor.fetchone()["id"]
+        conn.close()
+        assert DiseaseService(core).delete_disease_by_id(row_id)
+        assert matcher.find_best_match_with_icd("Amoxicillin 500mg", "j01")["treatment_type"] == "tdv-old"
+
+    def test_batch_consultation_matches_per_pair_lookups(self, db_path):
+        import asyncio
+
+        from app.models import ConsultRequest, DiagnosisItem, DrugItem
+        from app.service.consultation_service import ConsultationService
+
+        self._add_rows(db_path)
+        service = ConsultationService(DatabaseCore(db_path))
+        names = ["Amoxicillin 500mg", "amoxicilin 500 mg", "Paracetamol", "Khong co thuoc", "Amoxicillin 500mg"]
+        batch = service.kb_matcher.find_best_matches(names)
+        assert set(batch) == set(names)
+        assert all(batch[name] == service.kb_matcher.find_best_match(name) for name in names)
+
+        request = ConsultRequest(
+            request_id="batch-01",
+            items=[DrugItem(id=f"d{i}", name=name) for i, name in enumerate(names)],
+            diagnoses=[DiagnosisItem(code="J02 ", name="Viêm họng", type="MAIN"),
+                       DiagnosisItem(code="j01", name="Viêm xoang", type="SECONDARY")],
+        )
+        results = asyncio.run(service.process_integrated_consultation(request))
+        assert [r["id"] for r in results] == [f"d{i}" for i in range(len(names))]
+        assert results[0]["explanation"].endswith("(Match: exact)") and results[0]["role"] == "ai-new"
+        assert results[3]["source"] == "INTERNAL_KB_EMPTY"
+        assert results[4] == {**results[0], "id": "d4"}
+
+    def test_other_worker_picks_up_kb_changes(self, db_path):
+        worker = DrugIndexService(DatabaseCore(db_path), poll_interval=0)
+        assert worker.kb_names().best_row("amoxicillin 500mg") is None
+        self._add_rows(db_path)
+        assert worker.kb_names().best_row("amoxicillin 500mg", "j02")["treatment_type"] == "ai-new"
+
+
+def test_match_batch_matches_sequential(db_path):
+    from app.mapping_drugs.matcher import DrugMatcher
+    from app.service.drug_repo import DrugRepository
+
+    core = DatabaseCore(db_path)
+    matcher = DrugMatcher(core)
+    DrugRepository(core).delete_drug("VD-22222-22")  # tombstoned row (name None) in the snapshot
+
+    names = [
+        "Paracetamol 500mg", "paracetamol (0500mg)", "vn-33333-33", "Paracetamol 500", "Berodal 200 lieu",
+        "500mg paracetamol", "fenoterol ipratropium", "Amoxicillin 500mg", "", "  ", "khong co thuoc nay",
+    ]
+    matcher.BATCH_CHUNK = 4  # several cdist / sparse product chunks
+    batch = matcher.match_batch(names)
+    assert batch == [matcher.match(name) for name in names]
+    assert {r["method"].split(" (")[0] for r in batch} >= {"EXACT_MATCH", "FUZZY_MATCH", "EMPTY_INPUT", "NO_MATCH"}
+
+
+def test_search_drug_smart_many_matches_sync_cascade(db_path):
+    from app.service.drug_search_service import DrugSearchService
+
+    search = DrugSearchService(DatabaseCore(db_path))
+    names = [
+        "Paracetamol 500mg", "PARACETAMOL 500MG", "Berodual 200 lieu 10ml", "Berodaul 200 lieu",
+        "paracetamol 500 mg vien", "Unverified Drug", "Khong co thuoc", " Paracetamol 500mg",
+    ]
+    sequential = [search._search_drug_smart_uncached(name) for name in names]
+    batched = search.search_drug_smart_many(names)  # cache trống -> đi đường batch
+
+    assert batched == sequential
+    sources = [r and r["source"] for r in batched]
+    assert sources[:3] == ["Database (Exact)", "Database (Partial)", "Database (Partial Fallback)"]
+    assert sources[3].startswith("Database (Fuzzy") and sources[4].startswith("Database (Vector")
+    assert sources[5:] == [None, None, "Database (Exact)"]
+    assert search.search_drug_smart_many(names) == [search.search_drug_smart_sync(name) for name in names]
+
+    with_note = search.search_drug_smart_many(["Paracetamol 500mg"], ["note"])[0]
+    assert with_note["details"] == {"id": with_note["data"]["id"], "note": None}
+    assert "details" not in search.search_drug_smart_sync("Paracetamol 500mg")  # cache không bị sửa
+
+
+def test_match_rows_come_from_memory_with_lazy_details(db_path):
+    from app.mapping_drugs.matcher import DrugMatcher
+    from app.service.drug_index_service import PROJECTED_FIELDS
+
+    core = DatabaseCore(db_path)
+    conn = core.get_connection()
+    conn.execute("UPDATE drugs SET chi_dinh = 'Giam dau', note = 'ghi chu' WHERE so_dang_ky = 'VD-11111-11'")
+    conn.commit()
+    conn.close()
+    matcher = DrugMatcher(core)
+    matcher.index.refresh_drugs()
+
+    statements = []
+    real_get_connection = core.get_connection
+
+    def tracing_connection():
+        conn = real_get_connection()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    core.get_connection = tracing_connection
+    for name in ["Paracetamol 500mg", "Paracetamol 500mgg", "berodual fenoterol ipratropium"]:
+        data = matcher.match(name)["data"]
+        assert tuple(data) == PROJECTED_FIELDS
+    assert statements  # level 2 vẫn chạy SQL
+    assert not [sql for sql in statements if "FROM drugs WHERE id" in sql]
+
+    data = matcher.match("Paracetamol 500mg")["data"]
+    assert (data["chi_dinh"], data["is_verified"]) == ("Giam dau", 1)
+    assert "note" not in data
+    assert matcher.drug_details(data["id"], ["note"]) == {"id": data["id"], "note": "ghi chu"}
+
+
+def test_match_results_are_cached_per_index_version(db_path):
+    from app.mapping_drugs.matcher import DrugMatcher
+    from app.service.drug_approval_service import DrugApprovalService
+
+    core = DatabaseCore(db_path)
+    matcher = DrugMatcher(core)
+    first = matcher.match("Ceftriaxone 1g")
+    assert first["status"] == "NOT_FOUND"
+    assert matcher.match("Ceftriaxone 1g") == first
+    assert matcher.match_batch(["Paracetamol 500mg", "Ceftriaxone 1g"])[1] == first
+    stats = matcher.result_cache.stats()
+    assert stats["negative_hits"] == 2 and stats["size"] == 2
+
+    # Thuốc mới -> index đổi version -> cache bị xoá, tên được match lại
+    DrugApprovalService(core).save_verified_drug({
+        "ten_thuoc": "Ceftriaxone 1g", "so_dang_ky": "VD-55555-55", "hoat_chat": "Ceftriaxone",
+    })
+    assert matcher.match("Ceftriaxone 1g")["method"] == "EXACT_MATCH"
+    assert matcher.index.stats()["result_caches"]["drug_matcher"]["invalidations"] == 1
+
+
+def test_candidates_returns_top_k_with_level_scores(db_path):
+    from app.mapping_drugs.matcher import DrugMatcher
+
+    matcher = DrugMatcher(DatabaseCore(db_path))
+    cands = matcher.candidates("Paracetamol 500mg", k=2)
+    assert len(cands) == 2
+    top = cands[0]
+    assert (top["data"]["ten_thuoc"], top["method"], top["confidence"]) == ("Paracetamol 500mg", "EXACT_MATCH", 1.0)
+    assert {"exact", "partial", "fuzzy", "vector", "bm25"} <= set(top["scores"])
+    assert cands[1]["confidence"] < top["confidence"]
+    # Cùng thuốc với match() ở vị trí đầu
+    assert matcher.candidates("paracetamol (0500mg)", k=3)[0]["data"] == matcher.match("paracetamol (0500mg)")["data"]
+    assert matcher.candidates("   ", k=3) == []
+    assert all(c["data"]["is_verified"] == 1 for c in matcher.candidates("drug", k=5))
@@ -0,0 +1,67 @@
+"""
+Unit Tests for FuzzyBlocker: blocked RapidFuzz must return exactly what a full scan returns.
+"""
+import random
+
+import pytest
+from rapidfuzz import fuzz, process
+
+from app.service.fuzzy_blocking import FuzzyBlocker, extract, extract_one
+
+STEMS = ["paracetamol", "amoxicillin", "ibuprofen", "omeprazol", "cefuroxim",
+         "metformin", "losartan", "vitamin c", "panadol extra", "efferalgan"]
+FORMS = ["", "500mg", "250 mg", "10mg/5ml", "vien nen", "sui", "fort", "2%"]
+
+
+def _perturb(rng, text):
+    chars = list(text)
+    for _ in range(rng.randint(0, 3)):
+        op = rng.choice("dis")
+        pos = rng.randrange(len(chars) + 1)
+        if op == "d" and pos < len(chars):
+            del chars[pos]
+        elif op == "i":
+            chars.insert(pos, rng.choice("abcdemn 0"))
+        elif pos < len(chars):
+            chars[pos] = rng.choice("aeiou")
+    return "".join(chars)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(7)
+    names = [f"{rng.choice(STEMS)} {rng.choice(FORMS)} {rng.choice(FORMS)}".strip() for _ in range(600)]
+    names += [_perturb(rng, n) for n in names[:300]]
+    names[5] = None  # dòng đã xoá
+    queries = [_perturb(rng, rng.choice(names[10:])) for _ in range(150)]
+    queries += ["para", "x", "vitamin", "500mg paracetamol", "zzzz qqqq"]
+    return names, queries
+
+
+@pytest.mark.parametrize("cutoff", [85, 70, 60])
+def test_extract_one_equals_full_scan(corpus, cutoff):
+    names, queries = corpus
+    blocker = FuzzyBlocker(names)
+    for query in queries:
+        expected = process.extractOne(query, names, scorer=fuzz.token_sort_ratio, score_cutoff=cutoff)
+        assert extract_one(query, names, blocker, cutoff) == expected, query
+
+
+def test_extract_top_k_equals_full_scan(corpus):
+    names, queries = corpus
+    blocker = FuzzyBlocker(names)
+    for query in queries:
+        expected = process.extract(query, names, scorer=fuzz.token_sort_ratio, limit=5, score_cutoff=60)
+        assert extract(query, names, blocker, 60, 5) == expected, query
+
+
+def test_blocker_prunes_and_keeps_added_names(corpus):
+    names, _ = corpus
+    blocker = FuzzyBlocker(names)
+    assert len(blocker.candidates("paracetamol 500mg", 85)) < len(names) // 2
+
+    added = names + ["Paracetamol Moi 500mg"]
+    grown = blocker.with_added(["Paracetamol Moi 500mg"])
+    assert len(names) in grown.candidates("zzzz", 85)
+    assert extract_one("Paracetamol Moi 500mg", added, grown, 85) == ("Paracetamol Moi 500mg", 100.0, len(names))
+    assert len(names) not in blocker.candidates("zzzz", 85)  # blocker cũ không đổi
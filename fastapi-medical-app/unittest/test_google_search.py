@@ -0,0 +1,116 @@
+"""
+Unit Tests for GoogleSearchService (app/service/crawler/google_search.py) - offline,
+backend search được thay bằng StubSearchBackend.
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from app.database.core import DatabaseCore
+from app.database.pool import close_all_pools
+from app.service.crawler.google_search import GoogleSearchService, StubSearchBackend
+from app.service.scrape_cache_service import SearchUrlCacheService
+
+HAPACOL_URL = "https://www.thuocbietduoc.com.vn/thuoc-48012/hapacol-250.aspx"
+
+
+@pytest.fixture
+def url_cache(tmp_path):
+    yield SearchUrlCacheService(DatabaseCore(str(tmp_path / "search_url_cache_test.db")))
+    close_all_pools()
+
+
+@pytest.mark.asyncio
+async def test_lookups_run_off_the_event_loop_and_are_bounded(url_cache):
+    state = {"running": 0, "peak": 0}
+    lock = threading.Lock()
+    stub = StubSearchBackend({f"thuoc {i}": [f"https://www.thuocbietduoc.com.vn/thuoc-{i}/x.aspx"] for i in range(6)})
+
+    def slow_backend(query, num_results):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.05)  # blocking như googlesearch thật
+        with lock:
+            state["running"] -= 1
+        return stub(query, num_results)
+
+    service = GoogleSearchService(backend=slow_backend, url_cache=url_cache, max_in_flight=2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while state["peak"] == 0 or state["running"]:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    urls, _ = await asyncio.gather(
+        asyncio.gather(*(service.find_drug_url_async(f"Thuoc {i}") for i in range(6))),
+        ticker(),
+    )
+    assert urls == [f"https://www.thuocbietduoc.com.vn/thuoc-{i}/x.aspx" for i in range(6)]
+    assert state["peak"] == 2
+    assert ticks > 5  # event loop vẫn chạy trong lúc search
+
+
+@pytest.mark.asyncio
+async def test_cache_reads_and_writes_stay_off_the_event_loop(url_cache):
+    loop_thread = threading.get_ident()
+    threads = []
+
+    class TracingCache:
+        def get(self, *args):
+            threads.append(threading.get_ident())
+            return url_cache.get(*args)
+
+        def put(self, *args):
+            threads.append(threading.get_ident())
+            return url_cache.put(*args)
+
+    service = GoogleSearchService(backend=StubSearchBackend({"hapacol 250": [HAPACOL_URL]}), url_cache=TracingCache())
+    assert await service.find_drug_url_async("Hapacol 250") == HAPACOL_URL
+    assert await service.find_drug_url_async("Hapacol 250") == HAPACOL_URL  # cache hit
+    assert len(threads) == 3 and loop_thread not in threads
+
+
+@pytest.mark.asyncio
+async def test_results_and_misses_are_cached_but_errors_are_not(url_cache, tmp_path):
+    stub_file = tmp_path / "stub.json"
+    stub_file.write_text(json.dumps({
+        "Hapacol 250": ["https://www.thuocbietduoc.com.vn/thuoc/drgsearch.aspx?key=hapacol", HAPACOL_URL],
+    }), encoding="utf-8")
+    stub = StubSearchBackend(path=str(stub_file))
+    service = GoogleSearchService(backend=stub, url_cache=url_cache)
+
+    assert await service.find_drug_url_async("Hapacol 250") == HAPACOL_URL  # trang search bị lọc
+    assert await service.find_drug_url_async("hapacol 250") == HAPACOL_URL
+    assert await service.find_drug_url_async("Khong ton tai") is None
+    assert service.find_drug_url("Khong ton tai") is None
+    assert stub.queries == ["site:thuocbietduoc.com.vn Hapacol 250", "site:thuocbietduoc.com.vn Khong ton tai"]
+    assert url_cache.stats() == {"entries": 2, "not_found": 1, "expired": 0}
+
+    def failing(query, num_results):
+        raise RuntimeError("429 Too Many Requests")
+
+    broken = GoogleSearchService(backend=failing, url_cache=url_cache)
+    assert await broken.find_drug_url_async("Panadol") is None
+    assert url_cache.get("thuocbietduoc.com.vn", "Panadol") is None
+
+    assert url_cache.invalidate("HAPACOL 250") == 1
+    assert url_cache.get("thuocbietduoc.com.vn", "Hapacol 250") is None
+
+
+def test_negative_entries_expire_sooner(tmp_path):
+    cache = SearchUrlCacheService(DatabaseCore(str(tmp_path / "ttl.db")), ttl_seconds=3600, negative_ttl_seconds=0.1)
+    try:
+        cache.put("thuocbietduoc.com.vn", "Hapacol 250", HAPACOL_URL)
+        cache.put("thuocbietduoc.com.vn", "Khong ton tai", None)
+        time.sleep(0.2)
+        assert cache.get("thuocbietduoc.com.vn", "Khong ton tai") is None
+        assert cache.get("thuocbietduoc.com.vn", "Hapacol 250") == {"url": HAPACOL_URL}
+        assert cache.get("trungtamthuoc.com", "Hapacol 250") is None  # cache theo domain
+    finally:
+        close_all_pools()
@@ -0,0 +1,143 @@
+"""
+Unit Tests for the HTTP fast tier (app/service/crawler/http_fetch.py) - offline,
+HTML mẫu trong unittest/fixtures/html được phục vụ qua httpx.MockTransport.
+"""
+import os
+
+import httpx
+import pytest
+
+pytest.importorskip("lxml.cssselect")
+
+from app.service.crawler import core_drug, http_fetch
+from app.service.crawler.config import get_drug_web_config
+from app.service.crawler.extractors import extract_drug_details_html
+from app.service.crawler.http_fetch import HttpFetcher
+from app.service.crawler.utils import logger
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+BASE = "https://www.thuocbietduoc.com.vn"
+PAGES = {
+    "/thuoc/drgsearch.aspx": "thuocbietduoc_search.html",
+    "/thuoc-48012/hapacol-250.aspx": "thuocbietduoc_detail.html",
+    "/thuoc-51234/hapacol-250-flu.aspx": "thuocbietduoc_detail_js.html",
+}
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture
+def tbd_config():
+    return next(site for site in get_drug_web_config() if site["site_name"] == "ThuocBietDuoc")
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """Fetcher offline + ghi lại URL đã GET và các lần escalate sang browser."""
+    state = {"get": [], "browser": []}
+
+    def handler(request):
+        state["get"].append(str(request.url))
+        name = PAGES.get(request.url.path)
+        if name is None:
+            return httpx.Response(404, text="not found")
+        return httpx.Response(200, text=fixture(name), headers={"content-type": "text/html; charset=utf-8"})
+
+    async def fake_browser(browser, site_config, keyword, direct_url=None):
+        state["browser"].append(direct_url)
+        return [{"Source": site_config["site_name"], "Link": direct_url, "Content": "", "_extracted_data": {}}]
+
+    monkeypatch.setattr(http_fetch, "http_fetcher", HttpFetcher(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(core_drug, "scrape_single_site_drug_browser", fake_browser)
+    return state
+
+
+def test_static_extractor_reuses_config_selectors(tbd_config):
+    content, fields = extract_drug_details_html(fixture("thuocbietduoc_detail.html"), tbd_config, "ThuocBietDuoc", logger)
+
+    assert fields["ten_thuoc"] == "Hapacol 250"
+    assert fields["so_dang_ky"] == "VD-20570-14"
+    assert fields["hoat_chat"] == "Paracetamol 250mg"
+    assert fields["dang_bao_che"] == "Thuốc bột sủi bọt"
+    assert fields["nhom_thuoc"] == "Thuốc giảm đau, hạ sốt"
+    assert fields["chi_dinh"] == "Hạ sốt, giảm đau cho trẻ em.\nCảm cúm\nMọc răng"
+    assert fields["chong_chi_dinh"] == "Quá mẫn với paracetamol."
+    assert "Hapacol 250\nSố đăng ký\nVD-20570-14\n" in content  # block -> xuống dòng như inner_text
+    assert "dataLayer" not in content  # script bị bỏ
+
+
+@pytest.mark.asyncio
+async def test_search_parses_static_pages_and_escalates_incomplete_ones(tbd_config, served):
+    results = await core_drug.scrape_single_site_drug(None, tbd_config, "hapacol 250")
+
+    assert served["get"][0] == f"{BASE}/thuoc/drgsearch.aspx?key=hapacol+250"
+    assert len(served["get"]) == 3  # search + 2 trang chi tiết (link trùng bị bỏ)
+    assert [r["Link"] for r in results] == [
+        f"{BASE}/thuoc-48012/hapacol-250.aspx",
+        f"{BASE}/thuoc-51234/hapacol-250-flu.aspx",
+    ]
+    assert results[0]["_extracted_data"]["so_dang_ky"] == "VD-20570-14"
+    # Trang render bằng JS (không có SĐK/hoạt chất) -> chỉ trang đó mở browser
+    assert served["browser"] == [f"{BASE}/thuoc-51234/hapacol-250-flu.aspx"]
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_browser_when_fast_tier_does_not_apply(tbd_config, served):
+    # Không lấy được trang search (404) -> toàn bộ đường Playwright
+    tbd_config["fast_tier"]["search_url"] = BASE + "/khong-ton-tai?key={keyword}"
+    await core_drug.scrape_single_site_drug(None, tbd_config, "hapacol 250")
+    assert served["browser"] == [None]
+
+    # Site không cấu hình fast_tier -> không có request HTTP nào
+    served["get"].clear()
+    trung_tam_thuoc = next(site for site in get_drug_web_config() if site["site_name"] == "TrungTamThuoc")
+    await core_drug.scrape_single_site_drug(None, trung_tam_thuoc, "hapacol 250")
+    assert served["get"] == [] and served["browser"] == [None, None]
+
+
+class NavigationPage:
+    """Page giả: ghi lại thứ tự submit / chờ navigation / chờ network idle."""
+
+    def __init__(self, navigates):
+        self.navigates = navigates
+        self.events = []
+
+    def expect_navigation(self, **kwargs):
+        page = self
+
+        class Waiter:
+            async def __aenter__(self):
+                page.events.append("expect_navigation")
+
+            async def __aexit__(self, *exc):
+                if exc[0] is not None:
+                    return False
+                if not page.navigates:
+                    raise TimeoutError("Timeout 10000ms exceeded")
+                page.events.append("navigated")
+                return False
+
+        return Waiter()
+
+    async def wait_for_load_state(self, state, timeout=None):
+        self.events.append(state)
+
+
+@pytest.mark.asyncio
+async def test_browser_search_waits_for_result_page_before_reading_list():
+    page = NavigationPage(navigates=True)
+
+    async def submit():
+        page.events.append("submit")
+
+    await core_drug.submit_search(page, submit, "NhaThuocLongChau")
+    assert page.events == ["expect_navigation", "submit", "navigated"]
+
+    # Search bằng JS, URL không đổi -> chờ network idle thay vì đọc ngay trang cũ
+    page = NavigationPage(navigates=False)
+    await core_drug.submit_search(page, submit, "NhaThuocLongChau")
+    assert page.events == ["expect_navigation", "submit", "networkidle"]
+
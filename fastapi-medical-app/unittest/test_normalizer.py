@@ -0,0 +1,59 @@
+"""
+Unit Tests for the shared text normalizer (app/core/normalizer.py).
+"""
+import random
+import re
+import unicodedata
+
+import pytest
+
+from app.core import utils as core_utils
+from app.core.normalizer import cache_info, normalize_for_matching, normalize_many
+from app.mapping_drugs import normalizer as matcher_normalizer
+
+
+def _reference(text):
+    """Quy tắc gốc (NFKD + re.sub), dùng làm chuẩn so sánh."""
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c)).replace('đ', 'd')
+    text = re.sub(r'[^a-z0-9\s\-\+\%\.]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return re.sub(r'\b0+(\d+)(ml|mg|mcg|g|iu|ui|l|%)?\b',
+                  lambda m: (m.group(1).lstrip('0') or '0') + (m.group(2) or ''), text, flags=re.IGNORECASE)
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Paracetamol (0500mg)", "paracetamol 500mg"),
+    ("Kẽm Gluconat 10MG/5ml", "kem gluconat 10mg 5ml"),
+    ("ĐƯỜNG  uống\xa0[ống 05ml]", "duong uong ong 5ml"),
+    ("Vitamin B1+B6; 0,5g", "vitamin b1+b6 0 5g"),
+    ("", ""),
+    (None, ""),
+])
+def test_normalize_for_matching(raw, expected):
+    assert normalize_for_matching(raw) == expected
+
+
+def test_single_source_for_core_and_matcher():
+    assert core_utils.normalize_for_matching is normalize_for_matching
+    assert matcher_normalizer.normalize_for_matching is normalize_for_matching
+
+
+def test_matches_reference_rules_and_batch():
+    rng = random.Random(3)
+    alphabet = "aăâbcdđeêioôơuưyÀÁẢĐẮ 0123456789/()[]-+%.,;:_\t\n\xa0̣́ﬁ²½ßİ\x00"
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30))) for _ in range(3000)]
+    texts += [None, "", "  ", "005", "05mgx", "Amoxicillin 500mg", "Amoxicillin 500mg"]
+
+    expected = [_reference(t) for t in texts]
+    assert [normalize_for_matching(t) for t in texts] == expected
+    assert normalize_many(texts) == expected
+
+
+def test_repeated_calls_hit_the_cache():
+    normalize_for_matching("Cefuroxim 250mg (test cache)")
+    hits = cache_info().hits
+    normalize_for_matching("Cefuroxim 250mg (test cache)")
+    assert cache_info().hits == hits + 1
@@ -0,0 +1,63 @@
+"""
+Unit Tests for ResultCache (LRU/TTL memoization keyed on drug index version).
+"""
+from app.service.result_cache import MISS, ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_miss_and_lru_eviction():
+    cache = ResultCache(maxsize=2, ttl=60, negative_ttl=10)
+    assert cache.get("a", 1) is MISS
+    cache.put("a", 1, {"x": 1})
+    cache.put("b", 1, {"x": 2})
+    assert cache.get("a", 1) == {"x": 1}   # "a" thành mới nhất
+    cache.put("c", 1, {"x": 3})             # đẩy "b" ra
+    assert cache.get("b", 1) is MISS
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (1, 2, 1, 2)
+
+
+def test_negative_results_expire_sooner():
+    clock = FakeClock()
+    cache = ResultCache(maxsize=10, ttl=60, negative_ttl=5, clock=clock)
+    cache.put("found", 1, {"status": "FOUND"})
+    cache.put("missing", 1, None, negative=True)
+    assert cache.get("missing", 1) is None
+    clock.now = 6
+    assert cache.get("missing", 1) is MISS
+    assert cache.get("found", 1) == {"status": "FOUND"}
+    clock.now = 61
+    assert cache.get("found", 1) is MISS
+    stats = cache.stats()
+    assert (stats["negative_hits"], stats["expired"]) == (1, 2)
+
+
+def test_version_change_invalidates_and_drops_stale_puts():
+    cache = ResultCache(maxsize=10, ttl=60, negative_ttl=5)
+    cache.put("a", 1, "v1")
+    assert cache.get("a", 2) is MISS         # index đổi version -> xoá hết
+    cache.put("b", 1, "computed on v1")      # kết quả tính trên snapshot cũ bị bỏ
+    assert cache.get("b", 2) is MISS
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_values_are_copied():
+    cache = ResultCache(maxsize=10, ttl=60, negative_ttl=5)
+    value = {"data": {"ten_thuoc": "Paracetamol"}}
+    cache.put("a", 1, value)
+    value["data"]["ten_thuoc"] = "changed"
+    cache.get("a", 1)["data"]["ten_thuoc"] = "changed again"
+    assert cache.get("a", 1) == {"data": {"ten_thuoc": "Paracetamol"}}
+
+
+def test_disabled_cache_never_stores():
+    cache = ResultCache(maxsize=0)
+    cache.put("a", 1, "x")
+    assert cache.get("a", 1) is MISS
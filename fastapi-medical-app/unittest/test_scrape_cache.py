@@ -0,0 +1,131 @@
+"""
+Unit Tests for the web-scrape result cache (app/service/scrape_cache_service.py).
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.database.core import DatabaseCore
+from app.database.pool import close_all_pools
+from app.service import drug_identification_service
+from app.service.drug_identification_service import DrugIdentificationService
+from app.service.drug_search_service import DrugSearchService
+from app.service.scrape_cache_service import ScrapeCacheService, scrape_cache_key
+
+FOUND = {"ten_thuoc": "Hapacol 250", "so_dang_ky": "VD-20570-14", "source_urls": ["https://thuocbietduoc.com.vn/x"]}
+NOT_FOUND = {"status": "not_found", "message": "No drugs found on web or search engines."}
+
+
+@pytest.fixture
+def core(tmp_path):
+    yield DatabaseCore(str(tmp_path / "scrape_cache_test.db"))
+    close_all_pools()
+
+
+def test_hits_and_not_found_have_separate_ttls(core):
+    cache = ScrapeCacheService(core, ttl_seconds=3600, negative_ttl_seconds=0.2)
+    assert cache.get("Hapacol 250") is None
+
+    assert cache.put("Hapacol 250", FOUND, [{"ten_thuoc": "Hapacol 250", "Content": "...", "Link": "x"}])
+    assert cache.put("Thuoc khong ton tai", NOT_FOUND)
+    assert cache.get("  hapacol 250 ") == FOUND  # cùng key sau normalize
+    assert cache.get("Thuoc khong ton tai") == NOT_FOUND
+    assert cache.stats()["found"] == 1 and cache.stats()["not_found"] == 1
+
+    time.sleep(0.3)
+    assert cache.get("Thuoc khong ton tai") is None
+    assert cache.get("Hapacol 250") == FOUND
+    assert cache.invalidate(expired_only=True) == 1
+    assert cache.invalidate("HAPACOL 250") == 1
+    assert cache.get("Hapacol 250") is None
+
+
+def test_candidates_are_stored_without_page_content(core):
+    cache = ScrapeCacheService(core)
+    cache.put("Hapacol 250", FOUND, [{"ten_thuoc": "Hapacol 250", "Content": "full page", "_extracted_data": {}, "Link": "x"}])
+    conn = core.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM web_scrape_cache WHERE keyword_norm = ?", (scrape_cache_key("Hapacol 250"),))
+    row = cursor.fetchone()
+    conn.close()
+    assert row["status"] == "found"
+    assert row["candidates"] == '[{"ten_thuoc": "Hapacol 250", "Link": "x"}]'
+    assert row["source_urls"] == '["https://thuocbietduoc.com.vn/x"]'
+
+
+@pytest.mark.asyncio
+async def test_identification_consults_cache_before_browser(core, monkeypatch):
+    calls = []
+
+    async def fake_scrape(keyword, **kwargs):
+        calls.append(keyword)
+        kwargs["candidates_out"].append({"ten_thuoc": keyword, "Content": "page"})
+        return NOT_FOUND if "khong" in keyword.lower() else dict(FOUND, ten_thuoc=keyword)
+
+    monkeypatch.setattr(drug_identification_service, "scrape_drug_web", fake_scrape)
+    service = DrugIdentificationService(DrugSearchService(core), deadline_seconds=0)
+
+    first = await service.process_batch(["Hapacol 250", "Thuoc khong co"])
+    second = await service.process_batch(["Hapacol 250", "Thuoc khong co"])
+    assert len(calls) == 2
+    assert first == second
+
+
+@pytest.mark.asyncio
+async def test_not_found_after_site_timeout_is_not_cached(core, monkeypatch):
+    from contextlib import asynccontextmanager
+
+    from app.service.crawler import main as crawler_main
+
+    scrapes = []
+
+    async def hanging_site(browser, site, keyword, direct_url=None):
+        scrapes.append(keyword)
+        await asyncio.sleep(5)
+        return []
+
+    class NoDirectUrl:
+        async def find_drug_url_async(self, keyword):
+            return None
+
+    @asynccontextmanager
+    async def no_browser(**kwargs):
+        yield None
+
+    async def no_links(browser, keyword, **kwargs):
+        return {"success": False, "links": []}
+
+    monkeypatch.setattr(crawler_main, "SITE_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(crawler_main, "get_drug_web_config", lambda: [{"site_name": "ThuocBietDuoc"}])
+    monkeypatch.setattr(crawler_main, "scrape_single_site_drug", hanging_site)
+    monkeypatch.setattr(crawler_main, "get_google_search_service", lambda domain: NoDirectUrl())
+    monkeypatch.setattr(crawler_main.browser_pool, "browser", no_browser)
+    monkeypatch.setattr(crawler_main, "search_drug_links", no_links)
+    monkeypatch.setattr(drug_identification_service, "scrape_drug_web", crawler_main.scrape_drug_web_advanced)
+    service = DrugIdentificationService(DrugSearchService(core), deadline_seconds=0)
+
+    await service.process_batch(["Thuoc timeout"])
+    assert service.scrape_cache.get("Thuoc timeout") is None  # timeout != không có trên web
+    await service.process_batch(["Thuoc timeout"])
+    assert len(scrapes) == 2
+
+
+def test_admin_scrape_cache_routes_report_db_errors(core, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.api import admin
+    from app.main import app
+
+    monkeypatch.setattr(admin.drug_db, "db_core", core)
+    client = TestClient(app)
+    assert client.get("/api/v1/admin/scrape-cache").json()["entries"] == 0
+
+    conn = core.get_connection()
+    conn.cursor().execute("DROP TABLE web_scrape_cache")
+    conn.commit()
+    conn.close()
+    stats = client.get("/api/v1/admin/scrape-cache")
+    deleted = client.delete("/api/v1/admin/scrape-cache", params={"keyword": "Hapacol 250"})
+    assert (stats.status_code, deleted.status_code) == (500, 500)
+    assert "web_scrape_cache" in stats.json()["detail"]
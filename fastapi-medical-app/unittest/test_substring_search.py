@@ -0,0 +1,80 @@
+"""
+Unit Tests for DatabaseCore.substring_search (trigram-indexed partial match).
+"""
+import pytest
+
+from app.database.core import DatabaseCore
+from app.database.pool import close_all_pools
+
+VERIFIED = "is_verified=1 AND so_dang_ky IS NOT NULL"
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = DatabaseCore(str(tmp_path / "trgm_test.db"))
+    conn = core.get_connection()
+    cursor = conn.cursor()
+    for ten, sdk in [
+        ("Paracetamol Codein 500mg", "VD-1"),
+        ("Paracetamol", "VD-2"),
+        ("Paracetamol 500mg", "VD-3"),
+        ("Efferalgan", None),
+    ]:
+        cursor.execute(
+            "INSERT INTO drugs (ten_thuoc, so_dang_ky, is_verified) VALUES (?, ?, 1)", (ten, sdk)
+        )
+    for name in ["panadol extra", "panadol", "panadol", "ibuprofen"]:
+        cursor.execute("INSERT INTO knowledge_base (drug_name_norm) VALUES (?)", (name,))
+    conn.commit()
+    conn.close()
+    yield core
+    close_all_pools()
+
+
+def _names(core, needle, **kwargs):
+    conn = core.get_connection()
+    cursor = conn.cursor()
+    try:
+        core.substring_search(cursor, "drugs", "ten_thuoc", needle, where=VERIFIED, limit=10, **kwargs)
+        return [row["ten_thuoc"] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_trigram_index_created(core):
+    assert core.trigram_tables[("drugs", "ten_thuoc")] == "drugs_trgm"
+
+
+def test_ranked_shortest_first_case_insensitive(core):
+    assert _names(core, "paracetamol") == [
+        "Paracetamol", "Paracetamol 500mg", "Paracetamol Codein 500mg"
+    ]
+    assert _names(core, "500MG") == ["Paracetamol 500mg", "Paracetamol Codein 500mg"]
+    assert _names(core, "efferalgan") == []  # filtered by `where` (no SDK)
+
+
+def test_index_follows_inserts_updates_deletes(core):
+    conn = core.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO drugs (ten_thuoc, so_dang_ky, is_verified) VALUES ('Amoxicillin', 'VD-9', 1)")
+    cursor.execute("UPDATE drugs SET ten_thuoc = 'Paracetamol 650mg' WHERE so_dang_ky = 'VD-3'")
+    cursor.execute("DELETE FROM drugs WHERE so_dang_ky = 'VD-1'")
+    conn.commit()
+    conn.close()
+
+    assert _names(core, "amoxi") == ["Amoxicillin"]
+    assert _names(core, "paracetamol") == ["Paracetamol", "Paracetamol 650mg"]
+
+
+def test_like_fallback_without_index(core):
+    indexed = _names(core, "cetamol")
+    core.trigram_tables = {}
+    assert _names(core, "cetamol") == indexed
+
+
+def test_distinct_kb_names(core):
+    conn = core.get_connection()
+    cursor = conn.cursor()
+    core.substring_search(cursor, "knowledge_base", "drug_name_norm", "PANADOL", distinct=True, limit=10)
+    assert [row["drug_name_norm"] for row in cursor.fetchall()] == ["panadol", "panadol extra"]
+    conn.close()